@@ -0,0 +1,248 @@
+import argparse
+import collections
+import concurrent.futures
+import os
+import sys
+import time
+
+from chess_cli import board_class
+from epd import load_epd
+
+"""
+Batch analysis of many positions on all cores. Positions (FEN or EPD lines) are searched by a
+ProcessPoolExecutor whose workers each keep one board and one Searcher, with its transposition
+table, alive for their whole life, so a task only carries a line of text in and a small result out.
+
+    python batch.py puzzles.epd --depth 6 --workers 8
+    python batch.py puzzles.epd --movetime 0.5 --unordered --scaling
+
+Positions are read lazily and at most `max_pending` tasks are in flight, so a file of millions of
+lines streams through in constant memory.
+"""
+
+#warm per-process state, set by _init_worker.
+_board = None
+_searcher = None
+
+
+class AnalysisResult(object):
+    def __init__(self, index, position, best_move, score, depth, pv, nodes, elapsed, error=None):
+        """ Search result of one position, plain data so it pickles cheaply.
+            - index: position number in the input stream, from 0
+            - position: the FEN or EPD line as given
+            - best_move, pv: coordinate notation, None and [] when there is no legal move
+            - error: message when the position couldn't be loaded, the other fields are then empty
+        """
+        self.index = index
+        self.position = position
+        self.best_move = best_move
+        self.score = score
+        self.depth = depth
+        self.pv = pv
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.error = error
+
+    def __str__(self):
+        if self.error is not None:
+            return "%d error %s" % (self.index, self.error)
+        return "%d bestmove %s score %s depth %s nodes %d pv %s" % (
+            self.index, self.best_move or "(none)", self.score, self.depth, self.nodes, " ".join(self.pv))
+
+
+class BatchStats(object):
+    def __init__(self, workers):
+        """ Progress of a batch, passed to the progress callback after every finished task.
+            - submitted, done: positions sent to and received from the workers
+            - nodes: nodes searched by all workers together
+        """
+        self.workers = workers
+        self.submitted = 0
+        self.done = 0
+        self.errors = 0
+        self.nodes = 0
+        self.start_time = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    @property
+    def positions_per_second(self):
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def nps(self):
+        elapsed = self.elapsed
+        return self.nodes / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return ("%d/%d positions %.1fs %.1f positions/s %.0f nps on %d workers" %
+                (self.done, self.submitted, self.elapsed, self.positions_per_second, self.nps, self.workers))
+
+
+"""
+Sets a board up from a FEN, with or without move clocks, or from an EPD record.
+"""
+def load_record(cb, text):
+    fields = text.split()
+    if 4 <= len(fields) <= 6 and all(f.isdigit() for f in fields[4:]):
+        cb.set_fen(text)
+    else:
+        load_epd(cb, text)
+
+def _init_worker(backend, hash_mb):
+    global _board, _searcher
+    from search import Searcher
+    _board = board_class(backend)()
+    _searcher = Searcher(hash_mb=hash_mb)
+
+"""
+Worker side: searches a chunk of (index, position) pairs and returns their AnalysisResults.
+"""
+def _analyse_chunk(chunk, limits):
+    results = []
+    for index, text in chunk:
+        start = time.perf_counter()
+        try:
+            load_record(_board, text)
+        except ValueError as e:
+            results.append(AnalysisResult(index, text, None, None, None, [], 0, 0.0, str(e)))
+            continue
+        result = _searcher.search(_board, **limits)
+        elapsed = time.perf_counter() - start
+        if result is None:
+            results.append(AnalysisResult(index, text, None, None, None, [], _searcher.stats.nodes, elapsed))
+        else:
+            results.append(AnalysisResult(index, text,
+                                          result.best_move.coordinate_notation() if result.best_move else None,
+                                          result.score, result.depth, [m.coordinate_notation() for m in result.pv],
+                                          result.stats.nodes, elapsed))
+    return results
+
+def _chunks(positions, chunksize):
+    chunk = []
+    for index, text in enumerate(positions):
+        chunk.append((index, text))
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+"""
+Searches every position of an iterable of FEN/EPD strings on a process pool and yields an
+AnalysisResult per position.
+- depth, movetime, nodes: search limits of each position, see search.Searcher.search
+- workers: processes, by default one per core
+- ordered: yield results in input order; when False they come as soon as they finish
+- max_pending: tasks in flight before reading more input, by default four per worker
+- chunksize: positions per task, more amortizes the inter-process traffic of very short searches
+- progress: called with the BatchStats after every finished task
+"""
+def analyse(positions, depth=None, movetime=None, nodes=None, workers=None, ordered=True,
+            max_pending=None, chunksize=1, backend='bitboard', hash_mb=16, progress=None):
+    workers = workers or os.cpu_count() or 1
+    max_pending = max(max_pending or 4*workers, 1)
+    limits = {'depth': depth, 'movetime': movetime, 'nodes': nodes}
+    stats = BatchStats(workers)
+    chunks = _chunks(positions, max(chunksize, 1))
+    pool = concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(backend, hash_mb))
+    #futures in submission order; with ordered=False only membership matters.
+    pending = collections.deque()
+    try:
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                pending.append(pool.submit(_analyse_chunk, chunk, limits))
+                stats.submitted += len(chunk)
+            if not pending:
+                break
+            if ordered:
+                future = pending.popleft()
+            else:
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                future = done.pop()
+                pending.remove(future)
+            for result in future.result():
+                stats.done += 1
+                stats.nodes += result.nodes
+                if result.error is not None:
+                    stats.errors += 1
+                yield result
+            if progress is not None:
+                progress(stats)
+    finally:
+        #also reached when the caller stops iterating early.
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def _read_positions(path):
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and line[0] != '#':
+                yield line
+
+"""
+Runs the whole file with 1, 2, 4, ... up to `workers` processes and prints the speedup over one.
+"""
+def scaling(path, workers, **options):
+    counts = []
+    n = 1
+    while n < workers:
+        counts.append(n)
+        n *= 2
+    counts.append(workers)
+    base = None
+    for n in counts:
+        start = time.perf_counter()
+        done = sum(1 for _ in analyse(_read_positions(path), workers=n, ordered=False, **options))
+        elapsed = time.perf_counter() - start
+        base = base or elapsed
+        print("%3d workers  %6d positions  %8.2fs  speedup %5.2f  efficiency %3.0f%%" %
+              (n, done, elapsed, base / elapsed, 100 * base / elapsed / n))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search a file of FEN/EPD positions on all cores.")
+    parser.add_argument('path', help="file with one FEN or EPD position per line")
+    parser.add_argument('--depth', type=int)
+    parser.add_argument('--movetime', type=float, help="seconds per position")
+    parser.add_argument('--nodes', type=int)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--unordered', action='store_true', help="print results as soon as they finish")
+    parser.add_argument('--chunksize', type=int, default=1, help="positions per task")
+    parser.add_argument('--hash', type=int, default=16, help="transposition table size in MB per worker")
+    parser.add_argument('--backend', choices=['list', 'bitboard'], default='bitboard')
+    parser.add_argument('--scaling', action='store_true', help="measure the speedup from 1 to --workers processes")
+    args = parser.parse_args(argv)
+
+    options = {'depth': args.depth, 'movetime': args.movetime, 'nodes': args.nodes, 'chunksize': args.chunksize,
+               'backend': args.backend, 'hash_mb': args.hash}
+    if args.scaling:
+        scaling(args.path, args.workers, **options)
+        return 0
+
+    last_report = [time.perf_counter()]
+    final = []
+    def progress(stats):
+        now = time.perf_counter()
+        if not final:
+            final.append(stats)
+        if now - last_report[0] >= 1.0:
+            last_report[0] = now
+            print("progress %s" % stats, file=sys.stderr)
+
+    for result in analyse(_read_positions(args.path), workers=args.workers, ordered=not args.unordered,
+                          progress=progress, **options):
+        print(result)
+    if final:
+        print("done %s" % final[0], file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,458 @@
+from array import array
+
+from chess_board import (ChessBoard, Move, PIECE_INDEX, PROMOTION_PIECES, PROMOTION_SHIFT, FLAG_PROMOTION,
+                         FLAG_EN_PASSANT, FLAG_CASTLE, MOVED_SHIFT, CAPTURED_SHIFT, SEE_VALUES)
+
+"""
+Bitboard move generation backend.
+
+Squares are numbered like the list board, square = row*8 + col, so a8 is bit 0 and h1 is bit 63.
+Every piece type and colour is kept as one 64-bit integer set, and the 8x8 `board` list is still
+maintained by ChessBoard.make_move/undo_move so the UI and Move objects keep working unchanged.
+"""
+
+FULL = (1 << 64) - 1
+
+def _bit(row, col):
+    return 1 << (row*8 + col)
+
+def _on_board(row, col):
+    return 0 <= row <= 7 and 0 <= col <= 7
+
+"""
+Leaper attack tables: KNIGHT_ATTACKS[sq], KING_ATTACKS[sq] and PAWN_ATTACKS[colour][sq],
+where the pawn table holds the squares a pawn of that colour on sq attacks.
+"""
+def _leaper_table(offsets):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        bb = 0
+        for dr, dc in offsets:
+            if _on_board(row + dr, col + dc):
+                bb |= _bit(row + dr, col + dc)
+        table.append(bb)
+    return table
+
+KNIGHT_ATTACKS = _leaper_table([(1, -2), (2, -1), (2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2)])
+KING_ATTACKS = _leaper_table([(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)])
+PAWN_ATTACKS = {'w': _leaper_table([(-1, -1), (-1, 1)]), 'b': _leaper_table([(1, -1), (1, 1)])}
+
+"""
+Sliding attacks use one lookup table per square and line (rank, file, diagonal, anti-diagonal).
+A line holds at most six inner squares, so each table is indexed by the occupancy of that line
+with at most 64 entries, and a rook or bishop needs two lookups instead of a walk along each ray.
+"""
+RANK, FILE, DIAGONAL, ANTI_DIAGONAL = range(4)
+LINE_DIRECTIONS = [((0, -1), (0, 1)), ((-1, 0), (1, 0)), ((-1, -1), (1, 1)), ((-1, 1), (1, -1))]
+
+def _ray(sq, direction, occupied):
+    row, col = divmod(sq, 8)
+    bb = 0
+    while True:
+        row += direction[0]
+        col += direction[1]
+        if not _on_board(row, col):
+            return bb
+        bb |= _bit(row, col)
+        if occupied & _bit(row, col):
+            return bb
+
+def _edge(sq, direction):
+    row, col = divmod(sq, 8)
+    if not _on_board(row + direction[0], col + direction[1]):
+        return 0
+    while _on_board(row + direction[0], col + direction[1]):
+        row += direction[0]
+        col += direction[1]
+    return _bit(row, col)
+
+def _line_tables():
+    masks = [[0]*64 for _ in range(4)]
+    attacks = [[None]*64 for _ in range(4)]
+    for line, directions in enumerate(LINE_DIRECTIONS):
+        for sq in range(64):
+            #the last square of a ray is attacked whether or not it is occupied, so leave it out.
+            mask = 0
+            for d in directions:
+                mask |= _ray(sq, d, 0) & ~_edge(sq, d)
+            table = {}
+            subset = 0
+            while True:
+                table[subset] = _ray(sq, directions[0], subset) | _ray(sq, directions[1], subset)
+                subset = (subset - mask) & mask
+                if subset == 0:
+                    break
+            masks[line][sq] = mask
+            attacks[line][sq] = table
+    return masks, attacks
+
+LINE_MASKS, LINE_ATTACKS = _line_tables()
+RANK_MASKS, FILE_MASKS, DIAGONAL_MASKS, ANTI_DIAGONAL_MASKS = LINE_MASKS
+RANK_ATTACKS, FILE_ATTACKS, DIAGONAL_ATTACKS, ANTI_DIAGONAL_ATTACKS = LINE_ATTACKS
+
+def rook_attacks(sq, occupied):
+    return RANK_ATTACKS[sq][occupied & RANK_MASKS[sq]] | FILE_ATTACKS[sq][occupied & FILE_MASKS[sq]]
+
+def bishop_attacks(sq, occupied):
+    return (DIAGONAL_ATTACKS[sq][occupied & DIAGONAL_MASKS[sq]] |
+            ANTI_DIAGONAL_ATTACKS[sq][occupied & ANTI_DIAGONAL_MASKS[sq]])
+
+"""
+BETWEEN[a][b] holds the squares strictly between two aligned squares, LINE[a][b] the whole
+rank, file or diagonal through both. Both are 0 when the squares are not aligned.
+"""
+def _between_tables():
+    between = [[0]*64 for _ in range(64)]
+    line = [[0]*64 for _ in range(64)]
+    for a in range(64):
+        for directions in LINE_DIRECTIONS:
+            full = _bit(*divmod(a, 8)) | _ray(a, directions[0], 0) | _ray(a, directions[1], 0)
+            for d in directions:
+                ray = _ray(a, d, 0)
+                while ray:
+                    lsb = ray & -ray
+                    b = lsb.bit_length() - 1
+                    ray ^= lsb
+                    between[a][b] = _ray(a, d, 1 << b) & ~(1 << b)
+                    line[a][b] = full
+    return between, line
+
+BETWEEN, LINE = _between_tables()
+
+"""
+Iterates over the square numbers of the set bits of bb.
+"""
+def squares(bb):
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+#(row, col) of every square number.
+COORDS = [divmod(sq, 8) for sq in range(64)]
+
+#capturers tried in static exchange evaluation, cheapest first.
+SEE_ORDER = ['p', 'N', 'B', 'R', 'Q', 'K']
+
+PIECES = ['wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK']
+
+#packed move fields for every piece string, see chess_board.Move.pack.
+MOVED = dict((piece, PIECE_INDEX[piece] << MOVED_SHIFT) for piece in PIECES)
+CAPTURED = dict((piece, PIECE_INDEX[piece] << CAPTURED_SHIFT) for piece in PIECE_INDEX)
+PROMOTION_CODES = [FLAG_PROMOTION | i << PROMOTION_SHIFT for i in range(len(PROMOTION_PIECES))]
+
+#more than the most legal moves any position has (218).
+MAX_MOVES = 256
+
+"""
+Returns a preallocated buffer for generate_moves.
+"""
+def new_move_buffer():
+    return array('I', bytes(4*MAX_MOVES))
+
+
+class BitboardChessBoard(ChessBoard):
+    def __init__(self):
+        """ ChessBoard with bitboard move generation, see the module docstring.
+            - pieces: piece string ('wp', 'bK', ...) to the set of squares it occupies
+            - colours: 'w'/'b' to the set of squares occupied by that side
+        """
+        super(BitboardChessBoard, self).__init__()
+        self.load_bitboards()
+
+    def init_generators(self):
+        super(BitboardChessBoard, self).init_generators()
+        self.move_buffer = new_move_buffer()
+
+    """
+    Rebuilds all bitboards from the 8x8 list, for use after the list was set up directly.
+    """
+    def load_bitboards(self):
+        self.pieces = dict((piece, 0) for piece in PIECES)
+        self.colours = {'w': 0, 'b': 0}
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    self.pieces[piece] |= _bit(r, c)
+                    self.colours[piece[0]] |= _bit(r, c)
+
+    def set_position(self, placement, turn, castling, en_passant, halfmove=0, fullmove=1):
+        super(BitboardChessBoard, self).set_position(placement, turn, castling, en_passant, halfmove, fullmove)
+        self.load_bitboards()
+
+    def restore(self, snapshot):
+        super(BitboardChessBoard, self).restore(snapshot)
+        self.load_bitboards()
+
+    def piece_squares(self, piece):
+        return [COORDS[sq] for sq in squares(self.pieces[piece])]
+
+    """
+    Squares make_move/undo_move may change for a move; castling moves touch the whole back rank.
+    """
+    def touched_squares(self, move):
+        if move.is_castle:
+            return [(move.startrow, c) for c in range(8)]
+        touched = [(move.startrow, move.startcol), (move.endrow, move.endcol)]
+        if move.is_en_passant:
+            touched.append((move.startrow, move.endcol))
+        return touched
+
+    def sync_squares(self, touched, before):
+        for (r, c), old in zip(touched, before):
+            new = self.board[r][c]
+            if new != old:
+                bit = _bit(r, c)
+                if old != "--":
+                    self.pieces[old] ^= bit
+                    self.colours[old[0]] ^= bit
+                if new != "--":
+                    self.pieces[new] ^= bit
+                    self.colours[new[0]] ^= bit
+
+    def make_move(self, move):
+        touched = self.touched_squares(move)
+        before = [self.board[r][c] for (r, c) in touched]
+        super(BitboardChessBoard, self).make_move(move)
+        self.sync_squares(touched, before)
+
+    def undo_move(self):
+        if len(self.moveLog) > 0:
+            touched = self.touched_squares(self.moveLog[-1])
+            before = [self.board[r][c] for (r, c) in touched]
+            super(BitboardChessBoard, self).undo_move()
+            self.sync_squares(touched, before)
+
+    """
+    Returns the set of `colour` pieces attacking sq with the given occupancy.
+    """
+    def attackers(self, sq, colour, occupied):
+        pieces = self.pieces
+        enemy = 'b' if colour == 'w' else 'w'
+        queens = pieces[colour + 'Q']
+        return ((PAWN_ATTACKS[enemy][sq] & pieces[colour + 'p']) |
+                (KNIGHT_ATTACKS[sq] & pieces[colour + 'N']) |
+                (KING_ATTACKS[sq] & pieces[colour + 'K']) |
+                (rook_attacks(sq, occupied) & (pieces[colour + 'R'] | queens)) |
+                (bishop_attacks(sq, occupied) & (pieces[colour + 'B'] | queens)))
+
+    def is_check(self):
+        ally = 'w' if self.turn else 'b'
+        enemy = 'b' if self.turn else 'w'
+        ksq = self.pieces[ally + 'K'].bit_length() - 1
+        self.in_check = self.attackers(ksq, enemy, self.colours['w'] | self.colours['b']) != 0
+        return self.in_check
+
+    """
+    This function generates all legal moves as Move objects, see generate_moves. Castling also
+    gets the king-to-rook-square targets, matching ChessBoard.get_castling_moves, so the UI can
+    accept a click on either square.
+    """
+    def get_valid_moves(self):
+        buf = self.move_buffer
+        moves = []
+        for i in range(self.generate_moves(buf)):
+            code = buf[i]
+            moves.append(Move.from_packed(code))
+            if code & FLAG_CASTLE:
+                if code >> 6 & 7 == 6:
+                    moves.append(Move.from_packed(code + (1 << 6)))
+                else:
+                    moves.append(Move.from_packed(code - (1 << 6)))
+                    moves.append(Move.from_packed(code - (2 << 6)))
+        return moves
+
+    """
+    Legal captures, en-passant captures and promotions as Move objects, see ChessBoard.get_captures.
+    """
+    def get_captures(self):
+        buf = self.move_buffer
+        return [Move.from_packed(buf[i]) for i in range(self.generate_moves(buf, captures_only=True))]
+
+    """
+    ChessBoard.see on the bitboards: capturers are taken off the occupancy, which uncovers the
+    sliders behind them.
+    """
+    def see(self, move):
+        to = move.endrow*8 + move.endcol
+        pieces = self.pieces
+        occupied = (self.colours['w'] | self.colours['b']) ^ _bit(move.startrow, move.startcol)
+        if move.is_en_passant:
+            occupied ^= _bit(move.startrow, move.endcol)
+            gains = [SEE_VALUES['p']]
+        else:
+            gains = [SEE_VALUES.get(move.piece_captured[1], 0)]
+        attacker = move.piece_moved[1]
+        colour = 'b' if move.piece_moved[0] == 'w' else 'w'
+        while True:
+            attackers = self.attackers(to, colour, occupied) & occupied
+            if not attackers:
+                break
+            gains.append(SEE_VALUES[attacker] - gains[-1])
+            for attacker in SEE_ORDER:
+                found = attackers & pieces[colour + attacker]
+                if found:
+                    break
+            occupied ^= found & -found
+            colour = 'b' if colour == 'w' else 'w'
+        while len(gains) > 1:
+            last = gains.pop()
+            gains[-1] = -max(-gains[-1], last)
+        return gains[0]
+
+    """
+    This function writes all legal moves in the packed int format into buf starting at index n and
+    returns the new number of moves in buf. With captures_only only captures, en-passant captures
+    and promotions are written. Checkers and pinned pieces are found once from the king
+    square, and every target set is masked instead of tested square by square. No Move objects are
+    created; callers turn only the moves they actually play into objects with Move.from_packed.
+    """
+    def generate_moves(self, buf, n=0, captures_only=False):
+        board = self.board
+        pieces = self.pieces
+        ally = 'w' if self.turn else 'b'
+        enemy = 'b' if self.turn else 'w'
+        us = self.colours[ally]
+        them = self.colours[enemy]
+        occupied = us | them
+        king_bit = pieces[ally + 'K']
+        ksq = king_bit.bit_length() - 1
+
+        checkers = self.attackers(ksq, enemy, occupied)
+        self.in_check = checkers != 0
+
+        #king moves, with the king lifted off the board so it can't hide behind itself on a checking ray.
+        without_king = occupied ^ king_bit
+        base = ksq | MOVED[ally + 'K']
+        for to in squares(KING_ATTACKS[ksq] & (them if captures_only else ~us)):
+            if not self.attackers(to, enemy, without_king):
+                buf[n] = base | to << 6 | CAPTURED[board[to >> 3][to & 7]]
+                n += 1
+        if checkers & (checkers - 1):
+            #double check, only the king can move.
+            return n
+
+        #pieces pinned to the king may only move along the line to their pinner.
+        pinned = 0
+        enemy_queens = pieces[enemy + 'Q']
+        snipers = ((rook_attacks(ksq, 0) & (pieces[enemy + 'R'] | enemy_queens)) |
+                   (bishop_attacks(ksq, 0) & (pieces[enemy + 'B'] | enemy_queens)))
+        for sq in squares(snipers):
+            blockers = BETWEEN[ksq][sq] & occupied
+            if blockers and not blockers & (blockers - 1) and blockers & us:
+                pinned |= blockers
+
+        if checkers:
+            checker = checkers.bit_length() - 1
+            targets = checkers | BETWEEN[ksq][checker]
+        else:
+            targets = FULL
+            if not captures_only:
+                n = self.generate_castling_moves(ksq, ally, enemy, occupied, buf, n)
+
+        line = LINE[ksq]
+        captures = them & targets
+        quiets = 0 if captures_only else ~occupied & targets
+        for piece in ('N', 'B', 'R', 'Q'):
+            moved = MOVED[ally + piece]
+            for sq in squares(pieces[ally + piece]):
+                if piece == 'N':
+                    if pinned & (1 << sq):
+                        continue
+                    reach = KNIGHT_ATTACKS[sq]
+                elif piece == 'B':
+                    reach = bishop_attacks(sq, occupied)
+                elif piece == 'R':
+                    reach = rook_attacks(sq, occupied)
+                else:
+                    reach = rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+                if pinned & (1 << sq):
+                    reach &= line[sq]
+                base = sq | moved
+                for to in squares(reach & captures):
+                    buf[n] = base | to << 6 | CAPTURED[board[to >> 3][to & 7]]
+                    n += 1
+                for to in squares(reach & quiets):
+                    buf[n] = base | to << 6
+                    n += 1
+        return self.generate_pawn_moves(ksq, ally, enemy, occupied, pinned, targets, checkers, buf, n, captures_only)
+
+    def generate_pawn_moves(self, ksq, ally, enemy, occupied, pinned, targets, checkers, buf, n, captures_only=False):
+        board = self.board
+        them = self.colours[enemy]
+        line = LINE[ksq]
+        step = -8 if ally == 'w' else 8
+        start_row = 6 if ally == 'w' else 1
+        attacks = PAWN_ATTACKS[ally]
+        moved = MOVED[ally + 'p']
+        ep_bit = _bit(*self.en_passant) if self.en_passant else 0
+        for sq in squares(self.pieces[ally + 'p']):
+            allowed = targets
+            if pinned & (1 << sq):
+                allowed &= line[sq]
+            base = sq | moved
+            promoting = (sq >> 3) + (step >> 3) in (0, 7)
+            one = sq + step
+            codes = []
+            if not occupied & (1 << one) and (promoting or not captures_only):
+                if allowed & (1 << one):
+                    codes.append(base | one << 6)
+                two = one + step
+                if sq >> 3 == start_row and not occupied & (1 << two) and allowed & (1 << two):
+                    codes.append(base | two << 6)
+            for to in squares(attacks[sq] & them & allowed):
+                codes.append(base | to << 6 | CAPTURED[board[to >> 3][to & 7]])
+            for code in codes:
+                if promoting:
+                    for promotion in PROMOTION_CODES:
+                        buf[n] = code | promotion
+                        n += 1
+                else:
+                    buf[n] = code
+                    n += 1
+            if attacks[sq] & ep_bit:
+                n = self.generate_en_passant(sq, ksq, enemy, occupied, checkers, buf, n)
+        return n
+
+    """
+    En-passant moves two pawns at once, so its legality is checked by replaying it on the occupancy:
+    it must not leave the king attacked by a slider, and when in check it must remove the checker.
+    """
+    def generate_en_passant(self, sq, ksq, enemy, occupied, checkers, buf, n):
+        to = self.en_passant[0]*8 + self.en_passant[1]
+        captured = (sq >> 3)*8 + (to & 7)
+        if checkers and checkers != 1 << captured and not BETWEEN[ksq][checkers.bit_length() - 1] & (1 << to):
+            return n
+        after = (occupied ^ (1 << sq) ^ (1 << captured)) | (1 << to)
+        pieces = self.pieces
+        enemy_queens = pieces[enemy + 'Q']
+        if rook_attacks(ksq, after) & (pieces[enemy + 'R'] | enemy_queens):
+            return n
+        if bishop_attacks(ksq, after) & (pieces[enemy + 'B'] | enemy_queens):
+            return n
+        ally = 'b' if enemy == 'w' else 'w'
+        buf[n] = sq | to << 6 | FLAG_EN_PASSANT | MOVED[ally + 'p'] | CAPTURED[enemy + 'p']
+        return n + 1
+
+    """
+    Castling squares between king and rook must be empty and the squares the king crosses safe.
+    """
+    def generate_castling_moves(self, ksq, ally, enemy, occupied, buf, n):
+        rights = self.current_castling_rights
+        row = ksq >> 3
+        if ally == 'w':
+            king_side, queen_side = rights.wks, rights.wqs
+        else:
+            king_side, queen_side = rights.bks, rights.bqs
+        base = ksq | FLAG_CASTLE | MOVED[ally + 'K']
+        if king_side and not occupied & (_bit(row, 5) | _bit(row, 6)):
+            if not self.attackers(row*8 + 5, enemy, occupied) and not self.attackers(row*8 + 6, enemy, occupied):
+                buf[n] = base | (row*8 + 6) << 6
+                n += 1
+        if queen_side and not occupied & (_bit(row, 1) | _bit(row, 2) | _bit(row, 3)):
+            if not self.attackers(row*8 + 3, enemy, occupied) and not self.attackers(row*8 + 2, enemy, occupied):
+                buf[n] = base | (row*8 + 2) << 6
+                n += 1
+        return n
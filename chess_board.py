@@ -1,3 +1,34 @@
+from zobrist import PIECE_KEYS, SIDE_KEY, EN_PASSANT_KEYS, CASTLING_KEYS, castling_index
+from evaluation import MG_TABLES, EG_TABLES, PHASE, material_scores
+
+KNIGHT_OFFSETS = [(1, -2), (2, -1), (2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2)]
+KING_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+SLIDER_DIRECTIONS = {'B': [(-1, -1), (-1, 1), (1, -1), (1, 1)],
+                     'R': [(0, -1), (0, 1), (-1, 0), (1, 0)],
+                     'Q': [(-1, -1), (-1, 1), (1, -1), (1, 1), (0, -1), (0, 1), (-1, 0), (1, 0)]}
+#piece values for static exchange evaluation, the king can only capture last.
+SEE_VALUES = {'p': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 20000}
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+#FEN piece letters to board strings and back.
+FEN_PIECES = {'P': 'wp', 'N': 'wN', 'B': 'wB', 'R': 'wR', 'Q': 'wQ', 'K': 'wK',
+              'p': 'bp', 'n': 'bN', 'b': 'bB', 'r': 'bR', 'q': 'bQ', 'k': 'bK'}
+PIECE_LETTERS = dict((piece, letter) for letter, piece in FEN_PIECES.items())
+#parsed FEN ranks, the same few rank strings ('8', 'pppppppp', ...) make up most positions.
+_fen_ranks = {}
+FEN_RANK_CACHE = 8192
+#plies without a capture or pawn move after which the game is drawn, the fifty-move rule.
+FIFTY_MOVE_PLIES = 100
+#occurrences of a position that draw the game.
+REPETITION_DRAW = 3
+#reasons game_result gives for the end of a game.
+CHECKMATE = 'checkmate'
+STALEMATE = 'stalemate'
+REPETITION = 'threefold repetition'
+FIFTY_MOVES = 'fifty-move rule'
+INSUFFICIENT_MATERIAL = 'insufficient material'
+#board rows of snapshot ranks, the same way.
+_snapshot_rows = {}
 
 class ChessBoard(object):
     def __init__(self):
@@ -24,26 +55,303 @@ class ChessBoard(object):
         self.turn = True 
         self.moveLog = [] 
         self.movepair = []
-        self.moveFunctions = {'p': self.get_pawn_moves, 'B': self.get_bishop_moves,
-                              'R': self.get_rook_moves, 'K': self.get_king_moves,
-                              'Q': self.get_queen_moves, 'N': self.get_knight_moves}
+        self.init_generators()
         self.in_check = False
         self.pins = []
         self.checks = []
+        #(row, col) of pinned pieces to their pin direction.
+        self.pin_map = {}
+        #checks, pins and attacked squares of every position since the start, None until computed.
+        self.attack_log = [None]
         #both king's location on the board.
         self.black_king = (0,4)
         self.white_king = (7,4)
         #a tuple that holds the position of row and col where a pawn perform en-passant.
         self.en_passant = ()
+        #en-passant square before every move, so undo can restore it.
+        self.ep_log = [self.en_passant]
         #castling rights at current gamestate
         self.current_castling_rights = CastlingRights(True, True, True, True)
         self.castle_log = [CastlingRights(self.current_castling_rights.wks, self.current_castling_rights.wqs,
                                           self.current_castling_rights.bks, self.current_castling_rights.bqs)]
+        #64-bit Zobrist key of the position, updated by make_move/undo_move, and its history.
+        self.key = self.compute_key()
+        self.key_log = [self.key]
+        #how often every key of key_log occurs, so repetitions are a dict lookup.
+        self.key_counts = {self.key: 1}
+        #Zobrist key of the pawns alone, for the pawn structure cache, and its history.
+        self.pawn_key = self.compute_pawn_key()
+        self.pawn_key_log = [self.pawn_key]
+        #halfmove clock (plies since the last capture or pawn move) and fullmove number as in FEN.
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.clock_log = [self.halfmove_clock]
+        #material and piece-square sums (white's point of view) and game phase, see evaluation.py.
+        self.mg, self.eg, self.phase = material_scores(self.board)
+        self.score_log = [(self.mg, self.eg, self.phase)]
+
+    """
+    Returns a new board set up from a FEN string; the move clocks may be left out, as in EPD.
+    """
+    @classmethod
+    def from_fen(cls, fen):
+        cb = cls()
+        cb.set_fen(fen)
+        return cb
+
+    def set_fen(self, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError("invalid FEN: %s" % fen)
+        try:
+            halfmove = int(fields[4]) if len(fields) > 4 else 0
+            fullmove = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError("invalid FEN move clocks: %s" % fen)
+        self.set_position(fields[0], fields[1], fields[2], fields[3], halfmove, fullmove)
+
+    """
+    Sets up the position from the four FEN position fields and the move clocks, replacing the
+    whole game state. Raises ValueError on a malformed position.
+    """
+    def set_position(self, placement, turn, castling, en_passant, halfmove=0, fullmove=1):
+        board = []
+        for rank in placement.split('/'):
+            row = _fen_ranks.get(rank)
+            if row is None:
+                row = []
+                for c in rank:
+                    if c in FEN_PIECES:
+                        row.append(FEN_PIECES[c])
+                    elif '1' <= c <= '8':
+                        row.extend(["--"]*int(c))
+                    else:
+                        raise ValueError("invalid FEN piece placement: %s" % placement)
+                if len(row) != 8:
+                    raise ValueError("invalid FEN piece placement: %s" % placement)
+                if len(_fen_ranks) >= FEN_RANK_CACHE:
+                    _fen_ranks.clear()
+                _fen_ranks[rank] = row
+            board.append(row[:])
+        if len(board) != 8:
+            raise ValueError("invalid FEN piece placement: %s" % placement)
+        if turn not in ('w', 'b'):
+            raise ValueError("invalid FEN side to move: %s" % turn)
+        white_king = black_king = None
+        for r in range(8):
+            if 'wK' in board[r]:
+                white_king = (r, board[r].index('wK'))
+            if 'bK' in board[r]:
+                black_king = (r, board[r].index('bK'))
+        if white_king is None or black_king is None:
+            raise ValueError("invalid FEN, both kings are needed: %s" % placement)
+
+        self.board = board
+        self.white_king = white_king
+        self.black_king = black_king
+        self.turn = turn == 'w'
+        #rights whose king or rook isn't on its home square are dropped.
+        self.current_castling_rights = CastlingRights(
+            'K' in castling and board[7][4] == 'wK' and board[7][7] == 'wR',
+            'Q' in castling and board[7][4] == 'wK' and board[7][0] == 'wR',
+            'k' in castling and board[0][4] == 'bK' and board[0][7] == 'bR',
+            'q' in castling and board[0][4] == 'bK' and board[0][0] == 'bR')
+        self.castle_log = [CastlingRights(self.current_castling_rights.wks, self.current_castling_rights.wqs,
+                                          self.current_castling_rights.bks, self.current_castling_rights.bqs)]
+        if en_passant == '-':
+            self.en_passant = ()
+        elif (len(en_passant) == 2 and en_passant[0] in Move.file_to_col and
+                en_passant[1] == ('6' if self.turn else '3')):
+            self.en_passant = (Move.rank_to_row[en_passant[1]], Move.file_to_col[en_passant[0]])
+        else:
+            raise ValueError("invalid FEN en-passant square: %s" % en_passant)
+        self.ep_log = [self.en_passant]
+        self.moveLog = []
+        self.movepair = []
+        self.in_check = False
+        self.pins = []
+        self.checks = []
+        self.pin_map = {}
+        self.attack_log = [None]
+        self.key = self.compute_key()
+        self.key_log = [self.key]
+        self.key_counts = {self.key: 1}
+        self.pawn_key = self.compute_pawn_key()
+        self.pawn_key_log = [self.pawn_key]
+        self.halfmove_clock = halfmove
+        self.fullmove_number = fullmove
+        self.clock_log = [halfmove]
+        self.mg, self.eg, self.phase = material_scores(self.board)
+        self.score_log = [(self.mg, self.eg, self.phase)]
+
+    """
+    Per-board move generation state, kept apart from the position so from_snapshot can skip __init__.
+    """
+    def init_generators(self):
+        self.moveFunctions = {'p': self.get_pawn_moves, 'B': self.get_bishop_moves,
+                              'R': self.get_rook_moves, 'K': self.get_king_moves,
+                              'Q': self.get_queen_moves, 'N': self.get_knight_moves}
+
+    """
+    Immutable Snapshot of the position, cheap to keep many of and to share between threads.
+    """
+    def snapshot(self):
+        index = PIECE_INDEX
+        squares = bytes([index[piece] for row in self.board for piece in row])
+        #keys since the last capture or pawn move, the positions a repetition can return to.
+        history = tuple(self.key_log[-(self.halfmove_clock + 1):])
+        return Snapshot(squares, self.turn, castling_index(self.current_castling_rights), self.en_passant,
+                        self.halfmove_clock, self.fullmove_number, self.pawn_key, (self.mg, self.eg, self.phase),
+                        history)
+
+    """
+    Sets the board to a Snapshot, replacing the whole game state like set_position, but without
+    parsing or rehashing anything. Moves made before the snapshot can't be undone.
+    """
+    def restore(self, snapshot):
+        squares = snapshot.squares
+        board = []
+        for r in range(0, 64, 8):
+            rank = squares[r:r + 8]
+            row = _snapshot_rows.get(rank)
+            if row is None:
+                if len(_snapshot_rows) >= FEN_RANK_CACHE:
+                    _snapshot_rows.clear()
+                row = _snapshot_rows[rank] = [PIECE_CODES[i] for i in rank]
+            board.append(row[:])
+        self.board = board
+        white_king = squares.index(PIECE_INDEX['wK'])
+        black_king = squares.index(PIECE_INDEX['bK'])
+        self.white_king = (white_king >> 3, white_king & 7)
+        self.black_king = (black_king >> 3, black_king & 7)
+        self.turn = snapshot.turn
+        rights = snapshot.castling
+        self.current_castling_rights = CastlingRights(bool(rights & 1), bool(rights & 2), bool(rights & 4),
+                                                      bool(rights & 8))
+        self.castle_log = [CastlingRights(self.current_castling_rights.wks, self.current_castling_rights.wqs,
+                                          self.current_castling_rights.bks, self.current_castling_rights.bqs)]
+        self.en_passant = snapshot.en_passant
+        self.ep_log = [self.en_passant]
+        self.moveLog = []
+        self.movepair = []
+        self.in_check = False
+        self.pins = []
+        self.checks = []
+        self.pin_map = {}
+        self.attack_log = [None]
+        self.key = snapshot.key
+        self.key_log = list(snapshot.history)
+        self.key_counts = {}
+        for key in self.key_log:
+            self.key_counts[key] = self.key_counts.get(key, 0) + 1
+        self.pawn_key = snapshot.pawn_key
+        self.pawn_key_log = [self.pawn_key]
+        self.halfmove_clock = snapshot.halfmove
+        self.fullmove_number = snapshot.fullmove
+        self.clock_log = [self.halfmove_clock]
+        self.mg, self.eg, self.phase = snapshot.scores
+        self.score_log = [snapshot.scores]
+
+    """
+    A new board of the same class in this position, sharing nothing with this one.
+    """
+    def clone(self):
+        return self.from_snapshot(self.snapshot())
+
+    """
+    Returns a new board set to a Snapshot.
+    """
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        cb = cls.__new__(cls)
+        cb.init_generators()
+        cb.restore(snapshot)
+        return cb
+
+    """
+    FEN string of the current position.
+    """
+    def to_fen(self):
+        return "%s %d %d" % (self.position_fen(), self.halfmove_clock, self.fullmove_number)
+
+    """
+    The four position fields of the FEN (placement, side to move, castling, en passant), as used by EPD.
+    """
+    def position_fen(self):
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                else:
+                    if empty:
+                        rank += str(empty)
+                        empty = 0
+                    rank += PIECE_LETTERS[piece]
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        rights = self.current_castling_rights
+        castling = (("K" if rights.wks else "") + ("Q" if rights.wqs else "") +
+                    ("k" if rights.bks else "") + ("q" if rights.bqs else ""))
+        if self.en_passant:
+            ep = Move.col_to_file[self.en_passant[1]] + Move.row_to_rank[self.en_passant[0]]
+        else:
+            ep = "-"
+        return "%s %s %s %s" % ("/".join(ranks), "w" if self.turn else "b", castling or "-", ep)
+
+    """
+    This function hashes the whole position, make_move/undo_move keep self.key up to date without it.
+    """
+    def compute_key(self):
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c] != "--":
+                    key ^= PIECE_KEYS[self.board[r][c]][r*8 + c]
+        if not self.turn:
+            key ^= SIDE_KEY
+        return key ^ CASTLING_KEYS[castling_index(self.current_castling_rights)] ^ self.en_passant_key()
+
+    """
+    Hashes the pawns alone, make_move/undo_move keep self.pawn_key up to date without it.
+    """
+    def compute_pawn_key(self):
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c] == 'wp' or self.board[r][c] == 'bp':
+                    key ^= PIECE_KEYS[self.board[r][c]][r*8 + c]
+        return key
+
+    """
+    (row, col) of every square holding the given piece string.
+    """
+    def piece_squares(self, piece):
+        return [(r, c) for r in range(8) for c in range(8) if self.board[r][c] == piece]
+
+    """
+    The en-passant square only changes the key when a pawn of the side to move can capture on it,
+    otherwise positions that are the same for every purpose would hash differently.
+    """
+    def en_passant_key(self):
+        if not self.en_passant:
+            return 0
+        col = self.en_passant[1]
+        row = 3 if self.turn else 4
+        pawn = 'wp' if self.turn else 'bp'
+        if (col > 0 and self.board[row][col-1] == pawn) or (col < 7 and self.board[row][col+1] == pawn):
+            return EN_PASSANT_KEYS[col]
+        return 0
 
     """
     This function handles all the moves, except castling, en-passant and pawn promotion.
     """
     def make_move(self, move):
+        rights_before = castling_index(self.current_castling_rights)
+        ep_before = self.en_passant_key()
         self.board[move.startrow][move.startcol] = "--"
         self.board[move.endrow][move.endcol] = move.piece_moved
         self.moveLog.append(move)
@@ -68,8 +376,8 @@ class ChessBoard(object):
                 if move.endcol == 2 or move.endcol == 1 or move.endcol == 0:
                     self.board[move.endrow][0] = "--"
                     self.board[move.endrow][1] = "--"
-                    self.board[move.endrow][2] = move.piece_moved[0]+"R"
-                    self.board[move.endrow][3] = move.piece_moved[0]+"K"
+                    self.board[move.endrow][2] = move.piece_moved[0]+"K"
+                    self.board[move.endrow][3] = move.piece_moved[0]+"R"
                     self.board[move.endrow][4] = "--"
                     if move.piece_moved == 'wK':
                         self.white_king = (7, 2)
@@ -78,7 +386,7 @@ class ChessBoard(object):
 
         #if move is pawn promotion.
         if move.pawn_promotion:
-            self.board[move.endrow][move.endcol] = move.piece_moved[0]+"Q"
+            self.board[move.endrow][move.endcol] = move.piece_moved[0]+move.promotion
         
         if move.is_en_passant:
             move.piece_captured = self.board[move.startrow][move.endcol]
@@ -88,13 +396,92 @@ class ChessBoard(object):
         if move.piece_moved[1] == 'p' and abs(move.startrow - move.endrow) == 2:
             self.en_passant = ((move.startrow + move.endrow)//2, move.startcol)
         else: self.en_passant = ()
+        self.ep_log.append(self.en_passant)
 
         #update castling rights:
         self.update_castling_rights(move)
         self.castle_log.append(CastlingRights(self.current_castling_rights.wks, self.current_castling_rights.wqs,
                                           self.current_castling_rights.bks, self.current_castling_rights.bqs))
         self.turn = not self.turn
-        
+        self.update_key(move, rights_before, ep_before)
+        self.update_scores(move)
+        self.attack_log.append(None)
+        #the castling rook isn't a capture, even when the move targets its square.
+        if move.piece_moved[1] == 'p' or (move.piece_captured != "--" and not move.is_castle):
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        self.clock_log.append(self.halfmove_clock)
+        if self.turn:
+            self.fullmove_number += 1
+
+    """
+    XORs the pieces, castling rights, en-passant file and side to move a move changed into self.key.
+    """
+    def update_key(self, move, rights_before, ep_before):
+        key = self.key ^ SIDE_KEY ^ ep_before ^ self.en_passant_key()
+        key ^= CASTLING_KEYS[rights_before] ^ CASTLING_KEYS[castling_index(self.current_castling_rights)]
+        row = move.endrow
+        if move.is_castle:
+            #castling moves may target the rook square, the king and rook always land on fixed squares.
+            king, rook = PIECE_KEYS[move.piece_moved], PIECE_KEYS[move.piece_moved[0]+"R"]
+            if move.endcol >= 6:
+                key ^= king[row*8 + 4] ^ king[row*8 + 6] ^ rook[row*8 + 7] ^ rook[row*8 + 5]
+            else:
+                key ^= king[row*8 + 4] ^ king[row*8 + 2] ^ rook[row*8] ^ rook[row*8 + 3]
+        else:
+            key ^= PIECE_KEYS[move.piece_moved][move.startrow*8 + move.startcol]
+            key ^= PIECE_KEYS[self.board[row][move.endcol]][row*8 + move.endcol]
+            if move.is_en_passant:
+                key ^= PIECE_KEYS[move.piece_captured][move.startrow*8 + move.endcol]
+            elif move.piece_captured != "--":
+                key ^= PIECE_KEYS[move.piece_captured][row*8 + move.endcol]
+        self.key = key
+        self.key_log.append(key)
+        self.key_counts[key] = self.key_counts.get(key, 0) + 1
+        #the pawn key only changes when a pawn moves, promotes or is captured.
+        pawn_key = self.pawn_key
+        if move.piece_moved[1] == 'p':
+            pawn_key ^= PIECE_KEYS[move.piece_moved][move.startrow*8 + move.startcol]
+            if not move.pawn_promotion:
+                pawn_key ^= PIECE_KEYS[move.piece_moved][row*8 + move.endcol]
+        if move.piece_captured[1] == 'p':
+            captured_row = move.startrow if move.is_en_passant else row
+            pawn_key ^= PIECE_KEYS[move.piece_captured][captured_row*8 + move.endcol]
+        self.pawn_key = pawn_key
+        self.pawn_key_log.append(pawn_key)
+
+    """
+    Adds the material, piece-square and phase changes of a move to self.mg, self.eg and self.phase.
+    """
+    def update_scores(self, move):
+        mg, eg, phase = self.mg, self.eg, self.phase
+        row = move.endrow
+        if move.is_castle:
+            king, rook = move.piece_moved, move.piece_moved[0]+"R"
+            if move.endcol >= 6:
+                moves = ((king, row*8 + 4, row*8 + 6), (rook, row*8 + 7, row*8 + 5))
+            else:
+                moves = ((king, row*8 + 4, row*8 + 2), (rook, row*8, row*8 + 3))
+            for piece, start, end in moves:
+                mg += MG_TABLES[piece][end] - MG_TABLES[piece][start]
+                eg += EG_TABLES[piece][end] - EG_TABLES[piece][start]
+        else:
+            start, end = move.startrow*8 + move.startcol, row*8 + move.endcol
+            #the piece on the end square is the promoted one after a promotion.
+            landed = self.board[row][move.endcol]
+            mg += MG_TABLES[landed][end] - MG_TABLES[move.piece_moved][start]
+            eg += EG_TABLES[landed][end] - EG_TABLES[move.piece_moved][start]
+            if move.pawn_promotion:
+                phase += PHASE[landed]
+            if move.piece_captured != "--":
+                captured = move.startrow*8 + move.endcol if move.is_en_passant else end
+                mg -= MG_TABLES[move.piece_captured][captured]
+                eg -= EG_TABLES[move.piece_captured][captured]
+                phase -= PHASE[move.piece_captured]
+        self.mg, self.eg, self.phase = mg, eg, phase
+        self.score_log.append((mg, eg, phase))
+
     def update_castling_rights(self, move):
         #if white king moved.
         if move.piece_moved == 'wK':
@@ -118,6 +505,17 @@ class ChessBoard(object):
                     self.current_castling_rights.bqs = False
                 elif move.startcol == 7:
                     self.current_castling_rights.bks = False
+        #if a rook is captured on its starting square.
+        if move.piece_captured == 'wR' and move.endrow == 7:
+            if move.endcol == 0:
+                self.current_castling_rights.wqs = False
+            elif move.endcol == 7:
+                self.current_castling_rights.wks = False
+        elif move.piece_captured == 'bR' and move.endrow == 0:
+            if move.endcol == 0:
+                self.current_castling_rights.bqs = False
+            elif move.endcol == 7:
+                self.current_castling_rights.bks = False
 
     """
     This function undos the last move.
@@ -155,10 +553,9 @@ class ChessBoard(object):
                 self.board[m.endrow][m.endcol] = '--'
                 self.board[m.startrow][m.endcol] = m.piece_captured
                 self.board[m.startrow][m.startcol] = m.piece_moved
-                self.en_passant = (m.endrow, m.endcol)
-            #if piece moved is pawn and it moved 2 squares, set en-passant = ()
-            if m.piece_moved[1] == 'p' and abs(m.startrow-m.endrow) == 2:
-                self.en_passant = ()
+            #restore the en-passant square of the previous gamestate.
+            self.ep_log.pop()
+            self.en_passant = self.ep_log[-1]
             
             #if pawn is promoting.
             if m.pawn_promotion:
@@ -171,22 +568,104 @@ class ChessBoard(object):
             
             #updating king's position.
             if m.piece_moved == 'wK':
-                self.white_king = (m.endrow, m.endcol)
+                self.white_king = (m.startrow, m.startcol)
             elif m.piece_moved == 'bK':
-                self.black_king = (m.endrow, m.endcol)
+                self.black_king = (m.startrow, m.startcol)
             
             #undo castling rights log.
             if len(self.castle_log) > 0:
                 self.castle_log.pop()
-                self.current_castling_rights = self.castle_log[-1]
+                rights = self.castle_log[-1]
+                #copy, so later updates don't modify the logged rights.
+                self.current_castling_rights = CastlingRights(rights.wks, rights.wqs, rights.bks, rights.bqs)
+            key = self.key_log.pop()
+            if self.key_counts[key] > 1:
+                self.key_counts[key] -= 1
+            else:
+                del self.key_counts[key]
+            self.key = self.key_log[-1]
+            self.pawn_key_log.pop()
+            self.pawn_key = self.pawn_key_log[-1]
+            self.attack_log.pop()
+            self.clock_log.pop()
+            self.halfmove_clock = self.clock_log[-1]
+            self.score_log.pop()
+            self.mg, self.eg, self.phase = self.score_log[-1]
+            if not self.turn:
+                self.fullmove_number -= 1
 
-            
 
+
+    """
+    How often the current position occurred since the board was set up, counting itself. Keys of
+    positions before a capture or pawn move can't come back, so they may stay in the count.
+    """
+    def repetition_count(self):
+        return self.key_counts[self.key]
+
+    """
+    True when no sequence of moves can mate: kings alone, a single knight or bishop, or bishops that
+    all stand on squares of one colour. Pawns or more than two minor pieces answer without a scan.
     """
-    This function generates all valid moves in current gamestate including checks as well.
+    def insufficient_material(self):
+        if self.pawn_key or self.phase > 2:
+            return False
+        if self.phase < 2:
+            return True
+        colours = set()
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--" and piece[1] != 'K':
+                    if piece[1] != 'B':
+                        return False
+                    colours.add((r + c) % 2)
+        return len(colours) == 1
+
+    """
+    Returns (result, reason) once the game is over, None while it goes on. result is '1-0', '0-1'
+    or '1/2-1/2' as in PGN, reason one of CHECKMATE, STALEMATE, REPETITION, FIFTY_MOVES and
+    INSUFFICIENT_MATERIAL. Pass moves when the valid moves of the position are at hand already.
+    """
+    def game_result(self, moves=None):
+        #a repeated position or one without mating material can't be mate, it would have ended earlier.
+        if self.insufficient_material():
+            return '1/2-1/2', INSUFFICIENT_MATERIAL
+        if self.key_counts[self.key] >= REPETITION_DRAW:
+            return '1/2-1/2', REPETITION
+        if moves is None:
+            moves = self.get_valid_moves()
+        if not moves:
+            #moves may come from another board, in_check of this one may be stale.
+            self.load_attack_maps()
+            if self.in_check:
+                return ('0-1' if self.turn else '1-0'), CHECKMATE
+            return '1/2-1/2', STALEMATE
+        #mate on the last move of the fifty still counts.
+        if self.halfmove_clock >= FIFTY_MOVE_PLIES:
+            return '1/2-1/2', FIFTY_MOVES
+        return None
+
+    """
+    This function returns all valid moves in current gamestate including checks as well. They are
+    generated once per position and kept in attack_log, so get_captures and later calls in the same
+    position only filter them; the returned list is shared and must not be modified.
     """
     def get_valid_moves(self):
-        self.in_check, self.pins, self.checks = self.pins_and_checks()
+        self.load_attack_maps()
+        maps = self.attack_log[-1]
+        if maps[5] is None:
+            maps[5] = self.generate_valid_moves()
+        return maps[5]
+
+    """
+    True when the side to move is in check, without generating any move.
+    """
+    def is_check(self):
+        self.load_attack_maps()
+        return self.in_check
+
+    def generate_valid_moves(self):
         if self.turn:
             king_row = self.white_king[0]
             king_col = self.white_king[1]
@@ -196,33 +675,167 @@ class ChessBoard(object):
 
         if self.in_check:
             if len(self.checks) == 1:
-                moves = self.all_possible_moves()
                 check = self.checks[0]
                 r = check[0]
                 c = check[1]
                 piece = self.board[r][c][1]
                 if piece == 'N':
-                    valid_squares = [(r,c)]
+                    valid_squares = {(r,c)}
                 else:
-                    valid_squares = []
-                for i in range(1, 8):
-                    valid_square = (king_row + check[2]*i, king_col + check[3]*i)
-                    valid_squares.append(valid_square)
-                    if valid_square[0] == r and valid_square[1] == c:
-                        break
-
-                for i in range(len(moves)-1, -1, -1):
-                    if moves[i].piece_moved[1] != 'K':
-                        if not (moves[i].endrow, moves[i].endcol) in valid_squares:
-                            moves.remove(moves[i])
-                return moves
-            elif len(self.checks) == 2:
+                    valid_squares = set()
+                    for i in range(1, 8):
+                        valid_square = (king_row + check[2]*i, king_col + check[3]*i)
+                        valid_squares.add(valid_square)
+                        if valid_square[0] == r and valid_square[1] == c:
+                            break
+                #king moves are already safe, en-passant captures the checking pawn without landing on its square.
+                return [m for m in self.all_possible_moves()
+                        if m.piece_moved[1] == 'K' or (m.endrow, m.endcol) in valid_squares
+                        or (m.is_en_passant and (m.startrow, m.endcol) == (r, c))]
+            else:
                 moves = []
                 self.get_king_moves(king_row, king_col, moves)
                 return moves
         else:
             return self.all_possible_moves()
 
+    """
+    This function generates the legal captures, en-passant captures and promotions, the moves
+    quiescence search looks at. They are picked from the position's valid moves, which the quiet
+    moves of the same node then reuse.
+    """
+    def get_captures(self):
+        self.load_attack_maps()
+        maps = self.attack_log[-1]
+        if maps[5] is None:
+            maps[5] = self.generate_valid_moves()
+        return [m for m in maps[5]
+                if (m.piece_captured != "--" and not m.is_castle) or m.is_en_passant or m.pawn_promotion]
+
+    """
+    Static exchange evaluation: the material the moving side wins (negative when it loses) if both
+    sides keep recapturing on the target square with their least valuable piece, each side free
+    to stop when going on would lose more. Pieces lined up behind a capturer join in after it (x-rays).
+    """
+    def see(self, move):
+        row, col = move.endrow, move.endcol
+        gains = [SEE_VALUES['p'] if move.is_en_passant else SEE_VALUES.get(move.piece_captured[1], 0)]
+        removed = {(move.startrow, move.startcol)}
+        if move.is_en_passant:
+            removed.add((move.startrow, move.endcol))
+        attacker = move.piece_moved[1]
+        colour = "b" if move.piece_moved[0] == "w" else "w"
+        while True:
+            found = self.least_valuable_attacker(row, col, colour, removed)
+            if found is None:
+                break
+            #score for `colour` if it takes the last capturer, before the other side answers.
+            gains.append(SEE_VALUES[attacker] - gains[-1])
+            attacker, square = found
+            removed.add(square)
+            colour = "b" if colour == "w" else "w"
+        while len(gains) > 1:
+            last = gains.pop()
+            gains[-1] = -max(-gains[-1], last)
+        return gains[0]
+
+    """
+    Returns (piece type, (row, col)) of the cheapest `colour` piece attacking the square, ignoring
+    the squares in `removed`, or None.
+    """
+    def least_valuable_attacker(self, row, col, colour, removed):
+        board = self.board
+        pawn_row = row + 1 if colour == "w" else row - 1
+        if 0 <= pawn_row <= 7:
+            for c in (col - 1, col + 1):
+                if 0 <= c <= 7 and board[pawn_row][c] == colour + 'p' and (pawn_row, c) not in removed:
+                    return 'p', (pawn_row, c)
+        for dr, dc in KNIGHT_OFFSETS:
+            r, c = row + dr, col + dc
+            if 0 <= r <= 7 and 0 <= c <= 7 and board[r][c] == colour + 'N' and (r, c) not in removed:
+                return 'N', (r, c)
+        best = None
+        for dr, dc in SLIDER_DIRECTIONS['Q']:
+            slider = 'R' if dr == 0 or dc == 0 else 'B'
+            r, c = row + dr, col + dc
+            while 0 <= r <= 7 and 0 <= c <= 7:
+                if board[r][c] != "--" and (r, c) not in removed:
+                    piece = board[r][c]
+                    if piece[0] == colour and (piece[1] == slider or piece[1] == 'Q'):
+                        if best is None or SEE_VALUES[piece[1]] < SEE_VALUES[best[0]]:
+                            best = (piece[1], (r, c))
+                    break
+                r += dr
+                c += dc
+        if best is not None:
+            return best
+        for dr, dc in KING_OFFSETS:
+            r, c = row + dr, col + dc
+            if 0 <= r <= 7 and 0 <= c <= 7 and board[r][c] == colour + 'K' and (r, c) not in removed:
+                return 'K', (r, c)
+        return None
+
+    """
+    This function finds checks and pins once per position. They are kept in attack_log, so after
+    undo_move the previous position's maps (and valid moves) are reused instead of scanned again.
+    """
+    def load_attack_maps(self):
+        maps = self.attack_log[-1]
+        if maps is None:
+            in_check, pins, checks = self.pins_and_checks()
+            pin_map = dict(((pin[0], pin[1]), (pin[2], pin[3])) for pin in pins)
+            #the attacked squares are only scanned once a king move needs them, see enemy_attacks,
+            #and the valid moves once asked for, see get_valid_moves.
+            maps = [in_check, pins, checks, pin_map, None, None]
+            self.attack_log[-1] = maps
+        self.in_check, self.pins, self.checks, self.pin_map = maps[0], maps[1], maps[2], maps[3]
+
+    """
+    This function returns the squares attacked by the enemy in the current position, computed
+    at most once per position.
+    """
+    def enemy_attacks(self):
+        maps = self.attack_log[-1]
+        if maps[4] is None:
+            maps[4] = self.attacked_squares("b" if self.turn else "w")
+        return maps[4]
+
+    """
+    This function returns the set of squares attacked by the given side. Rays continue through the
+    other side's king, so the king can't escape a check by stepping back along the checking ray.
+    """
+    def attacked_squares(self, colour):
+        attacked = set()
+        add = attacked.add
+        board = self.board
+        king = ("b" if colour == "w" else "w") + "K"
+        pawn_row = -1 if colour == "w" else 1
+        for i in range(8):
+            for j, piece in enumerate(board[i]):
+                if piece[0] != colour:
+                    continue
+                t = piece[1]
+                if t == 'p':
+                    if j > 0:
+                        add((i+pawn_row, j-1))
+                    if j < 7:
+                        add((i+pawn_row, j+1))
+                elif t == 'N' or t == 'K':
+                    for dr, dc in (KNIGHT_OFFSETS if t == 'N' else KING_OFFSETS):
+                        if 0 <= i+dr <= 7 and 0 <= j+dc <= 7:
+                            add((i+dr, j+dc))
+                else:
+                    for dr, dc in SLIDER_DIRECTIONS[t]:
+                        row = i + dr
+                        col = j + dc
+                        while 0 <= row <= 7 and 0 <= col <= 7:
+                            add((row, col))
+                            if board[row][col] != "--" and board[row][col] != king:
+                                break
+                            row += dr
+                            col += dc
+        return attacked
+
     """
     This function generates all possible pins and checks after a given move.
     """
@@ -321,65 +934,81 @@ class ChessBoard(object):
     This function gets all the pawn moves from a given position i and j.
     """
     def get_pawn_moves(self, i, j, moves):
-        pinned = False
-        pin_direction = ()
-        for r in range(len(self.pins)-1, -1, -1):
-            if self.pins[r][0] == i and self.pins[r][1] == j:
-                pinned = True
-                pin_direction = (self.pins[r][2], self.pins[r][3])
-                self.pins.remove(self.pins[r])
-                break
+        pin_direction = self.pin_map.get((i, j), ())
+        pinned = pin_direction != ()
 
         if self.turn:
             if self.board[i-1][j] == '--':
-                if not pinned or pin_direction == (-1, 0):
-                    moves.append(Move([i, j], [i-1, j], self.board))
+                if not pinned or pin_direction == (-1, 0) or pin_direction == (1, 0):
+                    self.add_pawn_move([i, j], [i-1, j], moves)
                     if i == 6 and self.board[i-2][j] == '--':
                         moves.append(Move([i, j], [i-2, j], self.board))
             if j-1 >= 0:
                 if self.board[i-1][j-1][0] == 'b':
                     if not pinned or pin_direction == (-1, -1):
-                        moves.append(Move([i, j], [i-1, j-1], self.board))
-                elif (i-1, j-1) == self.en_passant and not pinned:
+                        self.add_pawn_move([i, j], [i-1, j-1], moves)
+                elif (i-1, j-1) == self.en_passant and not pinned and not self.en_passant_pin(i, j, j-1):
                     moves.append(Move([i, j], [i-1, j-1], self.board, ep=True))
             if j+1 <= 7:
                 if self.board[i-1][j+1][0] == 'b':
                     if not pinned or pin_direction == (-1, 1):
-                        moves.append(Move([i, j], [i-1, j+1], self.board))
-                elif (i-1, j+1) == self.en_passant and not pinned:
+                        self.add_pawn_move([i, j], [i-1, j+1], moves)
+                elif (i-1, j+1) == self.en_passant and not pinned and not self.en_passant_pin(i, j, j+1):
                     moves.append(Move([i, j], [i-1, j+1], self.board, ep=True))
         else:
             if self.board[i+1][j] == '--':
-                if not pinned or pin_direction == (1, 0):
-                    moves.append(Move([i, j], [i+1, j], self.board))
+                if not pinned or pin_direction == (1, 0) or pin_direction == (-1, 0):
+                    self.add_pawn_move([i, j], [i+1, j], moves)
                     if i == 1 and self.board[i+2][j] == '--':
                         moves.append(Move([i, j], [i+2, j], self.board))
             if j-1 >= 0:
                 if self.board[i+1][j-1][0] == 'w':
                     if not pinned or pin_direction == (1, -1):
-                        moves.append(Move([i, j], [i+1, j-1], self.board))
-                elif (i+1, j-1) == self.en_passant and not pinned:
+                        self.add_pawn_move([i, j], [i+1, j-1], moves)
+                elif (i+1, j-1) == self.en_passant and not pinned and not self.en_passant_pin(i, j, j-1):
                     moves.append(Move([i, j], [i+1, j-1], self.board, ep=True))
             if j+1 <= 7:
                 if self.board[i+1][j+1][0] == 'w':
                     if not pinned or pin_direction == (1, 1):
-                        moves.append(Move([i, j], [i+1, j+1], self.board))
-                elif (i+1, j+1) == self.en_passant and not pinned:
+                        self.add_pawn_move([i, j], [i+1, j+1], moves)
+                elif (i+1, j+1) == self.en_passant and not pinned and not self.en_passant_pin(i, j, j+1):
                     moves.append(Move([i, j], [i+1, j+1], self.board, ep=True))
 
+    """
+    Adds a pawn move, expanded into one move per promotion piece when it reaches the last row.
+    """
+    def add_pawn_move(self, startsq, endsq, moves):
+        if endsq[0] == 0 or endsq[0] == 7:
+            for piece in PROMOTION_PIECES:
+                moves.append(Move(startsq, endsq, self.board, promotion=piece))
+        else:
+            moves.append(Move(startsq, endsq, self.board))
+
+    """
+    En-passant removes two pawns from the same row at once, which can expose the king to a rook
+    or queen on that row even though neither pawn is pinned on its own.
+    """
+    def en_passant_pin(self, i, j, capture_col):
+        king_row, king_col = self.white_king if self.turn else self.black_king
+        if king_row != i:
+            return False
+        enemy = "b" if self.turn else "w"
+        step = 1 if capture_col > king_col else -1
+        col = king_col + step
+        while 0 <= col <= 7:
+            if col != j and col != capture_col:
+                piece = self.board[i][col]
+                if piece != "--":
+                    return piece[0] == enemy and (piece[1] == 'R' or piece[1] == 'Q')
+            col += step
+        return False
 
     """
     This function gets all the bishop moves from a given position i and j.
     """
     def get_bishop_moves(self, i, j, moves):
-        pinned = False
-        pin_direction = ()
-        for r in range(len(self.pins)-1, -1, -1):
-            if self.pins[r][0] == i and self.pins[r][1] == j:
-                pinned = True
-                pin_direction = (self.pins[r][2], self.pins[r][3])
-                self.pins.remove(self.pins[r])
-                break
+        pin_direction = self.pin_map.get((i, j), ())
+        pinned = pin_direction != ()
         #bishop can have at most 7 possible move in one direction, so upperbound in for-loop is 7.
         #up-left, up-right, down-left, down-right
         directions = [(-1,-1),(-1,1),(1,-1),(1,1)]
@@ -421,14 +1050,8 @@ class ChessBoard(object):
     This function gets all the rook moves from a given position i and j.
     """
     def get_rook_moves(self, i, j, moves):
-        pinned = False
-        pin_direction = ()
-        for r in range(len(self.pins)-1, -1, -1):
-            if self.pins[r][0] == i and self.pins[r][1] == j:
-                pinned = True
-                pin_direction = (self.pins[r][2], self.pins[r][3])
-                self.pins.remove(self.pins[r])
-                break
+        pin_direction = self.pin_map.get((i, j), ())
+        pinned = pin_direction != ()
         #rook can have at most 7 possible move in one direction, so upperbound in for-loop is 7.
         #left, right, up, down respectively.
         directions = [(0,-1),(0,1),(-1,0),(1,0)]
@@ -475,26 +1098,15 @@ class ChessBoard(object):
         for (row, col) in possible_moves:
             if row < 0 or col < 0 or row > 7 or col > 7:
                 continue
-            piece = self.board[row][col]
-            if piece[0] != ally:
-                if ally == 'w':
-                    self.white_king = (row, col)
-                else: self.black_king = (row, col)
-                in_check, pins, checks = self.pins_and_checks()
-                if not in_check:
-                    moves.append(Move([i, j], [row, col], self.board))
-                if ally == 'w':
-                    self.white_king = (i, j)
-                else:
-                    self.black_king = (i, j)
+            if self.board[row][col][0] != ally and (row, col) not in self.enemy_attacks():
+                moves.append(Move([i, j], [row, col], self.board))
         self.get_castling_moves(i, j, moves, ally)
 
     """
     This is a helper function that finds possible castling moves.
     """
     def get_castling_moves(self, i, j, moves, ally):
-        in_check, pins, checks = self.pins_and_checks()
-        if in_check:
+        if self.in_check:
             return
         if (ally == 'w' and self.current_castling_rights.wks) or (ally == 'b' and self.current_castling_rights.bks):
             self.get_king_side(i, j, moves, ally)
@@ -507,107 +1119,29 @@ class ChessBoard(object):
     """
     def get_king_side(self, i, j, moves, ally):
         if self.board[i][j+1] == '--' and self.board[i][j+2] == '--':
-            if ally == 'w':
-                (row, col) = (self.white_king[0], self.white_king[1])
-                self.white_king = (i, j+1)
-                in_check, pins, checks = self.pins_and_checks()
-                if in_check:
-                    self.white_king = (row, col)
-                    return
-                else:
-                    self.white_king = (i, j+2)
-                    in_check, pins, checks = self.pins_and_checks()
-                    if in_check:
-                        self.white_king = (row, col)
-                        return
-                    else:
-                        moves.append(Move([i, j], [i, j+2], self.board, is_castle=True))
-                        moves.append(Move([i, j], [i, j+3], self.board, is_castle=True))
-                        self.white_king = (row, col)
-            elif ally == 'b':
-                (row, col) = (self.black_king[0], self.black_king[1])
-                self.black_king = (i, j+1)
-                in_check, pins, checks = self.pins_and_checks()
-                if in_check:
-                    self.black_king = (row, col)
-                    return
-                else:
-                    self.black_king = (i, j+2)
-                    in_check, pins, checks = self.pins_and_checks()
-                    if in_check:
-                        self.black_king = (row, col)
-                        return
-                    else:
-                        moves.append(Move([i, j], [i, j+2], self.board, is_castle = True))
-                        moves.append(Move([i, j], [i, j+3], self.board, is_castle = True))
-                        self.black_king = (row, col)
+            attacked = self.enemy_attacks()
+            if (i, j+1) not in attacked and (i, j+2) not in attacked:
+                moves.append(Move([i, j], [i, j+2], self.board, is_castle=True))
+                moves.append(Move([i, j], [i, j+3], self.board, is_castle=True))
 
     """
     This is a helper function that finds queen side castling moves.
     """
     def get_queen_side(self, i, j, moves, ally):
         if self.board[i][j-1] == '--' and self.board[i][j-2] == '--' and self.board[i][j-3] == '--':
-            if ally == 'w':
-                (row, col) = (self.white_king[0], self.white_king[1])
-                self.white_king = (i, j-1)
-                in_check, pins, checks = self.pins_and_checks()
-                if in_check:
-                    self.white_king = (row, col)
-                    return
-                else:
-                    self.white_king = (i, j-2)
-                    in_check, pins, checks = self.pins_and_checks()
-                    if in_check:
-                        self.white_king = (row, col)
-                        return
-                    else:
-                        self.white_king = (i, j-3)
-                        in_check, pins, checks = self.pins_and_checks()
-                        if in_check:
-                            self.white_king = (row, col)
-                            return
-                        else:
-                            moves.append(Move([i, j], [i, j-2], self.board, is_castle=True))
-                            moves.append(Move([i, j], [i, j-3], self.board, is_castle=True))
-                            moves.append(Move([i, j], [i, j-4], self.board, is_castle=True))
-                            self.white_king = (row, col)
-            elif ally == 'b':
-                (row, col) = (self.black_king[0], self.black_king[1])
-                self.black_king = (i, j-1)
-                in_check, pins, checks = self.pins_and_checks()
-                if in_check:
-                    self.black_king = (row, col)
-                    return
-                else:
-                    self.black_king = (i, j-2)
-                    in_check, pins, checks = self.pins_and_checks()
-                    if in_check:
-                        self.black_king = (row, col)
-                        return
-                    else:
-                        self.black_king = (i, j-3)
-                        in_check, pins, checks = self.pins_and_checks()
-                        if in_check:
-                            self.black_king = (row, col)
-                            return
-                        else:
-                            moves.append(Move([i, j], [i, j-2], self.board, is_castle=True))
-                            moves.append(Move([i, j], [i, j-3], self.board, is_castle=True))
-                            moves.append(Move([i, j], [i, j-4], self.board, is_castle=True))
-                            self.black_king = (row, col)
+            #the king only crosses the d and c files, b file just has to be empty.
+            attacked = self.enemy_attacks()
+            if (i, j-1) not in attacked and (i, j-2) not in attacked:
+                moves.append(Move([i, j], [i, j-2], self.board, is_castle=True))
+                moves.append(Move([i, j], [i, j-3], self.board, is_castle=True))
+                moves.append(Move([i, j], [i, j-4], self.board, is_castle=True))
 
     """
     This function gets all queen moves from given position i an j.
     """
     def get_queen_moves(self, i, j, moves):
-        pinned = False
-        pin_direction = ()
-        for r in range(len(self.pins)-1, -1, -1):
-            if self.pins[r][0] == i and self.pins[r][1] == j:
-                pinned = True
-                pin_direction = (self.pins[r][2], self.pins[r][3])
-                self.pins.remove(self.pins[r])
-                break
+        pin_direction = self.pin_map.get((i, j), ())
+        pinned = pin_direction != ()
         #if queen is pinned, it can only move in direction of pin.
         if pinned:
             pin_directions = [pin_direction, (-pin_direction[0], -pin_direction[1])]
@@ -636,14 +1170,8 @@ class ChessBoard(object):
     This function gets all possible knight moves from given position i and j.
     """
     def get_knight_moves(self, i, j, moves):
-        pinned = False
-        pin_direction = ()
-        for r in range(len(self.pins)-1, -1, -1):
-            if self.pins[r][0] == i and self.pins[r][1] == j:
-                pinned = True
-                pin_direction = (self.pins[r][2], self.pins[r][3])
-                self.pins.remove(self.pins[r])
-                break
+        pin_direction = self.pin_map.get((i, j), ())
+        pinned = pin_direction != ()
         #if knight is pinned, it can not move so return.
         if pinned:
             return
@@ -659,6 +1187,29 @@ class ChessBoard(object):
                 moves.append(Move([i,j], move, self.board))
 
 
+"""
+Packed move format, a 32-bit unsigned int that fits an array('I') slot:
+    bits 0-5    start square (row*8 + col)
+    bits 6-11   end square
+    bits 12-13  promotion piece, index into PROMOTION_PIECES
+    bit 14      pawn promotion
+    bit 15      en-passant
+    bit 16      castling
+    bits 17-20  piece moved, index into PIECE_CODES
+    bits 21-24  piece captured, index into PIECE_CODES
+"""
+PIECE_CODES = ['--', 'wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK']
+PIECE_INDEX = dict((piece, i) for i, piece in enumerate(PIECE_CODES))
+PROMOTION_PIECES = 'QRBN'
+
+PROMOTION_SHIFT = 12
+FLAG_PROMOTION = 1 << 14
+FLAG_EN_PASSANT = 1 << 15
+FLAG_CASTLE = 1 << 16
+MOVED_SHIFT = 17
+CAPTURED_SHIFT = 21
+
+
 class Move(object):
     """
     These are mappings to convert chess notations to array indexes.
@@ -674,8 +1225,12 @@ class Move(object):
 
     rank_to_row = {'8': 0, '7': 1, '6': 2, '5': 3, '4': 4,
                    '3': 5, '2': 6, '1': 7 }
-    
-    def __init__(self, startsq, endsq, board, ep=False, is_castle=False):
+
+    #no per-instance __dict__, generators create thousands of moves per ply.
+    __slots__ = ('startrow', 'startcol', 'endrow', 'endcol', 'piece_moved', 'piece_captured',
+                 'pawn_promotion', 'is_en_passant', 'is_castle', 'promotion')
+
+    def __init__(self, startsq, endsq, board, ep=False, is_castle=False, promotion='Q'):
         self.startrow = startsq[0]
         self.startcol = startsq[1]
         self.endrow = endsq[0]
@@ -686,8 +1241,61 @@ class Move(object):
         self.pawn_promotion = (self.piece_moved == "wp" and self.endrow == 0) or (self.piece_moved == "bp" and self.endrow == 7)
         self.is_en_passant = ep
         self.is_castle = is_castle
-        self.move_id = 1000*self.startrow + 100*self.startcol + 10*self.endrow + self.endcol
-    
+        #piece a pawn promotes to, only used when pawn_promotion is set.
+        self.promotion = promotion
+
+    """
+    Builds a Move from the packed int format without looking at a board.
+    """
+    @classmethod
+    def from_packed(cls, code):
+        move = cls.__new__(cls)
+        start = code & 63
+        end = (code >> 6) & 63
+        move.startrow = start >> 3
+        move.startcol = start & 7
+        move.endrow = end >> 3
+        move.endcol = end & 7
+        move.piece_moved = PIECE_CODES[(code >> MOVED_SHIFT) & 15]
+        move.piece_captured = PIECE_CODES[(code >> CAPTURED_SHIFT) & 15]
+        move.pawn_promotion = code & FLAG_PROMOTION != 0
+        move.is_en_passant = code & FLAG_EN_PASSANT != 0
+        move.is_castle = code & FLAG_CASTLE != 0
+        move.promotion = PROMOTION_PIECES[(code >> PROMOTION_SHIFT) & 3]
+        return move
+
+    """
+    Returns the move in the packed int format.
+    """
+    def pack(self):
+        code = ((self.startrow*8 + self.startcol) | (self.endrow*8 + self.endcol) << 6 |
+                PIECE_INDEX[self.piece_moved] << MOVED_SHIFT | PIECE_INDEX[self.piece_captured] << CAPTURED_SHIFT)
+        if self.pawn_promotion:
+            code |= FLAG_PROMOTION | PROMOTION_PIECES.index(self.promotion) << PROMOTION_SHIFT
+        if self.is_en_passant:
+            code |= FLAG_EN_PASSANT
+        if self.is_castle:
+            code |= FLAG_CASTLE
+        return code
+
+    """
+    Identifies the move by its squares (and promotion piece), computed on demand.
+    """
+    @property
+    def move_id(self):
+        move_id = 1000*self.startrow + 100*self.startcol + 10*self.endrow + self.endcol
+        if self.pawn_promotion:
+            move_id += 10000*PROMOTION_PIECES.index(self.promotion)
+        return move_id
+
+    """
+    Castling moves onto the rook's square (or the b-file) only exist so the UI accepts either click,
+    they duplicate the real castling move for engines and perft.
+    """
+    @property
+    def is_castle_alias(self):
+        return self.is_castle and self.endcol != 2 and self.endcol != 6
+
     """
     Override equals method. 
     """
@@ -695,8 +1303,21 @@ class Move(object):
         if isinstance(other, Move):
             return self.move_id == other.move_id
 
+    def __hash__(self):
+        return self.move_id
+
     def __str__(self):
         return self.generate_notation()
+
+    """
+    Returns the move as start and end square, plus the promotion piece, e.g. e2e4 or e7e8q.
+    """
+    def coordinate_notation(self):
+        notation = (self.col_to_file[self.startcol] + self.row_to_rank[self.startrow] +
+                    self.col_to_file[self.endcol] + self.row_to_rank[self.endrow])
+        if self.pawn_promotion:
+            notation += self.promotion.lower()
+        return notation
     
     def generate_notation(self):
         name = self.piece_moved[1]
@@ -706,6 +1327,8 @@ class Move(object):
         if self.piece_captured != "--":
             notation = (self.col_to_file[self.startcol] + self.row_to_rank[self.startrow] 
                        + 'x' + self.col_to_file[self.endcol] + self.row_to_rank[self.endrow])
+        if self.pawn_promotion:
+            notation += '=' + self.promotion
         return notation
 
 
@@ -715,3 +1338,42 @@ class CastlingRights(object):
         self.wqs = wqs
         self.bks = bks
         self.bqs = bqs
+
+
+class Snapshot(object):
+    __slots__ = ('squares', 'turn', 'castling', 'en_passant', 'halfmove', 'fullmove', 'pawn_key', 'scores',
+                 'history')
+
+    def __init__(self, squares, turn, castling, en_passant, halfmove, fullmove, pawn_key, scores, history):
+        """ Immutable position, made by ChessBoard.snapshot and used by restore, clone and from_snapshot.
+            - squares: bytes of PIECE_CODES indexes, row*8 + col
+            - castling: castling_index of the castling rights
+            - pawn_key, scores: what the board would otherwise recompute, scores is (mg, eg, phase)
+            - history: position keys back to the last capture or pawn move, ending with this one's
+        """
+        for name, value in zip(self.__slots__, (squares, turn, castling, en_passant, halfmove, fullmove, pawn_key,
+                                                scores, history)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Snapshot is immutable")
+
+    def __reduce__(self):
+        return (Snapshot, tuple(getattr(self, name) for name in self.__slots__))
+
+    @property
+    def key(self):
+        return self.history[-1]
+
+    """
+    Same position: pieces, side to move, castling rights and en-passant square; the clocks and
+    history don't count.
+    """
+    def __eq__(self, other):
+        if isinstance(other, Snapshot):
+            return (self.squares == other.squares and self.turn == other.turn and self.castling == other.castling and
+                    self.en_passant == other.en_passant)
+        return NotImplemented
+
+    def __hash__(self):
+        return self.history[-1]
@@ -0,0 +1,127 @@
+import argparse
+import sys
+
+from chess_board import ChessBoard, Move
+
+"""
+Headless API and command line for the engine: set up a position, list legal moves, apply moves
+and search, without pygame. Only the modules a command needs are imported, so short-lived workers
+that just validate moves don't pay for the bitboard tables or the search.
+
+    python chess_cli.py moves e2e4 e7e5
+    python chess_cli.py play e2e4 e7e5 g1f3
+    python chess_cli.py search --depth 5 e2e4
+    python chess_cli.py --fen "8/8/8/4k3/8/8/4P3/4K3 w - - 0 1" moves
+    python chess_cli.py gui
+"""
+
+"""
+Returns a board class by backend name, 'list' for ChessBoard or 'bitboard' for BitboardChessBoard.
+"""
+def board_class(backend):
+    if backend == 'bitboard':
+        from bitboard import BitboardChessBoard
+        return BitboardChessBoard
+    if backend == 'list':
+        return ChessBoard
+    raise ValueError("unknown backend: %s" % backend)
+
+"""
+Returns a new board in the starting position, or the FEN position, with the given moves in
+coordinate notation applied. The list board is enough to check moves; pass backend='bitboard'
+to search, it imports the bitboard tables first.
+"""
+def load_position(moves=(), backend='list', fen=None):
+    cb = board_class(backend).from_fen(fen) if fen else board_class(backend)()
+    for text in moves:
+        apply_move(cb, text)
+    return cb
+
+"""
+Legal moves of the current position, without the UI-only castling targets.
+"""
+def legal_moves(cb):
+    return [m for m in cb.get_valid_moves() if not m.is_castle_alias]
+
+"""
+Finds the legal move written in coordinate notation (e2e4, e7e8q), or raises ValueError.
+"""
+def parse_move(cb, text):
+    text = text.strip().lower()
+    for move in legal_moves(cb):
+        if move.coordinate_notation() == text:
+            return move
+    raise ValueError("illegal move: %s" % text)
+
+def apply_move(cb, text):
+    move = parse_move(cb, text)
+    cb.make_move(move)
+    return move
+
+"""
+Searches the position, see search.Searcher.search for the limits.
+"""
+def search_position(cb, depth=None, movetime=None, nodes=None, hash_mb=16, info=None):
+    from search import Searcher
+    return Searcher(hash_mb=hash_mb).search(cb, depth=depth, movetime=movetime, nodes=nodes, info=info)
+
+def board_text(cb):
+    rows = []
+    for r in range(8):
+        rows.append(Move.row_to_rank[r] + " " +
+                    " ".join(".." if piece == "--" else piece for piece in cb.board[r]))
+    rows.append("  " + " ".join(" " + f for f in "abcdefgh"))
+    rows.append(("white" if cb.turn else "black") + " to move")
+    rows.append(cb.to_fen())
+    return "\n".join(rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless chess engine commands.")
+    parser.add_argument('--backend', choices=['list', 'bitboard'], default=None,
+                        help="board implementation, default bitboard to search and list otherwise")
+    parser.add_argument('--fen', help="start from this position instead of the initial one")
+    commands = parser.add_subparsers(dest='command')
+    moves_cmd = commands.add_parser('moves', help="list the legal moves after the given moves")
+    moves_cmd.add_argument('moves', nargs='*', help="moves from the starting position, e.g. e2e4")
+    play_cmd = commands.add_parser('play', help="apply moves and print the board")
+    play_cmd.add_argument('moves', nargs='*')
+    search_cmd = commands.add_parser('search', help="search the position after the given moves")
+    search_cmd.add_argument('moves', nargs='*')
+    search_cmd.add_argument('--depth', type=int)
+    search_cmd.add_argument('--movetime', type=float, help="seconds")
+    search_cmd.add_argument('--nodes', type=int)
+    search_cmd.add_argument('--hash', type=int, default=16, help="transposition table size in MB")
+    commands.add_parser('gui', help="start the pygame board")
+    args = parser.parse_args(argv)
+
+    if args.command == 'gui':
+        import chess_engine
+        chess_engine.main()
+        return 0
+    if args.command is None:
+        parser.print_help()
+        return 1
+
+    try:
+        backend = args.backend or ('bitboard' if args.command == 'search' else 'list')
+        cb = load_position(args.moves, backend, args.fen)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    if args.command == 'moves':
+        print(" ".join(sorted(m.coordinate_notation() for m in legal_moves(cb))))
+    elif args.command == 'play':
+        print(board_text(cb))
+    elif args.command == 'search':
+        def info(result):
+            print("info %s %s" % (result, result.stats))
+        result = search_position(cb, args.depth, args.movetime, args.nodes, args.hash, info)
+        if result is None or result.best_move is None:
+            print("bestmove (none)")
+        else:
+            print("bestmove " + result.best_move.coordinate_notation())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
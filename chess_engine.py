@@ -1,12 +1,28 @@
-import pygame as p
 import chess_board
 from chess_board import Move
 
+#pygame is imported by load_pygame() when the GUI starts, so importing this module stays headless.
+p = None
+
 WIDTH = HEIGHT = 512
 DIMENSION = 8
 SQ_SIZE = HEIGHT // DIMENSION
-MAX_FPS = 15
 IMAGES = {}
+CAPTION = "chess"
+#seconds the engine thinks when asked to play a move.
+ENGINE_MOVETIME = 3.0
+#RGBA drawn over the selected square.
+HIGHLIGHT = (70, 130, 180, 110)
+
+"""
+Imports pygame on first use.
+"""
+def load_pygame():
+    global p
+    if p is None:
+        import pygame
+        p = pygame
+    return p
 
 """
 Load images for pieces at once.
@@ -17,25 +33,44 @@ def load_images():
         IMAGES[piece] = p.transform.scale(p.image.load("images/" + piece + ".png"), (SQ_SIZE, SQ_SIZE))
 
 """
-Main driver function, this will handle input and graphics.
+Main driver function, this will handle input and graphics. The loop sleeps in p.event.wait()
+until something happens, so an idle board uses no CPU, and only redraws the squares that changed.
+Move generation and searches run on an EngineWorker thread, which wakes the loop with a user
+event when it has results, so input and drawing never wait for the engine.
+    - space: the engine plays a move for the side to move
+    - a: toggles analysis of the position, shown in the window title
+    - z: takes a move back, cancelling whatever the engine was doing
 """
 def main():
+    from engine_worker import EngineWorker
+    from search import MAX_PLY
+    load_pygame()
     p.init()
     screen = p.display.set_mode((WIDTH, HEIGHT))
-    clock = p.time.Clock()
-    screen.fill(p.Color("white"))
+    p.display.set_caption(CAPTION)
+    engine_event = p.USEREVENT + 1
+    worker = EngineWorker(notify=lambda: p.event.post(p.event.Event(engine_event)))
     cb = chess_board.ChessBoard()
     load_images()
+    renderer = BoardRenderer(screen)
     running = True
     sq_selected = ()
     clicks = []
-    valid_moves = cb.get_valid_moves()
+    #None until the worker has generated them, clicks are ignored until then.
+    valid_moves = None
+    request = worker.analyse(cb, search=False)
+    analysing = False
+    engine_to_move = False
     move_made = False
+    #pygame 1 only has VIDEOEXPOSE.
+    exposed = (p.VIDEOEXPOSE, getattr(p, 'WINDOWEXPOSED', p.VIDEOEXPOSE))
     while running:
-        for e in p.event.get():
+        renderer.render(cb.board, sq_selected)
+        #block for the next event, then take whatever else queued up with it.
+        for e in [p.event.wait()] + p.event.get():
             if e.type == p.QUIT:
                 running = False
-            elif e.type == p.MOUSEBUTTONDOWN:
+            elif e.type == p.MOUSEBUTTONDOWN and valid_moves is not None:
                 location = p.mouse.get_pos() #x, y coord. of mouse
                 col = location[0] // SQ_SIZE
                 row = location[1] // SQ_SIZE
@@ -58,25 +93,52 @@ def main():
 
             elif e.type == p.KEYDOWN and e.key == p.K_z:
                 cb.undo_move()
+                engine_to_move = False
                 move_made = True
+            elif e.type == p.KEYDOWN and e.key == p.K_SPACE and valid_moves:
+                engine_to_move = True
+                request = worker.analyse(cb, movetime=ENGINE_MOVETIME)
+            elif e.type == p.KEYDOWN and e.key == p.K_a:
+                analysing = not analysing
+                engine_to_move = False
+                request = worker.analyse(cb, search=analysing, depth=MAX_PLY)
+                p.display.set_caption(CAPTION)
+            elif e.type == engine_event:
+                for kind, request_id, payload in worker.poll():
+                    if request_id != request:
+                        continue
+                    if kind == 'moves':
+                        valid_moves = payload
+                    elif kind == 'info':
+                        p.display.set_caption(search_caption(payload))
+                    elif kind == 'bestmove' and engine_to_move:
+                        engine_to_move = False
+                        if payload is not None and payload.best_move is not None:
+                            cb.make_move(valid_moves[valid_moves.index(payload.best_move)])
+                            move_made = True
+            elif e.type in exposed:
+                renderer.invalidate()
                 
         if move_made:
-            valid_moves = cb.get_valid_moves()
+            valid_moves = None
+            sq_selected = ()
+            clicks = []
+            request = worker.analyse(cb, search=analysing, depth=MAX_PLY)
             move_made = False
-        if len(valid_moves) == 0:
-            print("Checkmate")
+        outcome = cb.game_result(valid_moves) if valid_moves is not None else None
+        if outcome is not None:
+            renderer.render(cb.board, sq_selected)
+            print("%s %s" % outcome)
             break
-
-        draw_game_state(screen, cb)
-        clock.tick(MAX_FPS)
-        p.display.flip()
+    worker.close()
 
 """
-This function will handle all in game graphics.
+Window title with the live search info: depth, score, speed and principal variation.
 """
-def draw_game_state(screen, cb):
-    draw_board(screen) #this function will draw sqaures on the board
-    draw_pieces(screen, cb.board) #this function will draw pieces on the board at their respective positions.
+def search_caption(result):
+    pv = " ".join(m.coordinate_notation() for m in result.pv[:8])
+    return "%s - depth %d score %+.2f %d knps %s" % (CAPTION, result.depth, result.score / 100.0,
+                                                    result.stats.nps / 1000, pv)
 
 """
 This function will draw 8x8 chess board.
@@ -88,13 +150,57 @@ def draw_board(screen):
             color = colors[(r+c)%2]
             p.draw.rect(screen, color, p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
 
-def draw_pieces(screen, board):
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            if board[r][c] == "--":
-                continue
-            else:
-                screen.blit(IMAGES[board[r][c]], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+
+class BoardRenderer(object):
+    def __init__(self, screen):
+        """ Draws the board onto the screen square by square, only where something changed.
+            - background: the empty board, drawn once into its own Surface
+            - shown: the piece on every square as last drawn, None when the screen must be redrawn
+            - selected: the highlighted square as last drawn
+        """
+        self.screen = screen
+        self.background = p.Surface((WIDTH, HEIGHT)).convert()
+        draw_board(self.background)
+        self.highlight = p.Surface((SQ_SIZE, SQ_SIZE), p.SRCALPHA)
+        self.highlight.fill(HIGHLIGHT)
+        self.shown = None
+        self.selected = ()
+
+    """
+    The whole board is redrawn on the next render, e.g. after the window was uncovered.
+    """
+    def invalidate(self):
+        self.shown = None
+
+    """
+    Redraws the squares whose piece or highlight changed since the last call and updates only
+    those areas of the display. Moves, captures, castling and undos all show up as changed squares,
+    so callers don't have to say what happened.
+    """
+    def render(self, board, selected=()):
+        if self.shown is None:
+            self.shown = [[None]*DIMENSION for _ in range(DIMENSION)]
+            dirty = [(r, c) for r in range(DIMENSION) for c in range(DIMENSION)]
+        else:
+            dirty = [(r, c) for r in range(DIMENSION) for c in range(DIMENSION) if board[r][c] != self.shown[r][c]]
+            for square in (self.selected, selected):
+                if square and self.selected != selected and square not in dirty:
+                    dirty.append(square)
+        if not dirty:
+            return
+        rects = []
+        for r, c in dirty:
+            rect = p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE)
+            self.screen.blit(self.background, rect, rect)
+            if (r, c) == selected:
+                self.screen.blit(self.highlight, rect)
+            piece = board[r][c]
+            if piece != "--":
+                self.screen.blit(IMAGES[piece], rect)
+            self.shown[r][c] = piece
+            rects.append(rect)
+        self.selected = selected
+        p.display.update(rects)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,143 @@
+import copy
+import queue
+import threading
+
+from chess_cli import board_class
+from search import Searcher
+
+"""
+Background engine for interactive front ends. Move generation and searches run on a worker
+thread with its own board and Searcher, and results come back through a queue, so an event loop
+only ever does cheap work:
+
+    worker = EngineWorker(notify=wake_up_the_event_loop)
+    request = worker.analyse(cb, depth=6)
+    ...
+    for kind, request_id, payload in worker.poll():
+        if request_id == request: ...
+
+Every request cancels the one before it, and results of cancelled requests are never delivered,
+so the loop can start a new request whenever the position changes without waiting for anything.
+"""
+
+#search limits when a request sets none: long enough to be useful, short enough to keep a GUI lively.
+DEFAULT_MOVETIME = 2.0
+
+
+class _WorkerSearcher(Searcher):
+    def __init__(self, worker, hash_mb):
+        super(_WorkerSearcher, self).__init__(hash_mb=hash_mb)
+        self.worker = worker
+        self.request_id = None
+
+    def check_limits(self):
+        super(_WorkerSearcher, self).check_limits()
+        #also catches a cancel that came before search() reset the stop flag.
+        if self.worker.current != self.request_id:
+            self.stopped = True
+
+
+class EngineWorker(object):
+    def __init__(self, notify=None, hash_mb=16, backend='bitboard'):
+        """ Worker thread taking requests from the event loop; close() it when done.
+            - notify: called on the worker thread after every result, e.g. to post a pygame event
+              that wakes an event loop sleeping in event.wait()
+            - results: queue.Queue of (kind, request id, payload) with kind
+                'moves': the list of valid moves of the position, as get_valid_moves returns them
+                'info': the SearchResult of a completed iteration, with its stats copied then
+                'bestmove': the final SearchResult, None when there is no legal move
+            - current: id of the request results are delivered for, None when idle or cancelled
+        """
+        self.notify = notify
+        self.backend = backend
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.searcher = _WorkerSearcher(self, hash_mb)
+        self.current = None
+        self.next_id = 1
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name="engine-worker")
+        self.thread.daemon = True
+        self.thread.start()
+
+    """
+    Asks for the legal moves of cb's position and, when search is True, a search to the given
+    limits (see Searcher.search; with none, DEFAULT_MOVETIME). The position is sent as a snapshot,
+    which carries the keys the worker needs to see repetitions. Returns the request id.
+    """
+    def analyse(self, cb, search=True, depth=None, movetime=None, nodes=None):
+        limits = None
+        if search:
+            limits = {'depth': depth, 'movetime': movetime, 'nodes': nodes}
+            if depth is None and movetime is None and nodes is None:
+                limits['movetime'] = DEFAULT_MOVETIME
+        with self.lock:
+            request_id = self.next_id
+            self.next_id += 1
+            self.current = request_id
+        self.searcher.stop()
+        self.requests.put((request_id, cb.snapshot(), limits))
+        return request_id
+
+    """
+    Drops the running request, its remaining results are never delivered.
+    """
+    def cancel(self):
+        with self.lock:
+            self.current = None
+        self.searcher.stop()
+
+    """
+    Returns the results that arrived since the last call, without waiting.
+    """
+    def poll(self):
+        found = []
+        while True:
+            try:
+                kind, request_id, payload = self.results.get_nowait()
+            except queue.Empty:
+                return found
+            if request_id == self.current:
+                found.append((kind, request_id, payload))
+
+    def close(self):
+        self.cancel()
+        self.requests.put(None)
+        self.thread.join()
+
+    def send(self, kind, request_id, payload):
+        if request_id != self.current:
+            return
+        self.results.put((kind, request_id, payload))
+        if self.notify is not None:
+            self.notify()
+
+    def run(self):
+        cb = board_class(self.backend)()
+        while True:
+            request = self.requests.get()
+            #only the newest of several queued requests matters.
+            while request is not None and not self.requests.empty():
+                request = self.requests.get()
+            if request is None:
+                return
+            request_id, snapshot, limits = request
+            if request_id != self.current:
+                continue
+            cb.restore(snapshot)
+            self.send('moves', request_id, list(cb.get_valid_moves()))
+            if limits is None:
+                continue
+            self.searcher.request_id = request_id
+            result = self.searcher.search(cb, info=lambda result: self.send('info', request_id, self.snapshot(result)),
+                                          **limits)
+            self.send('bestmove', request_id, result)
+
+    """
+    The search keeps counting in its stats after an iteration is reported, the loop gets a copy.
+    """
+    @staticmethod
+    def snapshot(result):
+        result = copy.copy(result)
+        result.stats = copy.copy(result.stats)
+        return result
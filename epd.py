@@ -0,0 +1,122 @@
+from chess_board import ChessBoard
+
+"""
+EPD (Extended Position Description) records: the four position fields of a FEN followed by
+operations, each an opcode with zero or more operands and a terminating semicolon.
+
+    r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - bm Bb5; id "ruy.1";
+
+read_epd streams a file of these through a single board, so loading millions of positions
+allocates no board or operation objects per line unless the operations are asked for.
+"""
+
+"""
+Parses the operation part of an EPD record into a dict of opcode to list of operands.
+Quoted operands keep their spaces and semicolons, without the quotes.
+"""
+def parse_operations(text):
+    operations = {}
+    operands = []
+    opcode = None
+    i = 0
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if c.isspace():
+            i += 1
+        elif c == ';':
+            if opcode is not None:
+                operations[opcode] = operands
+            opcode = None
+            operands = []
+            i += 1
+        elif c == '"':
+            end = text.find('"', i + 1)
+            if end < 0:
+                raise ValueError("unterminated string in EPD operations: %s" % text)
+            operands.append(text[i + 1:end])
+            i = end + 1
+        else:
+            end = i
+            while end < n and not text[end].isspace() and text[end] != ';':
+                end += 1
+            if opcode is None:
+                opcode = text[i:end]
+            else:
+                operands.append(text[i:end])
+            i = end
+    if opcode is not None:
+        #a last operation without its semicolon.
+        operations[opcode] = operands
+    return operations
+
+"""
+Sets cb up from one EPD record and returns the unparsed operation text. The hmvc and fmvn
+operations, when present, set the move clocks.
+"""
+def load_epd(cb, line):
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError("invalid EPD: %s" % line)
+    rest = fields[4] if len(fields) > 4 else ""
+    halfmove, fullmove = 0, 1
+    if 'hmvc' in rest or 'fmvn' in rest:
+        operations = parse_operations(rest)
+        try:
+            if operations.get('hmvc'):
+                halfmove = int(operations['hmvc'][0])
+            if operations.get('fmvn'):
+                fullmove = int(operations['fmvn'][0])
+        except ValueError:
+            raise ValueError("invalid EPD move clocks: %s" % line)
+    cb.set_position(fields[0], fields[1], fields[2], fields[3], halfmove, fullmove)
+    return rest
+
+"""
+Returns a new board and the operations dict of one EPD record.
+"""
+def from_epd(line, board_class=ChessBoard):
+    cb = board_class()
+    return cb, parse_operations(load_epd(cb, line))
+
+"""
+EPD record of the position with the given operations, a dict of opcode to operand list.
+Operands containing spaces or semicolons are quoted.
+"""
+def to_epd(cb, operations=None):
+    parts = [cb.position_fen()]
+    for opcode, operands in (operations or {}).items():
+        text = opcode
+        for operand in operands:
+            operand = str(operand)
+            if not operand or ' ' in operand or ';' in operand:
+                operand = '"%s"' % operand
+            text += " " + operand
+        parts.append(text + ";")
+    return " ".join(parts)
+
+"""
+Streams the records of an EPD file (a path or an open text file), yielding (board, operations)
+for each line. Blank lines and lines starting with '#' are skipped.
+- board_class: board implementation to load the positions into
+- operations: when False the unparsed operation text is yielded instead of a dict
+- reuse: when True (the default) every record is loaded into the same board, which is only
+  valid until the next record is read
+"""
+def read_epd(source, board_class=ChessBoard, operations=True, reuse=True):
+    if isinstance(source, str):
+        with open(source) as f:
+            for record in read_epd(f, board_class, operations, reuse):
+                yield record
+        return
+    cb = board_class() if reuse else None
+    for number, line in enumerate(source, 1):
+        line = line.strip()
+        if not line or line[0] == '#':
+            continue
+        board = cb if reuse else board_class()
+        try:
+            rest = load_epd(board, line)
+        except ValueError as e:
+            raise ValueError("line %d: %s" % (number, e))
+        yield board, (parse_operations(rest) if operations else rest)
@@ -0,0 +1,304 @@
+"""
+Static evaluation: material and piece-square tables tapered between middlegame and endgame,
+pawn structure and king safety, in centipawns.
+
+The material and piece-square sums (ChessBoard.mg, ChessBoard.eg) and the game phase
+(ChessBoard.phase) are kept up to date by make_move/undo_move, so that part costs nothing at a
+leaf. Pawn structure is cached by ChessBoard.pawn_key in a PawnTable, so only the king's pawn
+shield is computed on every call.
+
+Values and tables are PeSTO's (Ronald Friederich), laid out like ChessBoard.board with a8 first,
+so a white piece on (row, col) reads entry row*8 + col and a black piece the mirrored square.
+"""
+
+PIECE_TYPES = ['p', 'N', 'B', 'R', 'Q', 'K']
+
+MG_VALUES = {'p': 82, 'N': 337, 'B': 365, 'R': 477, 'Q': 1025, 'K': 0}
+EG_VALUES = {'p': 94, 'N': 281, 'B': 297, 'R': 512, 'Q': 936, 'K': 0}
+
+#game phase is the sum of these over the pieces on the board, 24 in the starting position.
+PHASE_WEIGHTS = {'p': 0, 'N': 1, 'B': 1, 'R': 2, 'Q': 4, 'K': 0}
+MAX_PHASE = 24
+
+MG_PST = {
+    'p': [  0,   0,   0,   0,   0,   0,   0,   0,
+           98, 134,  61,  95,  68, 126,  34, -11,
+           -6,   7,  26,  31,  65,  56,  25, -20,
+          -14,  13,   6,  21,  23,  12,  17, -23,
+          -27,  -2,  -5,  12,  17,   6,  10, -25,
+          -26,  -4,  -4, -10,   3,   3,  33, -12,
+          -35,  -1, -20, -23, -15,  24,  38, -22,
+            0,   0,   0,   0,   0,   0,   0,   0],
+    'N': [-167, -89, -34, -49,  61, -97, -15,-107,
+          -73, -41,  72,  36,  23,  62,   7, -17,
+          -47,  60,  37,  65,  84, 129,  73,  44,
+           -9,  17,  19,  53,  37,  69,  18,  22,
+          -13,   4,  16,  13,  28,  19,  21,  -8,
+          -23,  -9,  12,  10,  19,  17,  25, -16,
+          -29, -53, -12,  -3,  -1,  18, -14, -19,
+         -105, -21, -58, -33, -17, -28, -19, -23],
+    'B': [-29,   4, -82, -37, -25, -42,   7,  -8,
+          -26,  16, -18, -13,  30,  59,  18, -47,
+          -16,  37,  43,  40,  35,  50,  37,  -2,
+           -4,   5,  19,  50,  37,  37,   7,  -2,
+           -6,  13,  13,  26,  34,  12,  10,   4,
+            0,  15,  15,  15,  14,  27,  18,  10,
+            4,  15,  16,   0,   7,  21,  33,   1,
+          -33,  -3, -14, -21, -13, -12, -39, -21],
+    'R': [ 32,  42,  32,  51,  63,   9,  31,  43,
+           27,  32,  58,  62,  80,  67,  26,  44,
+           -5,  19,  26,  36,  17,  45,  61,  16,
+          -24, -11,   7,  26,  24,  35,  -8, -20,
+          -36, -26, -12,  -1,   9,  -7,   6, -23,
+          -45, -25, -16, -17,   3,   0,  -5, -33,
+          -44, -16, -20,  -9,  -1,  11,  -6, -71,
+          -19, -13,   1,  17,  16,   7, -37, -26],
+    'Q': [-28,   0,  29,  12,  59,  44,  43,  45,
+          -24, -39,  -5,   1, -16,  57,  28,  54,
+          -13, -17,   7,   8,  29,  56,  47,  57,
+          -27, -27, -16, -16,  -1,  17,  -2,   1,
+           -9, -26,  -9, -10,  -2,  -4,   3,  -3,
+          -14,   2, -11,  -2,  -5,   2,  14,   5,
+          -35,  -8,  11,   2,   8,  15,  -3,   1,
+           -1, -18,  -9,  10, -15, -25, -31, -50],
+    'K': [-65,  23,  16, -15, -56, -34,   2,  13,
+           29,  -1, -20,  -7,  -8,  -4, -38, -29,
+           -9,  24,   2, -16, -20,   6,  22, -22,
+          -17, -20, -12, -27, -30, -25, -14, -36,
+          -49,  -1, -27, -39, -46, -44, -33, -51,
+          -14, -14, -22, -46, -44, -30, -15, -27,
+            1,   7,  -8, -64, -43, -16,   9,   8,
+          -15,  36,  12, -54,   8, -28,  24,  14],
+}
+
+EG_PST = {
+    'p': [  0,   0,   0,   0,   0,   0,   0,   0,
+          178, 173, 158, 134, 147, 132, 165, 187,
+           94, 100,  85,  67,  56,  53,  82,  84,
+           32,  24,  13,   5,  -2,   4,  17,  17,
+           13,   9,  -3,  -7,  -7,  -8,   3,  -1,
+            4,   7,  -6,   1,   0,  -5,  -1,  -8,
+           13,   8,   8,  10,  13,   0,   2,  -7,
+            0,   0,   0,   0,   0,   0,   0,   0],
+    'N': [-58, -38, -13, -28, -31, -27, -63, -99,
+          -25,  -8, -25,  -2,  -9, -25, -24, -52,
+          -24, -20,  10,   9,  -1,  -9, -19, -41,
+          -17,   3,  22,  22,  22,  11,   8, -18,
+          -18,  -6,  16,  25,  16,  17,   4, -18,
+          -23,  -3,  -1,  15,  10,  -3, -20, -22,
+          -42, -20, -10,  -5,  -2, -20, -23, -44,
+          -29, -51, -23, -15, -22, -18, -50, -64],
+    'B': [-14, -21, -11,  -8,  -7,  -9, -17, -24,
+           -8,  -4,   7, -12,  -3, -13,  -4, -14,
+            2,  -8,   0,  -1,  -2,   6,   0,   4,
+           -3,   9,  12,   9,  14,  10,   3,   2,
+           -6,   3,  13,  19,   7,  10,  -3,  -9,
+          -12,  -3,   8,  10,  13,   3,  -7, -15,
+          -14, -18,  -7,  -1,   4,  -9, -15, -27,
+          -23,  -9, -23,  -5,  -9, -16,  -5, -17],
+    'R': [ 13,  10,  18,  15,  12,  12,   8,   5,
+           11,  13,  13,  11,  -3,   3,   8,   3,
+            7,   7,   7,   5,   4,  -3,  -5,  -3,
+            4,   3,  13,   1,   2,   1,  -1,   2,
+            3,   5,   8,   4,  -5,  -6,  -8, -11,
+           -4,   0,  -5,  -1,  -7, -12,  -8, -16,
+           -6,  -6,   0,   2,  -9,  -9, -11,  -3,
+           -9,   2,   3,  -1,  -5, -13,   4, -20],
+    'Q': [ -9,  22,  22,  27,  27,  19,  10,  20,
+          -17,  20,  32,  41,  58,  25,  30,   0,
+          -20,   6,   9,  49,  47,  35,  19,   9,
+            3,  22,  24,  45,  57,  40,  57,  36,
+          -18,  28,  19,  47,  31,  34,  39,  23,
+          -16, -27,  15,   6,   9,  17,  10,   5,
+          -22, -23, -30, -16, -16, -23, -36, -32,
+          -33, -28, -22, -43,  -5, -32, -20, -41],
+    'K': [-74, -35, -18, -18, -11,  15,   4, -17,
+          -12,  17,  14,  17,  17,  38,  23,  11,
+           10,  17,  23,  15,  20,  45,  44,  13,
+           -8,  22,  24,  27,  26,  33,  26,   3,
+          -18,  -4,  21,  24,  27,  23,   9, -11,
+          -19,  -3,  11,  21,  23,  16,   7,  -9,
+          -27, -11,   4,  13,  14,   4,  -5, -17,
+          -53, -34, -21, -11, -28, -14, -24, -43],
+}
+
+"""
+Per piece string, the signed material plus piece-square value of every square from white's
+point of view, so make_move only adds and subtracts table entries.
+"""
+def _piece_tables(values, pst):
+    tables = {}
+    for kind in PIECE_TYPES:
+        tables['w' + kind] = [values[kind] + pst[kind][sq] for sq in range(64)]
+        tables['b' + kind] = [-(values[kind] + pst[kind][sq ^ 56]) for sq in range(64)]
+    return tables
+
+MG_TABLES = _piece_tables(MG_VALUES, MG_PST)
+EG_TABLES = _piece_tables(EG_VALUES, EG_PST)
+PHASE = dict((colour + kind, PHASE_WEIGHTS[kind]) for colour in 'wb' for kind in PIECE_TYPES)
+
+DOUBLED_PAWN = (-10, -20)
+ISOLATED_PAWN = (-10, -15)
+#passed pawn bonus by ranks advanced from its starting rank.
+PASSED_PAWN_MG = [0, 5, 10, 15, 25, 40, 60]
+PASSED_PAWN_EG = [0, 10, 20, 35, 60, 100, 150]
+#middlegame king shield: own pawn right in front of the king, one square further, or none.
+SHIELD_CLOSE = 10
+SHIELD_FAR = 5
+SHIELD_MISSING = -15
+OPEN_FILE_NEAR_KING = -10
+
+"""
+Material and piece-square sums of a whole board from scratch, returns (mg, eg, phase).
+make_move/undo_move keep the same three numbers up to date incrementally.
+"""
+def material_scores(board):
+    mg = eg = phase = 0
+    for r in range(8):
+        for c in range(8):
+            piece = board[r][c]
+            if piece != "--":
+                mg += MG_TABLES[piece][r*8 + c]
+                eg += EG_TABLES[piece][r*8 + c]
+                phase += PHASE[piece]
+    return mg, eg, phase
+
+"""
+Doubled, isolated and passed pawn terms from lists of white and black pawn (row, col) squares.
+Returns (mg, eg, white_files, black_files): the scores from white's point of view and the files
+holding pawns of each side as bit masks, bit c for column c.
+"""
+def pawn_structure(white_pawns, black_pawns):
+    white_files = [0]*8
+    black_files = [0]*8
+    #most advanced black pawn per file from white's side (lowest row) and vice versa.
+    black_front = [8]*8
+    white_front = [-1]*8
+    for r, c in white_pawns:
+        white_files[c] += 1
+        if r > white_front[c]:
+            white_front[c] = r
+    for r, c in black_pawns:
+        black_files[c] += 1
+        if r < black_front[c]:
+            black_front[c] = r
+    mg = eg = 0
+    for c in range(8):
+        if white_files[c] > 1:
+            mg += DOUBLED_PAWN[0]*(white_files[c] - 1)
+            eg += DOUBLED_PAWN[1]*(white_files[c] - 1)
+        if black_files[c] > 1:
+            mg -= DOUBLED_PAWN[0]*(black_files[c] - 1)
+            eg -= DOUBLED_PAWN[1]*(black_files[c] - 1)
+    for r, c in white_pawns:
+        left, right = max(c - 1, 0), min(c + 1, 7)
+        if not (c > 0 and white_files[c-1]) and not (c < 7 and white_files[c+1]):
+            mg += ISOLATED_PAWN[0]
+            eg += ISOLATED_PAWN[1]
+        if black_front[left] >= r and black_front[c] >= r and black_front[right] >= r:
+            mg += PASSED_PAWN_MG[6 - r]
+            eg += PASSED_PAWN_EG[6 - r]
+    for r, c in black_pawns:
+        left, right = max(c - 1, 0), min(c + 1, 7)
+        if not (c > 0 and black_files[c-1]) and not (c < 7 and black_files[c+1]):
+            mg -= ISOLATED_PAWN[0]
+            eg -= ISOLATED_PAWN[1]
+        if white_front[left] <= r and white_front[c] <= r and white_front[right] <= r:
+            mg -= PASSED_PAWN_MG[r - 1]
+            eg -= PASSED_PAWN_EG[r - 1]
+    white_mask = black_mask = 0
+    for c in range(8):
+        if white_files[c]:
+            white_mask |= 1 << c
+        if black_files[c]:
+            black_mask |= 1 << c
+    return mg, eg, white_mask, black_mask
+
+"""
+Middlegame pawn shield of one king on its first two ranks, from that side's point of view.
+`forward` is -1 for white and 1 for black, `files` the mask of files with that side's pawns.
+"""
+def king_shield(board, king, pawn, forward, files):
+    r, c = king
+    home = 7 if forward < 0 else 0
+    if abs(r - home) > 1:
+        return 0
+    score = 0
+    for f in range(max(c - 1, 0), min(c + 2, 8)):
+        close = r + forward
+        if 0 <= close < 8 and board[close][f] == pawn:
+            score += SHIELD_CLOSE
+        elif 0 <= close + forward < 8 and board[close + forward][f] == pawn:
+            score += SHIELD_FAR
+        else:
+            score += SHIELD_MISSING
+            if not files & (1 << f):
+                score += OPEN_FILE_NEAR_KING
+    return score
+
+def king_safety(cb, white_files, black_files):
+    return (king_shield(cb.board, cb.white_king, 'wp', -1, white_files) -
+            king_shield(cb.board, cb.black_king, 'bp', 1, black_files))
+
+
+class PawnTable(object):
+    def __init__(self, entries=16384):
+        """ Bounded cache of pawn_structure results keyed by ChessBoard.pawn_key.
+            Pawn structures repeat far more than positions do, so most evaluations are hits.
+            - entries: slots, rounded down to a power of two; a new structure replaces the old
+              one in its slot
+        """
+        size = 1
+        while size*2 <= entries:
+            size *= 2
+        self.mask = size - 1
+        self.keys = [None]*size
+        self.values = [None]*size
+        self.probes = 0
+        self.hits = 0
+
+    def clear(self):
+        self.keys = [None]*len(self.keys)
+        self.values = [None]*len(self.values)
+
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+
+    """
+    Returns the pawn_structure result of the board's pawns, from the cache when possible.
+    """
+    def lookup(self, cb):
+        self.probes += 1
+        key = cb.pawn_key
+        i = key & self.mask
+        if self.keys[i] == key:
+            self.hits += 1
+            return self.values[i]
+        value = pawn_structure(cb.piece_squares('wp'), cb.piece_squares('bp'))
+        self.keys[i] = key
+        self.values[i] = value
+        return value
+
+    def stats(self):
+        return {
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.probes if self.probes else 0.0,
+            'entries': len(self.keys),
+        }
+
+#the cache evaluate uses when none is given, one per process.
+pawn_table = PawnTable()
+
+"""
+Static evaluation of the position from the side to move's point of view.
+"""
+def evaluate(cb, pawns=None):
+    pawn_mg, pawn_eg, white_files, black_files = (pawns or pawn_table).lookup(cb)
+    mg = cb.mg + pawn_mg + king_safety(cb, white_files, black_files)
+    eg = cb.eg + pawn_eg
+    phase = min(cb.phase, MAX_PHASE)
+    #truncating toward zero keeps the score exactly symmetric between the two sides.
+    score = int((mg*phase + eg*(MAX_PHASE - phase)) / MAX_PHASE)
+    return score if cb.turn else -score
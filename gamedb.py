@@ -0,0 +1,442 @@
+import argparse
+import collections
+import heapq
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+
+from chess_board import START_FEN
+from chess_cli import board_class, legal_moves, apply_move
+
+"""
+Binary game database: games stored as compact move streams plus a position index to answer
+"which games reached this position" and "what was played here, with what results".
+
+A database `name` is three files:
+    name.games    game records: result, ply count, start FEN, tags and the move stream
+    name.offsets  file offset of every game record, 8 bytes per game, game ids count from 0
+    name.index    one 16-byte entry (key, game, ply and result, move) per position of every game,
+                  sorted, memory-mapped and binary-searched like a Polyglot book
+
+A move is stored as its index among the position's legal moves in a fixed order (sorted by
+move_id). The indexes of a game are packed into one mixed-radix number, each move taking
+log2(legal moves) bits, about 5 bits a move, and a forced move none at all; decoding replays the
+game. Positions are keyed by the board's Zobrist key.
+
+    python gamedb.py build games games.pgn
+    python gamedb.py query games e2e4 e7e5
+"""
+
+#big-endian, so entries sort by key as plain bytes.
+ENTRY = struct.Struct(">QIHH")
+KEY = struct.Struct(">Q")
+OFFSET = struct.Struct("<Q")
+#result, plies, start FEN length, tags length, move stream length.
+RECORD = struct.Struct("<BHBHI")
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+#entry of the last position of a game, nothing was played from it.
+NO_MOVE = 0xFFFF
+#promotion field of an entry move, 0 for none.
+PROMOTIONS = {'N': 1, 'B': 2, 'R': 3, 'Q': 4}
+#positions sorted in memory before they are written out as a run and merged at close.
+RUN_ENTRIES = 1 << 20
+
+"""
+Legal moves in the order move streams index them.
+"""
+def ordered_moves(cb):
+    return sorted(legal_moves(cb), key=lambda m: m.move_id)
+
+"""
+16-bit code of a move in index entries: start square, end square and promotion.
+"""
+def move_code(move):
+    code = (move.startrow*8 + move.startcol) | (move.endrow*8 + move.endcol) << 6
+    if move.pawn_promotion:
+        code |= PROMOTIONS[move.promotion] << 12
+    return code
+
+"""
+Packs a game's moves, played from cb's position, into a move stream. cb is left as it was.
+Raises ValueError when a move isn't legal.
+"""
+def encode_moves(cb, moves):
+    code = 0
+    radix = 1
+    made = 0
+    try:
+        for move in moves:
+            options = ordered_moves(cb)
+            try:
+                index = options.index(move)
+            except ValueError:
+                raise ValueError("illegal move: %s" % move.coordinate_notation())
+            code += index * radix
+            radix *= len(options)
+            cb.make_move(options[index])
+            made += 1
+    finally:
+        for _ in range(made):
+            cb.undo_move()
+    return code.to_bytes((code.bit_length() + 7) // 8, 'little')
+
+"""
+Yields the `plies` moves of a move stream, making each on cb, which must hold the start position.
+"""
+def decode_moves(cb, data, plies):
+    code = int.from_bytes(data, 'little')
+    for _ in range(plies):
+        options = ordered_moves(cb)
+        code, index = divmod(code, len(options))
+        move = options[index]
+        cb.make_move(move)
+        yield move
+
+
+class MoveStats(object):
+    def __init__(self, move):
+        """ What happened after one move from a position.
+            - games: games that played it, white, draws, black: how they ended; unfinished
+              games only count in games
+        """
+        self.move = move
+        self.games = 0
+        self.white = 0
+        self.draws = 0
+        self.black = 0
+
+    """
+    Score for the side that played the move, from 0 to 1, over the finished games.
+    """
+    def score(self, white_to_move):
+        finished = self.white + self.draws + self.black
+        if not finished:
+            return 0.0
+        wins = self.white if white_to_move else self.black
+        return (wins + 0.5*self.draws) / finished
+
+    def __str__(self):
+        return "%s games %d +%d =%d -%d" % (self.move.coordinate_notation(), self.games, self.white,
+                                             self.draws, self.black)
+
+
+class GameRecord(object):
+    def __init__(self, game_id, result, plies, fen, tags, stream):
+        """ A stored game, its moves still packed; see GameDatabase.moves.
+            - fen: start position, START_FEN unless the game set one up
+            - tags: dict of PGN tag name to value
+        """
+        self.game_id = game_id
+        self.result = result
+        self.plies = plies
+        self.fen = fen
+        self.tags = tags
+        self.stream = stream
+
+    def __str__(self):
+        return "#%d %s - %s %s %d plies" % (self.game_id, self.tags.get('White', '?'), self.tags.get('Black', '?'),
+                                           self.result, self.plies)
+
+
+class GameDatabaseWriter(object):
+    def __init__(self, path, backend='bitboard', run_entries=RUN_ENTRIES):
+        """ Appends games to the database at `path`, creating it if needed. The new positions are
+            merged into the index by close(); use it as a context manager.
+        """
+        self.path = path
+        self.cb = board_class(backend)()
+        self.run_entries = run_entries
+        self.games = open(path + '.games', 'ab')
+        self.offsets = open(path + '.offsets', 'ab')
+        self.next_id = self.offsets.tell() // OFFSET.size
+        self.entries = []
+        #sorted temporary files of index entries, merged at close.
+        self.runs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    """
+    Stores a game and returns its id.
+    - cb: board in the game's start position, it is left there
+    - moves: the game's Move objects
+    - result: one of RESULTS
+    - tags: dict of PGN tags to keep with the game
+    """
+    def add_game(self, cb, moves, result='*', tags=None):
+        result_index = RESULTS.index(result) if result in RESULTS else RESULTS.index('*')
+        game_id = self.next_id
+        stream = encode_moves(cb, moves)
+        fen = cb.to_fen()
+        fen_bytes = b"" if fen == START_FEN else fen.encode('ascii')
+        tag_text = "\n".join("%s\t%s" % (name, str(value).replace("\n", " ")) for name, value in (tags or {}).items())
+        tag_bytes = tag_text.encode('utf-8')[:0xFFFF]
+        if len(moves) > 0x3FFF:
+            raise ValueError("game too long: %d plies" % len(moves))
+
+        self.offsets.write(OFFSET.pack(self.games.tell()))
+        self.games.write(RECORD.pack(result_index, len(moves), len(fen_bytes), len(tag_bytes), len(stream)))
+        self.games.write(fen_bytes)
+        self.games.write(tag_bytes)
+        self.games.write(stream)
+
+        entries = self.entries
+        info = result_index << 14
+        for ply, move in enumerate(moves):
+            entries.append(ENTRY.pack(cb.key, game_id, ply | info, move_code(move)))
+            cb.make_move(move)
+        entries.append(ENTRY.pack(cb.key, game_id, len(moves) | info, NO_MOVE))
+        for _ in moves:
+            cb.undo_move()
+        if len(entries) >= self.run_entries:
+            self.flush_run()
+        self.next_id += 1
+        return game_id
+
+    """
+    Stores every game of a PGN file or stream (see pgn.read_games), skipping games with an
+    illegal move. Returns (games added, games skipped).
+    """
+    def add_pgn(self, source):
+        from pgn import read_games
+        cb = self.cb
+        added = skipped = 0
+        for game in read_games(source):
+            try:
+                moves = [move for san, move in game.replay(cb)]
+            except ValueError:
+                skipped += 1
+                continue
+            game.setup(cb)
+            self.add_game(cb, moves, game.result, game.headers)
+            added += 1
+        return added, skipped
+
+    def flush_run(self):
+        if not self.entries:
+            return
+        self.entries.sort()
+        run = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(self.path)))
+        run.write(b"".join(self.entries))
+        run.seek(0)
+        self.runs.append(run)
+        self.entries = []
+
+    """
+    Writes the game files out and merges the new positions into the index.
+    """
+    def close(self):
+        self.games.close()
+        self.offsets.close()
+        self.flush_run()
+        index_path = self.path + '.index'
+        sources = [_read_entries(run) for run in self.runs]
+        old = open(index_path, 'rb') if os.path.exists(index_path) else None
+        if old is not None:
+            sources.append(_read_entries(old))
+        if self.runs:
+            with open(index_path + '.tmp', 'wb') as out:
+                block = []
+                for entry in heapq.merge(*sources):
+                    block.append(entry)
+                    if len(block) >= 65536:
+                        out.write(b"".join(block))
+                        block = []
+                out.write(b"".join(block))
+        if old is not None:
+            old.close()
+        for run in self.runs:
+            run.close()
+        if self.runs:
+            os.replace(index_path + '.tmp', index_path)
+        elif old is None:
+            open(index_path, 'wb').close()
+        self.runs = []
+
+def _read_entries(f, block=65536):
+    size = ENTRY.size
+    while True:
+        data = f.read(size*block)
+        if not data:
+            return
+        for i in range(0, len(data), size):
+            yield data[i:i + size]
+
+
+class GameDatabase(object):
+    def __init__(self, path, backend='bitboard'):
+        """ Read-only view of a database, the index and offsets memory-mapped so opening it costs
+            nothing and lookups only touch the pages they search. Use it as a context manager.
+            - positions: number of index entries
+        """
+        self.path = path
+        self.backend = backend
+        self.files = []
+        self.index = self._map(path + '.index')
+        self.offsets = self._map(path + '.offsets')
+        self.games = open(path + '.games', 'rb')
+        self.positions = len(self.index) // ENTRY.size
+        self.count = len(self.offsets) // OFFSET.size
+
+    def _map(self, path):
+        f = open(path, 'rb')
+        self.files.append(f)
+        if os.fstat(f.fileno()).st_size == 0:
+            #mmap refuses empty files.
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for data in (self.index, self.offsets):
+            if isinstance(data, mmap.mmap):
+                data.close()
+        self.index = self.offsets = b""
+        for f in self.files:
+            f.close()
+        self.games.close()
+
+    def __len__(self):
+        return self.count
+
+    """
+    Index of the first entry whose key is not below `key`, by binary search.
+    """
+    def lower_bound(self, key):
+        lo, hi = 0, self.positions
+        data = self.index
+        unpack = KEY.unpack_from
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if unpack(data, mid*ENTRY.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    """
+    Yields (game id, ply, result, move code) for every time a position with this key was reached.
+    """
+    def lookup(self, key):
+        data = self.index
+        i = self.lower_bound(key)
+        while i < self.positions:
+            entry_key, game_id, info, code = ENTRY.unpack_from(data, i*ENTRY.size)
+            if entry_key != key:
+                break
+            yield game_id, info & 0x3FFF, RESULTS[info >> 14], code
+            i += 1
+
+    """
+    Ids of the games that reached the position of cb, in ascending order.
+    """
+    def games_with(self, cb):
+        return sorted(set(game_id for game_id, ply, result, code in self.lookup(cb.key)))
+
+    """
+    MoveStats of every move played from the position of cb, most played first. Index entries whose
+    move isn't legal here, from a key collision, are dropped.
+    """
+    def move_stats(self, cb):
+        stats = collections.OrderedDict()
+        for game_id, ply, result, code in self.lookup(cb.key):
+            if code == NO_MOVE:
+                continue
+            entry = stats.get(code)
+            if entry is None:
+                entry = stats[code] = [0, 0, 0, 0]
+            entry[0] += 1
+            if result != '*':
+                entry[1 + RESULTS.index(result)] += 1
+        if not stats:
+            return []
+        moves = dict((move_code(m), m) for m in legal_moves(cb))
+        found = []
+        for code, (games, white, black, draws) in stats.items():
+            if code not in moves:
+                continue
+            move_stats = MoveStats(moves[code])
+            move_stats.games, move_stats.white, move_stats.black, move_stats.draws = games, white, black, draws
+            found.append(move_stats)
+        found.sort(key=lambda s: -s.games)
+        return found
+
+    """
+    The GameRecord of a game id.
+    """
+    def game(self, game_id):
+        if not 0 <= game_id < self.count:
+            raise IndexError("no game %d" % game_id)
+        offset = OFFSET.unpack_from(self.offsets, game_id*OFFSET.size)[0]
+        self.games.seek(offset)
+        result, plies, fen_length, tags_length, stream_length = RECORD.unpack(self.games.read(RECORD.size))
+        fen = self.games.read(fen_length).decode('ascii') or START_FEN
+        tags = collections.OrderedDict(line.split('\t', 1) for line in
+                                       self.games.read(tags_length).decode('utf-8', 'replace').split('\n') if '\t' in line)
+        return GameRecord(game_id, RESULTS[result], plies, fen, tags, self.games.read(stream_length))
+
+    """
+    Sets cb to the start of a game and returns its moves; cb is left at the start position.
+    """
+    def moves(self, game_id, cb=None):
+        record = self.game(game_id)
+        cb = cb or board_class(self.backend)()
+        cb.set_fen(record.fen)
+        moves = list(decode_moves(cb, record.stream, record.plies))
+        for _ in moves:
+            cb.undo_move()
+        return moves
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query a binary game database.")
+    parser.add_argument('--backend', choices=['list', 'bitboard'], default='bitboard')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="append the games of PGN files")
+    build.add_argument('db', help="database path, without extension")
+    build.add_argument('pgn', nargs='+')
+    query = commands.add_parser('query', help="move statistics of a position")
+    query.add_argument('db')
+    query.add_argument('--fen', help="start position, by default the starting position")
+    query.add_argument('--games', type=int, default=5, help="game headers to list")
+    query.add_argument('moves', nargs='*', help="moves in coordinate notation from the start position")
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        with GameDatabaseWriter(args.db, args.backend) as writer:
+            for path in args.pgn:
+                added, skipped = writer.add_pgn(path)
+                print("%s: %d games added, %d skipped" % (path, added, skipped))
+        print("done in %.2fs" % (time.perf_counter() - start))
+        return 0
+
+    cb = board_class(args.backend).from_fen(args.fen) if args.fen else board_class(args.backend)()
+    for text in args.moves:
+        apply_move(cb, text)
+    with GameDatabase(args.db, args.backend) as db:
+        start = time.perf_counter()
+        stats = db.move_stats(cb)
+        elapsed = time.perf_counter() - start
+        games = db.games_with(cb)
+        print("%d games, %d positions in the database; %d games reached this position (%.0f us)" %
+              (len(db), db.positions, len(games), elapsed * 1e6))
+        for s in stats:
+            print("%-6s %6d games  +%d =%d -%d  %5.1f%%" % (s.move.coordinate_notation(), s.games, s.white, s.draws,
+                                                          s.black, 100*s.score(cb.turn)))
+        for game_id in games[:args.games]:
+            print(db.game(game_id))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+Move ordering for the alpha-beta search. Moves come out of MoveOrderer.moves in stages, each
+generated only when the previous ones failed to cut off:
+    1. the hash move from the transposition table
+    2. captures and promotions that don't lose material, most valuable victim / least valuable
+       attacker first
+    3. the two killer moves of the ply, quiet moves that cut off in sibling nodes
+    4. the remaining quiet moves by history score
+    5. captures that lose material by static exchange evaluation
+Quiet moves are only generated once stage 3 is reached, or earlier when the hash move is quiet.
+The list board has no captures-only generator: it generates all moves once per node and both
+stages pick theirs from that list.
+"""
+
+PIECE_VALUES = {'p': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 0}
+
+KILLER_SLOTS = 2
+#history scores are halved once one of them passes this, so old results fade.
+HISTORY_LIMIT = 1 << 20
+
+"""
+Captures, en-passant captures and promotions, the moves Board.get_captures returns.
+"""
+def is_tactical(move):
+    return (move.piece_captured != "--" and not move.is_castle) or move.is_en_passant or move.pawn_promotion
+
+"""
+Most valuable victim, least valuable attacker: PxQ first, QxP last. Promotions count the new piece.
+"""
+def mvv_lva(move):
+    victim = 'p' if move.is_en_passant else move.piece_captured[1]
+    score = 10*PIECE_VALUES.get(victim, 0) - PIECE_VALUES[move.piece_moved[1]]
+    if move.pawn_promotion:
+        score += 10*PIECE_VALUES[move.promotion]
+    return score
+
+
+class MoveOrderer(object):
+    def __init__(self, max_ply=128):
+        """ Killer and history tables shared by all nodes of a search.
+            - killers: per ply, the last KILLER_SLOTS quiet moves that caused a beta cutoff
+            - history: butterfly table of cutoff scores by side, from square and to square
+        """
+        self.max_ply = max_ply
+        self.clear()
+
+    def clear(self):
+        self.killers = [[None]*KILLER_SLOTS for _ in range(self.max_ply + 1)]
+        self.history = [0]*(2*64*64)
+
+    """
+    Called before each search: killers belong to the previous tree, history is kept but aged.
+    """
+    def new_search(self):
+        self.killers = [[None]*KILLER_SLOTS for _ in range(self.max_ply + 1)]
+        self.history = [h >> 1 for h in self.history]
+
+    @staticmethod
+    def history_index(move):
+        side = 0 if move.piece_moved[0] == 'w' else 4096
+        return side + (move.startrow*8 + move.startcol)*64 + move.endrow*8 + move.endcol
+
+    """
+    Records a move that caused a beta cutoff at `ply` with `depth` plies left; the quiet moves in
+    `tried` were searched before it without cutting off and lose the same history score. Captures
+    are already ordered well by MVV-LVA, so only quiet moves are remembered.
+    """
+    def cutoff(self, move, ply, depth, tried=()):
+        if is_tactical(move):
+            return
+        bonus = depth*depth
+        history = self.history
+        for other in tried:
+            if not is_tactical(other):
+                history[self.history_index(other)] -= bonus
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        i = self.history_index(move)
+        history[i] += bonus
+        if history[i] > HISTORY_LIMIT:
+            self.history = [h >> 1 for h in history]
+
+    """
+    Yields the legal moves of the position in stage order, see the module docstring. The hash move
+    and killers are only played when they are legal here, and then as the generated Move, since
+    they may come from a different position with the same squares.
+    """
+    def moves(self, cb, ply, hash_move=None):
+        captures = cb.get_captures()
+        quiets = None
+        if hash_move is not None:
+            if is_tactical(hash_move):
+                candidates = captures
+            else:
+                quiets = [m for m in cb.get_valid_moves() if not m.is_castle_alias and not is_tactical(m)]
+                candidates = quiets
+            hash_move = candidates[candidates.index(hash_move)] if hash_move in candidates else None
+            if hash_move is not None:
+                yield hash_move
+
+        good = []
+        bad = []
+        for move in captures:
+            if move == hash_move:
+                continue
+            if move.pawn_promotion:
+                (good if move.promotion == 'Q' else bad).append(move)
+            elif (PIECE_VALUES.get(move.piece_captured[1], 100) >= PIECE_VALUES[move.piece_moved[1]] or
+                  cb.see(move) >= 0):
+                good.append(move)
+            else:
+                bad.append(move)
+        good.sort(key=mvv_lva, reverse=True)
+        for move in good:
+            yield move
+
+        if quiets is None:
+            quiets = [m for m in cb.get_valid_moves() if not m.is_castle_alias and not is_tactical(m)]
+        killers = [quiets[quiets.index(k)] for k in self.killers[ply]
+                   if k is not None and k != hash_move and k in quiets]
+        for move in killers:
+            yield move
+
+        history = self.history
+        index = self.history_index
+        rest = [m for m in quiets if m != hash_move and m not in killers]
+        rest.sort(key=lambda m: history[index(m)], reverse=True)
+        for move in rest:
+            yield move
+
+        bad.sort(key=mvv_lva, reverse=True)
+        for move in bad:
+            yield move
@@ -0,0 +1,200 @@
+import argparse
+import multiprocessing
+import sys
+import time
+
+from chess_board import Move
+from chess_cli import board_class
+from search import Searcher, SearchResult, MAX_PLY
+from tt import SharedTranspositionTable
+
+"""
+Lazy SMP: N processes search the same root independently and share one transposition table in
+shared memory. They cooperate only through the table, each finding results the others stored,
+and helpers skip some iterative deepening depths so they tend to run ahead of the main search
+and fill the table with deeper entries. The main process plays the deepest completed result.
+
+    python parallel.py --depth 6 --threads 1,2,4,8
+
+runs the time-to-depth benchmark over the perft positions and prints the speedup per process count.
+"""
+
+#helper i skips depth d when ((d + SKIP_PHASE[i]) // SKIP_SIZE[i]) is odd, so helpers spread over depths.
+SKIP_SIZE = [1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 3, 3, 4, 4, 4, 4, 4, 4, 4, 4]
+SKIP_PHASE = [0, 1, 0, 1, 2, 3, 0, 1, 2, 3, 4, 5, 0, 1, 2, 3, 4, 5, 6, 7]
+
+
+class HelperSearcher(Searcher):
+    def __init__(self, index, stop_event, tt):
+        """ Searcher of a helper process.
+            - index: 1 for the first helper, picks its depth skipping pattern
+            - stop_event: multiprocessing.Event the main process sets when it is done
+        """
+        super(HelperSearcher, self).__init__(tt=tt)
+        self.index = index
+        self.stop_event = stop_event
+
+    def iteration_depths(self, max_depth):
+        i = (self.index - 1) % len(SKIP_SIZE)
+        return [d for d in range(1, max_depth + 1) if d == 1 or ((d + SKIP_PHASE[i]) // SKIP_SIZE[i]) % 2 == 0]
+
+    def check_limits(self):
+        super(HelperSearcher, self).check_limits()
+        if self.stop_event.is_set():
+            self.stopped = True
+
+"""
+Helper process: searches every (snapshot, generation, limits) task from its queue until it gets
+None, putting (index, depth, score, packed pv, nodes) on the result queue. The position comes as a
+ChessBoard Snapshot so the helper sees repetitions of the moves already played.
+"""
+def _helper_main(index, tt_name, hash_mb, backend, tasks, results, stop_event):
+    tt = SharedTranspositionTable(hash_mb, tt_name)
+    searcher = HelperSearcher(index, stop_event, tt)
+    cb = board_class(backend)()
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        snapshot, generation, limits = task
+        cb.restore(snapshot)
+        #search() moves to the next generation, the same one the main process uses.
+        tt.generation = generation
+        result = searcher.search(cb, **limits)
+        if result is None:
+            results.put((index, 0, 0, [], searcher.stats.nodes))
+        else:
+            results.put((index, result.depth, result.score, [m.pack() for m in result.pv], searcher.stats.nodes))
+    tt.close()
+
+
+class ParallelSearcher(object):
+    def __init__(self, threads=None, hash_mb=16, backend='bitboard'):
+        """ Searcher running on `threads` processes (default: one per core), the calling process
+            included, with a shared transposition table of hash_mb megabytes. Helper processes
+            are started once and kept until close(); use it as a context manager.
+        """
+        self.threads = max(threads or multiprocessing.cpu_count(), 1)
+        self.hash_mb = hash_mb
+        self.tt = SharedTranspositionTable(hash_mb)
+        self.searcher = Searcher(tt=self.tt)
+        self.stop_event = multiprocessing.Event()
+        self.results = multiprocessing.Queue()
+        self.helpers = []
+        for index in range(1, self.threads):
+            tasks = multiprocessing.Queue()
+            process = multiprocessing.Process(target=_helper_main, daemon=True,
+                                              args=(index, self.tt.name, hash_mb, backend, tasks, self.results,
+                                                    self.stop_event))
+            process.start()
+            self.helpers.append((process, tasks))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for process, tasks in self.helpers:
+            tasks.put(None)
+        for process, tasks in self.helpers:
+            process.join()
+        self.helpers = []
+        self.tt.close()
+
+    """
+    Asks a running search to finish as soon as possible, for use from another thread.
+    """
+    def stop(self):
+        self.stop_event.set()
+        self.searcher.stop()
+
+    """
+    Searches like Searcher.search, with the helpers running alongside. The node limit and the time
+    manager apply to the main process only; the returned stats count the nodes of all processes.
+    """
+    def search(self, cb, depth=None, movetime=None, nodes=None, info=None, time_manager=None):
+        self.stop_event.clear()
+        snapshot = cb.snapshot()
+        helper_limits = {'depth': depth, 'movetime': movetime}
+        if depth is None and movetime is None:
+            #the main process stops at its default depth or node limit, helpers when it tells them.
+            helper_limits['depth'] = MAX_PLY
+        for process, tasks in self.helpers:
+            tasks.put((snapshot, self.tt.generation, helper_limits))
+        result = self.searcher.search(cb, depth=depth, movetime=movetime, nodes=nodes, info=info,
+                                      time_manager=time_manager)
+        self.stop_event.set()
+
+        best = result
+        total = self.searcher.stats.nodes
+        for _ in self.helpers:
+            index, helper_depth, score, pv, helper_nodes = self.results.get()
+            total += helper_nodes
+            if pv and (best is None or helper_depth > best.depth):
+                moves = [Move.from_packed(code) for code in pv]
+                best = SearchResult(moves[0], score, helper_depth, moves, self.searcher.stats)
+        self.searcher.stats.nodes = total
+        return best
+
+"""
+Time to depth for every process count over a set of positions, with the table cleared before
+each position. Returns a list of (threads, seconds, nodes).
+"""
+def bench(fens, depth, thread_counts, hash_mb=16, backend='bitboard'):
+    rows = []
+    for threads in thread_counts:
+        elapsed = 0.0
+        nodes = 0
+        with ParallelSearcher(threads, hash_mb, backend) as searcher:
+            for fen in fens:
+                searcher.tt.clear()
+                cb = board_class(backend).from_fen(fen)
+                start = time.perf_counter()
+                searcher.search(cb, depth=depth)
+                elapsed += time.perf_counter() - start
+                nodes += searcher.searcher.stats.nodes
+        rows.append((threads, elapsed, nodes))
+    return rows
+
+def main(argv=None):
+    from perft import POSITIONS, write_report
+    parser = argparse.ArgumentParser(description="Lazy SMP time-to-depth benchmark.")
+    parser.add_argument('--depth', type=int, default=5)
+    parser.add_argument('--threads', default=None, help="comma separated process counts, default 1,2,4.. up to the cores")
+    parser.add_argument('--hash', type=int, default=16, help="transposition table size in MB")
+    parser.add_argument('--fen', action='append', help="position to search, may be repeated; default the perft suite")
+    parser.add_argument('--json', help="write a pytest-benchmark style report to this file")
+    args = parser.parse_args(argv)
+
+    if args.threads:
+        counts = [int(t) for t in args.threads.split(',')]
+    else:
+        counts = [1]
+        while counts[-1]*2 <= multiprocessing.cpu_count():
+            counts.append(counts[-1]*2)
+    fens = args.fen or [fen for name, fen, expected in POSITIONS]
+
+    rows = bench(fens, args.depth, counts, args.hash)
+    base = rows[0][1]
+    benchmarks = []
+    for threads, elapsed, nodes in rows:
+        speedup = base / elapsed if elapsed else 0.0
+        print("%3d processes  depth %d  %8.2fs  %10d nodes  %9.0f nps  speedup %5.2f" %
+              (threads, args.depth, elapsed, nodes, nodes / elapsed if elapsed else 0.0, speedup))
+        benchmarks.append({
+            'name': 'lazy_smp[t%d-d%d]' % (threads, args.depth),
+            'fullname': 'parallel.py::lazy_smp[t%d-d%d]' % (threads, args.depth),
+            'group': 'lazy_smp',
+            'params': {'threads': threads, 'depth': args.depth},
+            'stats': {'min': elapsed, 'max': elapsed, 'mean': elapsed, 'median': elapsed, 'rounds': 1,
+                      'iterations': 1, 'total': elapsed, 'ops': 1 / elapsed if elapsed else 0.0},
+            'extra_info': {'nodes': nodes, 'speedup': speedup, 'positions': len(fens)},
+        })
+    if args.json:
+        write_report(args.json, benchmarks)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+import argparse
+import datetime
+import json
+import math
+import platform
+import subprocess
+import sys
+import time
+
+from chess_board import ChessBoard, Move
+from bitboard import BitboardChessBoard, new_move_buffer
+from chess_cli import board_class, legal_moves
+
+"""
+Standard perft reference positions, see https://www.chessprogramming.org/Perft_Results.
+Each entry is (name, fen, expected leaf node counts for depth 1, 2, 3, ...).
+"""
+POSITIONS = [
+    ('startpos', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+     [20, 400, 8902, 197281, 4865609]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     [48, 2039, 97862, 4085603]),
+    ('position3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     [14, 191, 2812, 43238, 674624]),
+    ('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     [6, 264, 9467, 422333]),
+    ('position5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     [44, 1486, 62379, 2103487]),
+    ('position6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     [46, 2079, 89890, 3894594]),
+]
+
+"""
+Counts the leaf nodes of the legal move tree to the given depth.
+"""
+def perft(cb, depth):
+    if depth == 0:
+        return 1
+    if isinstance(cb, BitboardChessBoard):
+        return perft_packed(cb, depth, [new_move_buffer() for _ in range(depth + 1)])
+    moves = legal_moves(cb)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        cb.make_move(move)
+        nodes += perft(cb, depth - 1)
+        cb.undo_move()
+    return nodes
+
+"""
+Perft on packed moves: each ply fills its own preallocated buffer and only the moves that
+are played become Move objects.
+"""
+def perft_packed(cb, depth, buffers):
+    buf = buffers[depth]
+    n = cb.generate_moves(buf)
+    if depth == 1:
+        return n
+    nodes = 0
+    for i in range(n):
+        cb.make_move(Move.from_packed(buf[i]))
+        nodes += perft_packed(cb, depth - 1, buffers)
+        cb.undo_move()
+    return nodes
+
+"""
+Returns the perft count below every root move, keyed by the move in coordinate notation.
+"""
+def divide(cb, depth):
+    counts = {}
+    for move in legal_moves(cb):
+        cb.make_move(move)
+        counts[move.coordinate_notation()] = perft(cb, depth - 1)
+        cb.undo_move()
+    return counts
+
+"""
+Runs perft on one position `rounds` times and returns the timing statistics in the
+layout pytest-benchmark uses, so results can be compared across commits.
+"""
+def bench_position(name, fen, depth, expected=None, rounds=1, board_class=ChessBoard):
+    times = []
+    nodes = 0
+    for _ in range(rounds):
+        cb = board_class.from_fen(fen)
+        start = time.perf_counter()
+        nodes = perft(cb, depth)
+        times.append(time.perf_counter() - start)
+    mean = sum(times) / len(times)
+    stddev = math.sqrt(sum((t - mean)**2 for t in times) / (len(times) - 1)) if len(times) > 1 else 0.0
+    ordered = sorted(times)
+    median = ordered[len(ordered)//2] if len(ordered) % 2 else (ordered[len(ordered)//2 - 1] + ordered[len(ordered)//2]) / 2
+    return {
+        'name': 'perft[%s-%s-d%d]' % (board_class.__name__, name, depth),
+        'fullname': 'perft.py::perft[%s-%s-d%d]' % (board_class.__name__, name, depth),
+        'group': 'perft',
+        'params': {'position': name, 'depth': depth, 'backend': board_class.__name__},
+        'stats': {
+            'min': ordered[0],
+            'max': ordered[-1],
+            'mean': mean,
+            'stddev': stddev,
+            'median': median,
+            'rounds': rounds,
+            'iterations': 1,
+            'total': sum(times),
+            'ops': 1 / mean if mean else 0.0,
+        },
+        'extra_info': {
+            'fen': fen,
+            'nodes': nodes,
+            'expected': expected,
+            'ok': expected is None or nodes == expected,
+            'nps': nodes / mean if mean else 0.0,
+        },
+    }
+
+def machine_info():
+    return {
+        'node': platform.node(),
+        'processor': platform.processor(),
+        'machine': platform.machine(),
+        'python_implementation': platform.python_implementation(),
+        'python_version': platform.python_version(),
+        'system': platform.system(),
+        'release': platform.release(),
+    }
+
+def commit_info():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD'], stderr=subprocess.DEVNULL) != 0
+    except (OSError, subprocess.CalledProcessError):
+        return {}
+    return {'id': commit, 'dirty': dirty}
+
+"""
+Writes benchmarks as a pytest-benchmark style JSON report, with the machine and commit they ran on.
+"""
+def write_report(path, benchmarks):
+    report = {
+        'machine_info': machine_info(),
+        'commit_info': commit_info(),
+        'benchmarks': benchmarks,
+        'datetime': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'version': '1',
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+"""
+Prints the nodes/second change of every benchmark against a previous --json report.
+"""
+def compare(benchmarks, path):
+    with open(path) as f:
+        previous = {b['name']: b for b in json.load(f)['benchmarks']}
+    for b in benchmarks:
+        old = previous.get(b['name'])
+        if old is None:
+            continue
+        old_nps = old['extra_info']['nps']
+        new_nps = b['extra_info']['nps']
+        change = (new_nps - old_nps) / old_nps * 100 if old_nps else 0.0
+        print("%-24s %12.0f -> %12.0f nps (%+.1f%%)" % (b['name'], old_nps, new_nps, change))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft node counts and move generation throughput.")
+    parser.add_argument('--depth', type=int, default=3, help="search depth (capped by the known reference counts)")
+    parser.add_argument('--position', action='append', help="reference position name, may be repeated")
+    parser.add_argument('--fen', help="run a custom position instead of the reference suite")
+    parser.add_argument('--backend', choices=['bitboard', 'list'], default='list', help="board implementation to run")
+    parser.add_argument('--divide', action='store_true', help="print the node count below every root move")
+    parser.add_argument('--rounds', type=int, default=1, help="timed repetitions per position")
+    parser.add_argument('--json', help="write a pytest-benchmark style report to this file")
+    parser.add_argument('--compare', help="compare nodes/second with an earlier --json report")
+    args = parser.parse_args(argv)
+
+    if args.fen:
+        positions = [('custom', args.fen, [])]
+    else:
+        positions = [p for p in POSITIONS if not args.position or p[0] in args.position]
+        if not positions:
+            parser.error("unknown position, choose from: " + ", ".join(p[0] for p in POSITIONS))
+
+    if args.divide:
+        for name, fen, counts in positions:
+            cb = board_class(args.backend).from_fen(fen)
+            result = divide(cb, args.depth)
+            print(name)
+            for move in sorted(result):
+                print("  %s: %d" % (move, result[move]))
+            print("  total: %d" % sum(result.values()))
+        return 0
+
+    benchmarks = []
+    failed = False
+    for name, fen, counts in positions:
+        depth = min(args.depth, len(counts)) if counts else args.depth
+        expected = counts[depth-1] if counts else None
+        b = bench_position(name, fen, depth, expected, args.rounds, board_class(args.backend))
+        benchmarks.append(b)
+        info = b['extra_info']
+        status = "ok" if expected is None or info['ok'] else "MISMATCH (expected %d)" % expected
+        print("%-10s depth %d %10d nodes %8.3fs %10.0f nps  %s" %
+              (name, depth, info['nodes'], b['stats']['mean'], info['nps'], status))
+        failed = failed or not info['ok']
+
+    if args.json:
+        write_report(args.json, benchmarks)
+    if args.compare:
+        compare(benchmarks, args.compare)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
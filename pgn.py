@@ -0,0 +1,409 @@
+import argparse
+import collections
+import concurrent.futures
+import os
+import re
+import sys
+import time
+
+from chess_board import Move, START_FEN
+from chess_cli import board_class, legal_moves
+
+"""
+PGN (Portable Game Notation) reading and writing, with moves in SAN (Standard Algebraic Notation).
+
+read_games streams a file game by game, keeping only the current game's text in memory, and
+PgnGame.replay plays its main line on a board, parsing each SAN move against the legal moves of
+the position. For archives of millions of games, map_games splits the file into byte ranges that
+start on game boundaries and replays them on a process pool:
+
+    python pgn.py games.pgn --workers 8
+    python pgn.py games.pgn --export > normalised.pgn
+"""
+
+#tag pairs: [Name "value"], quotes and backslashes inside the value escaped with a backslash.
+#Up to the last quote, since some writers don't escape them.
+TAG = re.compile(r'\[\s*(\w+)\s+"(.*)"\s*\]')
+#movetext tokens: comments, variation brackets, NAGs, move numbers and everything else (moves, results).
+TOKEN = re.compile(r'\{[^}]*\}?|;[^\n]*|[()]|\$\d+|\d+\.+|[^\s(){};$]+')
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+#the seven tag roster, written first and in this order.
+ROSTER = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+#bytes of file per map_games task.
+SHARD_BYTES = 4 << 20
+
+
+"""
+SAN of a legal move in the current position, with disambiguation and check or mate marks.
+- moves: the legal moves of the position, when the caller already has them
+"""
+def san(cb, move, moves=None):
+    if move.is_castle:
+        #the UI aliases land the king on the rook square, the side is what tells them apart.
+        text = 'O-O' if move.endcol > move.startcol else 'O-O-O'
+    else:
+        dest = Move.col_to_file[move.endcol] + Move.row_to_rank[move.endrow]
+        capture = move.piece_captured != "--" or move.is_en_passant
+        piece = move.piece_moved[1]
+        if piece == 'p':
+            text = Move.col_to_file[move.startcol] + 'x' + dest if capture else dest
+            if move.pawn_promotion:
+                text += '=' + move.promotion
+        else:
+            if moves is None:
+                moves = legal_moves(cb)
+            others = [m for m in moves if m.piece_moved == move.piece_moved and m.endrow == move.endrow and
+                      m.endcol == move.endcol and (m.startrow != move.startrow or m.startcol != move.startcol)]
+            origin = ''
+            if others:
+                if all(m.startcol != move.startcol for m in others):
+                    origin = Move.col_to_file[move.startcol]
+                elif all(m.startrow != move.startrow for m in others):
+                    origin = Move.row_to_rank[move.startrow]
+                else:
+                    origin = Move.col_to_file[move.startcol] + Move.row_to_rank[move.startrow]
+            text = piece + origin + ('x' if capture else '') + dest
+    cb.make_move(move)
+    cb.load_attack_maps()
+    if cb.in_check:
+        text += '#' if not legal_moves(cb) else '+'
+    cb.undo_move()
+    cb.load_attack_maps()
+    return text
+
+"""
+Finds the legal move a SAN string stands for. Check marks and annotations (!, ?) are ignored,
+castling may be written with zeros. Raises ValueError for an illegal or ambiguous move.
+- moves: the legal moves of the position, when the caller already has them
+"""
+def parse_san(cb, text, moves=None):
+    if moves is None:
+        moves = legal_moves(cb)
+    token = text.rstrip('+#!?')
+    if token in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        col = 6 if len(token) == 3 else 2
+        for move in moves:
+            if move.is_castle and move.endcol == col:
+                return move
+        raise ValueError("illegal move: %s" % text)
+
+    promotion = None
+    if '=' in token:
+        token, promotion = token.split('=', 1)
+    elif len(token) > 2 and token[-1] in 'NBRQ' and token[0].islower():
+        #e8Q, the promotion written without '='.
+        token, promotion = token[:-1], token[-1]
+    if promotion is not None and promotion not in ('N', 'B', 'R', 'Q'):
+        raise ValueError("invalid promotion in move: %s" % text)
+    dest = token[-2:]
+    if len(dest) != 2 or dest[0] not in Move.file_to_col or dest[1] not in Move.rank_to_row:
+        raise ValueError("invalid move: %s" % text)
+    endrow, endcol = Move.rank_to_row[dest[1]], Move.file_to_col[dest[0]]
+    origin = token[:-2].replace('x', '').replace('-', '').replace(':', '')
+    piece = 'p'
+    if origin and origin[0] in 'NBRQK':
+        piece, origin = origin[0], origin[1:]
+    startrow = startcol = None
+    for c in origin:
+        if c in Move.file_to_col:
+            startcol = Move.file_to_col[c]
+        elif c in Move.rank_to_row:
+            startrow = Move.rank_to_row[c]
+        else:
+            raise ValueError("invalid move: %s" % text)
+
+    found = None
+    for move in moves:
+        if (move.endrow != endrow or move.endcol != endcol or move.piece_moved[1] != piece or move.is_castle or
+                (startcol is not None and move.startcol != startcol) or
+                (startrow is not None and move.startrow != startrow)):
+            continue
+        if (move.promotion if move.pawn_promotion else None) != promotion:
+            continue
+        if found is not None:
+            raise ValueError("ambiguous move: %s" % text)
+        found = move
+    if found is None:
+        raise ValueError("illegal move: %s" % text)
+    return found
+
+"""
+Yields the main line tokens of a movetext: the SAN moves, then the result if there is one.
+Comments, NAGs, move numbers and variations are skipped.
+"""
+def main_line(movetext):
+    depth = 0
+    for token in TOKEN.findall(movetext):
+        c = token[0]
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth = max(depth - 1, 0)
+        elif depth or c in '{;$' or (c.isdigit() and token[-1] == '.'):
+            continue
+        else:
+            yield token
+
+
+class PgnGame(object):
+    def __init__(self, headers, movetext, offset=None):
+        """ One game of a PGN file, its moves still as text until replayed.
+            - headers: dict of tag name to value, in file order
+            - movetext: the move text, comments and variations included
+            - offset: byte offset of the game in its file, None when read from text
+        """
+        self.headers = headers
+        self.movetext = movetext
+        self.offset = offset
+
+    @property
+    def result(self):
+        return self.headers.get('Result', '*')
+
+    """
+    Sets cb up for the start of the game: the FEN tag's position, or the starting position.
+    """
+    def setup(self, cb):
+        cb.set_fen(self.headers.get('FEN', START_FEN))
+
+    """
+    SAN moves of the main line, without the result.
+    """
+    def sans(self):
+        return [token for token in main_line(self.movetext) if token not in RESULTS]
+
+    """
+    Plays the main line on cb from the start of the game, yielding (san, move) for each move
+    while cb still holds the position before it; the move is made when the generator resumes.
+    Raises ValueError, with the move number, on the first move that isn't legal.
+    """
+    def replay(self, cb):
+        self.setup(cb)
+        for token in main_line(self.movetext):
+            if token in RESULTS:
+                break
+            try:
+                move = parse_san(cb, token)
+            except ValueError as e:
+                raise ValueError("move %d%s: %s" % (cb.fullmove_number, '.' if cb.turn else '...', e))
+            yield token, move
+            cb.make_move(move)
+
+    def __str__(self):
+        return "%s - %s %s" % (self.headers.get('White', '?'), self.headers.get('Black', '?'), self.result)
+
+"""
+Streams the games of a PGN file, yielding a PgnGame per game with only that game held in memory.
+- source: a path, a file opened in binary or text mode, or any iterable of lines
+- start, end: byte range of the file to read when source is a path; only the games starting
+  in it are read, so start must be a game boundary, see game_boundary
+"""
+def read_games(source, start=0, end=None):
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            f.seek(start)
+            for game in read_games(f, start, end):
+                yield game
+        return
+    headers = collections.OrderedDict()
+    lines = []
+    game_offset = None
+    #a tag line starts a new game after movetext, or after the blank line ending the tags.
+    in_movetext = False
+    offset = start
+    for line in source:
+        line_offset = offset
+        if isinstance(line, bytes):
+            offset += len(line)
+            line = line.decode('utf-8', 'replace')
+        else:
+            line_offset = None
+        text = line.strip()
+        if text.startswith('['):
+            if in_movetext:
+                yield PgnGame(headers, "\n".join(lines), game_offset)
+                headers = collections.OrderedDict()
+                lines = []
+                game_offset = None
+                in_movetext = False
+            if game_offset is None and not headers:
+                if end is not None and line_offset is not None and line_offset >= end:
+                    return
+                game_offset = line_offset
+            match = TAG.match(text)
+            if match:
+                headers[match.group(1)] = re.sub(r'\\(.)', r'\1', match.group(2))
+        elif not text:
+            if headers or lines:
+                in_movetext = True
+        elif text[0] != '%':
+            if not headers and not lines and end is not None and line_offset is not None and line_offset >= end:
+                return
+            in_movetext = True
+            lines.append(text)
+    if headers or lines:
+        yield PgnGame(headers, "\n".join(lines), game_offset)
+
+"""
+Offset of the first game starting at or after `offset` in a binary file, or the file size: the
+first tag line that follows a line which isn't a tag.
+"""
+def game_boundary(f, offset):
+    f.seek(offset)
+    if offset > 0:
+        #the partial line we landed in, and its kind is unknown, so a tag line next doesn't count.
+        f.readline()
+        previous_tag = True
+    else:
+        previous_tag = False
+    while True:
+        position = f.tell()
+        line = f.readline()
+        if not line:
+            return position
+        is_tag = line.lstrip().startswith(b'[')
+        if is_tag and not previous_tag:
+            return position
+        previous_tag = is_tag
+
+"""
+Splits a PGN file into (start, end) byte ranges of about shard_bytes, each starting on a game.
+"""
+def shard_ranges(path, shard_bytes=SHARD_BYTES):
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for offset in range(shard_bytes, size, shard_bytes):
+            bound = game_boundary(f, max(offset, bounds[-1]))
+            if bound > bounds[-1]:
+                bounds.append(bound)
+    bounds.append(size)
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1) if bounds[i] < bounds[i + 1]]
+
+"""
+Default per-game function of map_games: (result, plies, error message or None).
+"""
+def game_summary(cb, game):
+    plies = 0
+    try:
+        for san_text, move in game.replay(cb):
+            plies += 1
+    except ValueError as e:
+        return game.result, plies, "%s: %s" % (game, e)
+    return game.result, plies, None
+
+def _map_range(path, start, end, func, backend):
+    cb = board_class(backend)()
+    return [func(cb, game) for game in read_games(path, start, end)]
+
+"""
+Applies func(board, game) to every game of a PGN file on a process pool and yields the results
+in file order. Every worker reads its byte ranges of the file itself, so only results cross
+process boundaries; func must be a module-level function so it pickles.
+- workers: processes, by default one per core; 1 runs in this process
+- shard_bytes: bytes of file per task, results of a task are held until it is yielded
+"""
+def map_games(path, func=game_summary, workers=None, shard_bytes=SHARD_BYTES, backend='bitboard'):
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        cb = board_class(backend)()
+        for game in read_games(path):
+            yield func(cb, game)
+        return
+    ranges = iter(shard_ranges(path, shard_bytes))
+    pending = collections.deque()
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        while True:
+            while len(pending) < 2*workers:
+                span = next(ranges, None)
+                if span is None:
+                    break
+                pending.append(pool.submit(_map_range, path, span[0], span[1], func, backend))
+            if not pending:
+                break
+            for result in pending.popleft().result():
+                yield result
+
+"""
+PGN text of a game: the headers (seven tag roster first), then the moves in SAN from cb's
+position, numbered and wrapped at 80 columns. cb is left as it was.
+"""
+def write_game(cb, moves, headers=None, result=None):
+    headers = dict(headers or {})
+    result = result or headers.get('Result', '*')
+    headers['Result'] = result
+    if cb.to_fen() != START_FEN:
+        headers.setdefault('SetUp', '1')
+        headers['FEN'] = cb.to_fen()
+    lines = []
+    for name in ROSTER:
+        lines.append('[%s "%s"]' % (name, headers.get(name, '?').replace('\\', '\\\\').replace('"', '\\"')))
+    for name, value in headers.items():
+        if name not in ROSTER:
+            lines.append('[%s "%s"]' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')))
+    lines.append('')
+
+    tokens = []
+    made = 0
+    for move in moves:
+        #a move number stays on the line of its move.
+        if cb.turn:
+            tokens.append('%d. %s' % (cb.fullmove_number, san(cb, move)))
+        elif made == 0:
+            tokens.append('%d... %s' % (cb.fullmove_number, san(cb, move)))
+        else:
+            tokens.append(san(cb, move))
+        cb.make_move(move)
+        made += 1
+    for _ in range(made):
+        cb.undo_move()
+    tokens.append(result)
+
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 80:
+            lines.append(line)
+            line = token
+        else:
+            line = line + ' ' + token if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay the games of a PGN file.")
+    parser.add_argument('path', help="PGN file")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--backend', choices=['list', 'bitboard'], default='bitboard')
+    parser.add_argument('--export', action='store_true', help="write every game back out with normalised SAN")
+    args = parser.parse_args(argv)
+
+    if args.export:
+        cb = board_class(args.backend)()
+        for game in read_games(args.path):
+            try:
+                moves = [move for san_text, move in game.replay(cb)]
+            except ValueError as e:
+                print("skipped %s: %s" % (game, e), file=sys.stderr)
+                continue
+            game.setup(cb)
+            print(write_game(cb, moves, game.headers))
+        return 0
+
+    start = time.perf_counter()
+    games = plies = errors = 0
+    results = collections.Counter()
+    for result, game_plies, error in map_games(args.path, workers=args.workers, backend=args.backend):
+        games += 1
+        plies += game_plies
+        results[result] += 1
+        if error is not None:
+            errors += 1
+            print("error %s" % error, file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    print("%d games %d plies %d errors in %.2fs, %.1f games/s %.0f plies/s" %
+          (games, plies, errors, elapsed, games / elapsed if elapsed else 0.0, plies / elapsed if elapsed else 0.0))
+    print(" ".join("%s %d" % (result, results[result]) for result in RESULTS if results[result]))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
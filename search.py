@@ -0,0 +1,345 @@
+import time
+
+from chess_board import Move, FIFTY_MOVE_PLIES
+from evaluation import evaluate
+from tt import TranspositionTable, EXACT, LOWER, UPPER
+from ordering import MoveOrderer, PIECE_VALUES, mvv_lva
+
+"""
+Negamax alpha-beta search with iterative deepening and aspiration windows on top of the
+ChessBoard API (get_valid_moves, make_move, undo_move). Works with either board backend.
+Leaves are resolved by a quiescence search over captures, see Searcher.quiesce.
+Scores are in centipawns from the side to move's point of view.
+"""
+
+INFINITY = 1000000
+MATE = 100000
+#scores beyond this are mate scores, MATE - plies to mate.
+MATE_BOUND = MATE - 1000
+MAX_PLY = 128
+#first aspiration window half-width around the previous iteration's score.
+ASPIRATION_WINDOW = 50
+#how often (in nodes) the time and node limits are checked.
+CHECK_EVERY = 1024
+#on a clock a few milliseconds matter, perf_counter() is cheap next to a node.
+CLOCK_CHECK_EVERY = 128
+#delta pruning: a capture is skipped when even winning the captured piece plus this margin
+#can't lift the static score to alpha.
+DELTA_MARGIN = 200
+
+
+class SearchStats(object):
+    def __init__(self):
+        """ Counters for one search.
+            - nodes: positions visited
+            - cutoffs: beta cutoffs, first_move_cutoffs: those caused by the first move searched
+            - iteration_nodes: total nodes after each completed depth
+        """
+        self.nodes = 0
+        #nodes visited by quiescence search, part of nodes.
+        self.qnodes = 0
+        self.see_pruned = 0
+        self.delta_pruned = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.tt_cutoffs = 0
+        self.aspiration_researches = 0
+        self.iteration_nodes = []
+        self.start_time = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def nps(self):
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.0
+
+    """
+    Effective branching factor: how many times more nodes the last depth took than the one before.
+    """
+    @property
+    def branching_factor(self):
+        if len(self.iteration_nodes) < 2:
+            return 0.0
+        previous = self.iteration_nodes[-2]
+        last = self.iteration_nodes[-1] - previous
+        return last / previous if previous else 0.0
+
+    """
+    Share of beta cutoffs produced by the first move tried, a measure of move ordering quality.
+    """
+    @property
+    def ordering(self):
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def __str__(self):
+        return ("nodes %d qnodes %d time %.3fs nps %.0f cutoffs %d tt cutoffs %d ordering %.2f ebf %.2f" %
+                (self.nodes, self.qnodes, self.elapsed, self.nps, self.cutoffs, self.tt_cutoffs, self.ordering,
+                 self.branching_factor))
+
+
+class SearchResult(object):
+    def __init__(self, best_move, score, depth, pv, stats):
+        self.best_move = best_move
+        self.score = score
+        self.depth = depth
+        #principal variation, a list of Move objects starting with best_move.
+        self.pv = pv
+        self.stats = stats
+
+    def __str__(self):
+        return "depth %d score %d pv %s" % (self.depth, self.score, " ".join(str(m) for m in self.pv))
+
+
+"""
+Mate scores are stored relative to the position instead of the root, so a transposition
+reached at another ply still reports the right distance to mate.
+"""
+def score_to_tt(score, ply):
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+def score_from_tt(score, ply):
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+class Searcher(object):
+    def __init__(self, evaluate=evaluate, tt=None, hash_mb=16):
+        """ Alpha-beta searcher, reusable across searches.
+            - evaluate: static evaluation function of a board, side to move's point of view
+            - tt: TranspositionTable to use, by default a new one of hash_mb megabytes
+        """
+        self.evaluate = evaluate
+        self.tt = tt if tt is not None else TranspositionTable(hash_mb)
+        self.ordering = MoveOrderer(MAX_PLY)
+        self.stopped = False
+
+    """
+    Asks a running search to finish as soon as possible, for use from another thread.
+    """
+    def stop(self):
+        self.stopped = True
+
+    """
+    Searches the position to the given limits and returns a SearchResult for the deepest
+    completed iteration. Without any limit the search stops at depth 5. A search stopped before
+    depth 1 completes returns the first ordered legal move at depth 0, with no meaningful score.
+    - depth: maximum depth in plies
+    - movetime: seconds to think
+    - nodes: maximum number of nodes
+    - info: called with the SearchResult of every completed iteration
+    - time_manager: timeman.TimeManager of a game on a clock, it decides when to stop
+    """
+    def search(self, cb, depth=None, movetime=None, nodes=None, info=None, time_manager=None):
+        if depth is None and movetime is None and nodes is None and time_manager is None:
+            depth = 5
+        self.cb = cb
+        self.stats = SearchStats()
+        self.stopped = False
+        self.deadline = self.stats.start_time + movetime if movetime is not None else None
+        self.node_limit = nodes
+        self.time_manager = time_manager
+        self.check_every = CHECK_EVERY
+        if time_manager is not None:
+            time_manager.start(self.stats.start_time)
+            self.check_every = CLOCK_CHECK_EVERY
+        self.next_check = self.check_every
+        self.pv_table = [[] for _ in range(MAX_PLY + 1)]
+        self.root_pv = []
+        self.tt.new_search()
+        self.ordering.new_search()
+
+        result = None
+        score = 0
+        max_depth = min(depth, MAX_PLY) if depth is not None else MAX_PLY
+        for d in self.iteration_depths(max_depth):
+            score = self.aspiration(d, score)
+            #an interrupted iteration scored only part of the root moves, it is never reported.
+            if self.stopped:
+                break
+            self.root_pv = self.pv_table[0][:]
+            self.stats.iteration_nodes.append(self.stats.nodes)
+            self.stats.elapsed = time.perf_counter() - self.stats.start_time
+            result = SearchResult(self.root_pv[0] if self.root_pv else None, score, d, self.root_pv, self.stats)
+            if info is not None:
+                info(result)
+            if not self.root_pv or abs(score) >= MATE_BOUND:
+                break
+            if time_manager is not None and time_manager.iteration_done(result.best_move):
+                break
+        if result is None and self.stopped:
+            #stopped before depth 1 completed: the first ordered legal move, at depth 0 and without info.
+            first = next(self.ordering.moves(cb, 0), None)
+            if first is not None:
+                result = SearchResult(first, 0, 0, [first], self.stats)
+        self.stats.elapsed = time.perf_counter() - self.stats.start_time
+        return result
+
+    """
+    Depths iterative deepening goes through, parallel helpers skip some of them.
+    """
+    def iteration_depths(self, max_depth):
+        return range(1, max_depth + 1)
+
+    """
+    Searches a narrow window around the previous score first and widens it on a fail high/low.
+    """
+    def aspiration(self, depth, previous):
+        if depth < 4 or abs(previous) >= MATE_BOUND:
+            return self.negamax(depth, -INFINITY, INFINITY, 0)
+        delta = ASPIRATION_WINDOW
+        alpha, beta = previous - delta, previous + delta
+        while True:
+            score = self.negamax(depth, alpha, beta, 0)
+            if self.stopped:
+                return score
+            if score <= alpha:
+                alpha = max(score - delta, -INFINITY)
+            elif score >= beta:
+                beta = min(score + delta, INFINITY)
+            else:
+                return score
+            self.stats.aspiration_researches += 1
+            delta *= 2
+
+    def check_limits(self):
+        self.next_check = self.stats.nodes + self.check_every
+        deadline = self.deadline
+        if self.time_manager is not None and self.time_manager.hard_deadline is not None:
+            hard = self.time_manager.hard_deadline
+            deadline = hard if deadline is None else min(deadline, hard)
+        if deadline is not None and time.perf_counter() >= deadline:
+            self.stopped = True
+        if self.node_limit is not None and self.stats.nodes >= self.node_limit:
+            self.stopped = True
+
+    def negamax(self, depth, alpha, beta, ply):
+        stats = self.stats
+        stats.nodes += 1
+        if stats.nodes >= self.next_check:
+            self.check_limits()
+        if self.stopped:
+            return 0
+        self.pv_table[ply] = []
+        cb = self.cb
+        if ply > 0:
+            #one repetition is enough below the root: if going back was best once, it is best again.
+            if cb.key_counts[cb.key] > 1 or (cb.phase <= 2 and cb.insufficient_material()):
+                return 0
+            if cb.halfmove_clock >= FIFTY_MOVE_PLIES:
+                #mate on the last move of the fifty still counts, so a check without escape is lost.
+                if cb.is_check() and not cb.get_valid_moves():
+                    return -(MATE - ply)
+                return 0
+        if ply >= MAX_PLY:
+            return self.evaluate(cb)
+        if depth <= 0:
+            #the node was counted above, quiesce counts only the positions below it.
+            stats.nodes -= 1
+            return self.quiesce(alpha, beta, ply)
+
+        hash_move = None
+        entry = self.tt.probe(cb.key)
+        if entry is not None:
+            code, tt_score, tt_depth, bound = entry
+            if code:
+                hash_move = Move.from_packed(code)
+            #the root always searches, so it has a move and a principal variation to report.
+            if ply > 0 and tt_depth >= depth:
+                tt_score = score_from_tt(tt_score, ply)
+                if (bound == EXACT or (bound == LOWER and tt_score >= beta) or
+                        (bound == UPPER and tt_score <= alpha)):
+                    stats.tt_cutoffs += 1
+                    return tt_score
+
+        alpha_start = alpha
+        best_move = None
+        first = True
+        #moves searched here before a cutoff, their history score drops.
+        tried = []
+        for move in self.ordering.moves(cb, ply, hash_move):
+            cb.make_move(move)
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            cb.undo_move()
+            if self.stopped:
+                return 0
+            if score > alpha:
+                alpha = score
+                best_move = move
+                self.pv_table[ply] = [move] + self.pv_table[ply + 1]
+                if score >= beta:
+                    stats.cutoffs += 1
+                    if first:
+                        stats.first_move_cutoffs += 1
+                    self.ordering.cutoff(move, ply, depth, tried)
+                    self.tt.store(cb.key, move.pack(), score_to_tt(score, ply), depth, LOWER)
+                    return score
+            first = False
+            tried.append(move)
+        if first:
+            #no legal move at all.
+            return -(MATE - ply) if cb.in_check else 0
+        bound = EXACT if alpha > alpha_start else UPPER
+        self.tt.store(cb.key, best_move.pack() if best_move is not None else 0, score_to_tt(alpha, ply), depth, bound)
+        return alpha
+
+    """
+    Searches captures and promotions only until the position is quiet, so a leaf is never scored
+    in the middle of an exchange. The side to move may stand pat on the static evaluation; in check
+    every evasion is searched instead. Captures that lose material by static exchange evaluation,
+    and those that can't reach alpha even by winning the piece (delta pruning), are skipped.
+    """
+    def quiesce(self, alpha, beta, ply):
+        stats = self.stats
+        stats.nodes += 1
+        stats.qnodes += 1
+        if stats.nodes >= self.next_check:
+            self.check_limits()
+        if self.stopped:
+            return 0
+        cb = self.cb
+        if ply >= MAX_PLY:
+            return self.evaluate(cb)
+
+        if cb.is_check():
+            moves = [m for m in cb.get_valid_moves() if not m.is_castle_alias]
+            if not moves:
+                return -(MATE - ply)
+            stand_pat = None
+        else:
+            stand_pat = self.evaluate(cb)
+            if stand_pat >= beta:
+                return stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+            moves = cb.get_captures()
+
+        moves.sort(key=mvv_lva, reverse=True)
+        for move in moves:
+            if stand_pat is not None:
+                if move.pawn_promotion and move.promotion != 'Q':
+                    continue
+                gain = PIECE_VALUES['p'] if move.is_en_passant else PIECE_VALUES.get(move.piece_captured[1], 0)
+                if move.pawn_promotion:
+                    gain += PIECE_VALUES['Q'] - PIECE_VALUES['p']
+                if stand_pat + gain + DELTA_MARGIN <= alpha:
+                    stats.delta_pruned += 1
+                    continue
+                if not move.pawn_promotion and cb.see(move) < 0:
+                    stats.see_pruned += 1
+                    continue
+            cb.make_move(move)
+            score = -self.quiesce(-beta, -alpha, ply + 1)
+            cb.undo_move()
+            if self.stopped:
+                return 0
+            if score > alpha:
+                alpha = score
+                if score >= beta:
+                    return score
+        return alpha
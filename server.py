@@ -0,0 +1,462 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import os
+import random
+import sys
+import time
+
+from chess_cli import board_class, legal_moves
+
+"""
+Asyncio game server: many concurrent games (sessions) in one process behind a line protocol over
+TCP. A request is one line, its reply one line starting with "ok" or "error"; replies come in
+request order, so clients may pipeline. Sessions are plain ChessBoards shared by all connections,
+moves are checked against get_valid_moves, and engine moves are searched on a process pool so
+they never hold up the event loop. Once a game is over, by mate or by a draw rule, `move` and
+`go` are refused.
+
+    new [<fen>]                 -> ok <session>
+    moves <session>             -> ok <move> <move> ...
+    move <session> <move>       -> ok <move> [<result> <reason>]
+                                   moves in coordinate notation, e.g. e7e8q; result and reason
+                                   follow when the move ends the game, as in `result`
+    undo <session>              -> ok
+    fen <session>               -> ok <fen>
+    result <session>            -> ok * | ok <result> <reason>, e.g. ok 1/2-1/2 threefold repetition
+    go <session> [depth <n>] [movetime <s>] [nodes <n>]
+                                -> ok <move> score <cp> depth <n> nodes <n> [<result> <reason>],
+                                   the move is played
+    stats [<session>]           -> ok requests <n> errors <n> mean <us> p50 <us> p99 <us> max <us>
+    close <session>             -> ok
+    ping                        -> ok
+    quit                        -> ok, then the connection is closed
+
+    python server.py --port 7000
+    python server.py --bench --sessions 2000 --plies 40 --connections 8
+
+The --bench mode starts a server and drives it with LineClient, a local client stand-in, and
+reports move requests per second and latency.
+"""
+
+#latencies kept per session for the percentiles of `stats`.
+LATENCY_SAMPLES = 1024
+MAX_SESSIONS = 100000
+#search limits of `go` without any.
+DEFAULT_DEPTH = 4
+#bytes buffered for a connection before replies wait for the client to read.
+WRITE_BUFFER = 1 << 16
+
+#warm per-process engine state, set by _init_engine.
+_engine_board = None
+_engine_searcher = None
+
+
+class Session(object):
+    def __init__(self, session_id, cb):
+        """ One game.
+            - latencies: seconds taken by its last LATENCY_SAMPLES requests
+            - thinking: an engine search for it is running, moves are refused meanwhile
+        """
+        self.session_id = session_id
+        self.cb = cb
+        self.requests = 0
+        self.errors = 0
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.thinking = False
+        #coordinate notation to Move for the current position, None until asked for.
+        self._moves = None
+
+    """
+    Legal moves of the position by coordinate notation, generated once per position.
+    """
+    def moves(self):
+        if self._moves is None:
+            self._moves = dict((m.coordinate_notation(), m) for m in legal_moves(self.cb))
+        return self._moves
+
+    """
+    (result, reason) of ChessBoard.game_result once the game is over, None before.
+    """
+    def result(self):
+        return self.cb.game_result(list(self.moves().values()))
+
+    def make_move(self, move):
+        self.cb.make_move(move)
+        self._moves = None
+
+    def undo_move(self):
+        self.cb.undo_move()
+        self._moves = None
+
+"""
+Summary of a list of latencies in seconds: (mean, p50, p99, max) in microseconds.
+"""
+def latency_summary(samples):
+    if not samples:
+        return 0.0, 0.0, 0.0, 0.0
+    ordered = sorted(samples)
+    n = len(ordered)
+    return (1e6*sum(ordered)/n, 1e6*ordered[n // 2], 1e6*ordered[min(n - 1, n*99 // 100)], 1e6*ordered[-1])
+
+def _init_engine(backend, hash_mb):
+    global _engine_board, _engine_searcher
+    from search import Searcher
+    _engine_board = board_class(backend)()
+    _engine_searcher = Searcher(hash_mb=hash_mb)
+
+"""
+Engine process side: searches a position Snapshot, which carries the keys repetitions are seen
+by, and returns (move, score, depth, nodes), move None when there is no legal move.
+"""
+def _engine_search(snapshot, limits):
+    _engine_board.restore(snapshot)
+    result = _engine_searcher.search(_engine_board, **limits)
+    if result is None or result.best_move is None:
+        return None, 0, 0, _engine_searcher.stats.nodes
+    return result.best_move.coordinate_notation(), result.score, result.depth, result.stats.nodes
+
+
+class GameServer(object):
+    def __init__(self, engine_workers=None, hash_mb=16, max_sessions=MAX_SESSIONS, backend='list'):
+        """ Sessions and request handling, independent of the transport; see serve().
+            - engine_workers: processes of the engine pool, started on the first `go`
+            - backend: board of the sessions and the engine processes, 'bitboard' generates moves
+              and searches faster
+            - latencies: seconds taken by the last requests of all sessions
+        """
+        self.sessions = {}
+        self.next_id = 1
+        self.max_sessions = max_sessions
+        self.engine_workers = engine_workers or os.cpu_count() or 1
+        self.hash_mb = hash_mb
+        self.backend = backend
+        self.board_class = board_class(backend)
+        self.pool = None
+        self.requests = 0
+        self.errors = 0
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES*16)
+        self.commands = {'new': self.cmd_new, 'moves': self.cmd_moves, 'move': self.cmd_move, 'undo': self.cmd_undo,
+                         'fen': self.cmd_fen, 'result': self.cmd_result, 'stats': self.cmd_stats, 'close': self.cmd_close, 'ping': self.cmd_ping}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
+
+    def session(self, args):
+        if not args:
+            raise ValueError("missing session")
+        try:
+            return self.sessions[int(args[0])]
+        except (ValueError, KeyError):
+            raise ValueError("unknown session %s" % args[0])
+
+    """
+    Handles one request line and returns the reply line, without the newline.
+    """
+    async def execute(self, line):
+        start = time.perf_counter()
+        tokens = line.split()
+        session = None
+        try:
+            if not tokens:
+                raise ValueError("empty request")
+            command, args = tokens[0].lower(), tokens[1:]
+            if command in ('new', 'stats', 'ping'):
+                reply = self.commands[command](args)
+            else:
+                session = self.session(args)
+                if command == 'go':
+                    reply = await self.cmd_go(session, args[1:])
+                elif command in self.commands:
+                    reply = self.commands[command](session, args[1:])
+                else:
+                    raise ValueError("unknown command %s" % command)
+        except ValueError as e:
+            reply = "error %s" % e
+        except Exception as e:
+            #a failing command must not end the connection, let alone the other sessions.
+            reply = "error %s: %s" % (type(e).__name__, e)
+        elapsed = time.perf_counter() - start
+        self.requests += 1
+        self.latencies.append(elapsed)
+        if session is not None:
+            session.requests += 1
+            session.latencies.append(elapsed)
+        if reply.startswith("error"):
+            self.errors += 1
+            if session is not None:
+                session.errors += 1
+        return reply
+
+    def cmd_ping(self, args):
+        return "ok"
+
+    def cmd_new(self, args):
+        if len(self.sessions) >= self.max_sessions:
+            raise ValueError("too many sessions")
+        cb = self.board_class.from_fen(" ".join(args)) if args else self.board_class()
+        session = Session(self.next_id, cb)
+        self.sessions[session.session_id] = session
+        self.next_id += 1
+        return "ok %d" % session.session_id
+
+    def cmd_moves(self, session, args):
+        return " ".join(["ok"] + list(session.moves()))
+
+    def cmd_move(self, session, args):
+        if not args:
+            raise ValueError("missing move")
+        if session.thinking:
+            raise ValueError("engine is thinking")
+        if session.result() is not None:
+            raise ValueError("game over")
+        move = session.moves().get(args[0].lower())
+        if move is None:
+            raise ValueError("illegal move %s" % args[0])
+        session.make_move(move)
+        return self.move_reply(session, "ok %s" % args[0].lower())
+
+    """
+    Adds the result and reason to the reply of a move that ended the game.
+    """
+    def move_reply(self, session, reply):
+        result = session.result()
+        if result is None:
+            return reply
+        return "%s %s %s" % ((reply,) + result)
+
+    def cmd_undo(self, session, args):
+        if session.thinking:
+            raise ValueError("engine is thinking")
+        if not session.cb.moveLog:
+            raise ValueError("no move to undo")
+        session.undo_move()
+        return "ok"
+
+    def cmd_fen(self, session, args):
+        return "ok %s" % session.cb.to_fen()
+
+    def cmd_result(self, session, args):
+        result = session.result()
+        return "ok *" if result is None else "ok %s %s" % result
+
+    def cmd_close(self, session, args):
+        del self.sessions[session.session_id]
+        return "ok"
+
+    def cmd_stats(self, args):
+        if args:
+            session = self.session(args)
+            requests, errors, samples = session.requests, session.errors, session.latencies
+        else:
+            requests, errors, samples = self.requests, self.errors, self.latencies
+        return "ok requests %d errors %d mean %.1f p50 %.1f p99 %.1f max %.1f" % (
+            (requests, errors) + latency_summary(samples))
+
+    async def cmd_go(self, session, args):
+        if session.thinking:
+            raise ValueError("engine is thinking")
+        limits = {}
+        for name, value in zip(args[::2], args[1::2]):
+            if name not in ('depth', 'movetime', 'nodes'):
+                raise ValueError("unknown limit %s" % name)
+            limits[name] = float(value) if name == 'movetime' else int(value)
+        if not limits:
+            limits['depth'] = DEFAULT_DEPTH
+        if session.result() is not None:
+            raise ValueError("game over")
+        if self.pool is None:
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.engine_workers, initializer=_init_engine,
+                                                               initargs=(self.backend, self.hash_mb))
+        pool = self.pool
+        session.thinking = True
+        try:
+            text, score, depth, nodes = await asyncio.get_running_loop().run_in_executor(
+                pool, _engine_search, session.cb.snapshot(), limits)
+        except concurrent.futures.process.BrokenProcessPool:
+            #an engine process died; searches still queued fail too, the next `go` starts a new pool.
+            if self.pool is pool:
+                self.pool = None
+                pool.shutdown(wait=False, cancel_futures=True)
+            raise ValueError("engine process failed, try again")
+        finally:
+            session.thinking = False
+        if text is None:
+            raise ValueError("no legal move")
+        session.make_move(session.moves()[text])
+        return self.move_reply(session, "ok %s score %d depth %d nodes %d" % (text, score, depth, nodes))
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await read_request(reader)
+                except ValueError as e:
+                    self.requests += 1
+                    self.errors += 1
+                    writer.write(("error %s\n" % e).encode('utf-8'))
+                    continue
+                if not line:
+                    break
+                line = line.decode('utf-8', 'replace').strip()
+                if line.lower() == 'quit':
+                    writer.write(b"ok\n")
+                    break
+                reply = await self.execute(line)
+                writer.write(reply.encode('utf-8') + b"\n")
+                #pipelined requests are answered without a round trip per reply.
+                if writer.transport.get_write_buffer_size() > WRITE_BUFFER:
+                    await writer.drain()
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    """
+    Starts listening and returns the asyncio.Server; port 0 picks a free port.
+    """
+    async def serve(self, host='127.0.0.1', port=7000):
+        return await asyncio.start_server(self.handle_client, host, port, limit=1 << 16)
+
+
+"""
+Reads one request line like StreamReader.readline, b"" at EOF. A line longer than the stream
+limit is read to its end and dropped, then reported with ValueError, so the request after it
+still starts on a line of its own.
+"""
+async def read_request(reader):
+    too_long = False
+    while True:
+        try:
+            line = await reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            return b"" if too_long else e.partial
+        except asyncio.LimitOverrunError as e:
+            await reader.readexactly(e.consumed)
+            too_long = True
+            continue
+        if too_long:
+            raise ValueError("request line too long")
+        return line
+
+
+class LineClient(object):
+    def __init__(self, reader, writer):
+        """ Client side of the line protocol, a stand-in for real clients in tests and benchmarks.
+            Use LineClient.connect to create one.
+        """
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=7000):
+        reader, writer = await asyncio.open_connection(host, port, limit=1 << 16)
+        return cls(reader, writer)
+
+    """
+    Sends one request and returns its reply.
+    """
+    async def request(self, line):
+        return (await self.pipeline([line]))[0]
+
+    """
+    Sends all requests at once and returns their replies in order.
+    """
+    async def pipeline(self, lines):
+        self.writer.write(("\n".join(lines) + "\n").encode('utf-8'))
+        await self.writer.drain()
+        return [(await self.reader.readline()).decode('utf-8').rstrip("\n") for _ in lines]
+
+    async def close(self):
+        try:
+            await self.request("quit")
+        finally:
+            self.writer.close()
+
+"""
+Plays random games on `sessions` sessions spread over `connections` client connections, each
+connection pipelining one request per session at a time. Returns (move requests, seconds).
+"""
+async def bench(host, port, sessions, plies, connections, seed=1):
+    rng = random.Random(seed)
+    clients = [await LineClient.connect(host, port) for _ in range(connections)]
+
+    async def play(client, count):
+        ids = [reply.split()[1] for reply in await client.pipeline(["new"] * count)]
+        playing = ids
+        made = 0
+        for _ in range(plies):
+            if not playing:
+                break
+            replies = await client.pipeline(["moves %s" % i for i in playing])
+            requests = ["move %s %s" % (i, rng.choice(reply.split()[1:])) for i, reply in zip(playing, replies)]
+            replies = await client.pipeline(requests)
+            for reply in replies:
+                if not reply.startswith("ok"):
+                    raise RuntimeError(reply)
+            made += len(requests)
+            #a result after the move: the game is over.
+            playing = [i for i, reply in zip(playing, replies) if len(reply.split()) == 2]
+        await client.pipeline(["close %s" % i for i in ids])
+        return made
+
+    start = time.perf_counter()
+    share = [sessions // connections + (1 if i < sessions % connections else 0) for i in range(connections)]
+    made = await asyncio.gather(*[play(client, n) for client, n in zip(clients, share) if n])
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        await client.close()
+    return sum(made), elapsed
+
+async def _run_bench(args):
+    game_server = GameServer(args.engine_workers, args.hash, backend=args.backend)
+    server = await game_server.serve(args.host, 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        moves, elapsed = await bench(args.host, port, args.sessions, args.plies, args.connections)
+        client = await LineClient.connect(args.host, port)
+        stats = await client.request("stats")
+        engine = await client.request("new")
+        engine = await client.request("go %s depth 3" % engine.split()[1])
+        await client.close()
+    game_server.close()
+    #moves and their `moves` requests.
+    print("%d sessions %d moves in %.2fs: %.0f moves/s %.0f requests/s" %
+          (args.sessions, moves, elapsed, moves / elapsed, 2 * moves / elapsed))
+    print("server %s" % stats)
+    print("engine move %s" % engine)
+
+async def _run_server(args):
+    game_server = GameServer(args.engine_workers, args.hash, backend=args.backend)
+    server = await game_server.serve(args.host, args.port)
+    print("listening on %s:%d" % (args.host, args.port), file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        game_server.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Line protocol game server.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7000)
+    parser.add_argument('--engine-workers', type=int, default=None, help="engine processes, default one per core")
+    parser.add_argument('--hash', type=int, default=16, help="transposition table size in MB per engine process")
+    parser.add_argument('--backend', choices=['list', 'bitboard'], default='list')
+    parser.add_argument('--bench', action='store_true', help="run a local load test instead of serving")
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--plies', type=int, default=40)
+    parser.add_argument('--connections', type=int, default=8)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_run_bench(args) if args.bench else _run_server(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
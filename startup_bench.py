@@ -0,0 +1,101 @@
+import argparse
+import subprocess
+import sys
+import time
+
+from perft import write_report
+
+"""
+Start-up cost of worker processes: for each import target, a fresh interpreter is started
+`rounds` times and the wall time of the whole process, the time spent in the import and the
+peak resident memory are recorded.
+"""
+TARGETS = [
+    ('interpreter', ''),
+    ('chess_board', 'import chess_board'),
+    ('chess_cli', 'import chess_cli'),
+    ('bitboard', 'import bitboard'),
+    ('search', 'import search'),
+    ('uci', 'import uci'),
+    ('engine_worker', 'import engine_worker'),
+    ('chess_engine', 'import chess_engine'),
+    ('chess_engine+pygame', 'import chess_engine; chess_engine.load_pygame()'),
+]
+
+CHILD = """
+import resource, sys, time
+start = time.perf_counter()
+exec(sys.argv[1])
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+"""
+Runs one target in a new interpreter and returns (process seconds, import seconds, max RSS in KB),
+or None when the import fails, e.g. pygame isn't installed.
+"""
+def measure(code):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', CHILD, code], capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        return None
+    imported, rss = proc.stdout.split()
+    return wall, float(imported), int(rss)
+
+def bench_target(name, code, rounds):
+    samples = []
+    for _ in range(rounds):
+        sample = measure(code)
+        if sample is None:
+            return None
+        samples.append(sample)
+    walls = sorted(s[0] for s in samples)
+    mean = sum(walls) / len(walls)
+    return {
+        'name': 'startup[%s]' % name,
+        'fullname': 'startup_bench.py::startup[%s]' % name,
+        'group': 'startup',
+        'params': {'target': name},
+        'stats': {
+            'min': walls[0],
+            'max': walls[-1],
+            'mean': mean,
+            'median': walls[len(walls)//2],
+            'rounds': rounds,
+            'iterations': 1,
+            'total': sum(walls),
+            'ops': 1 / mean if mean else 0.0,
+        },
+        'extra_info': {
+            'code': code,
+            'import_seconds': min(s[1] for s in samples),
+            'max_rss_kb': max(s[2] for s in samples),
+        },
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process start-up time and memory per import target.")
+    parser.add_argument('--rounds', type=int, default=5, help="processes started per target")
+    parser.add_argument('--target', action='append', help="target name, may be repeated")
+    parser.add_argument('--json', help="write a pytest-benchmark style report to this file")
+    args = parser.parse_args(argv)
+
+    benchmarks = []
+    for name, code in TARGETS:
+        if args.target and name not in args.target:
+            continue
+        b = bench_target(name, code, args.rounds)
+        if b is None:
+            print("%-20s unavailable" % name)
+            continue
+        benchmarks.append(b)
+        print("%-20s process %7.1f ms  import %7.1f ms  max rss %7d KB" %
+              (name, b['stats']['min']*1000, b['extra_info']['import_seconds']*1000, b['extra_info']['max_rss_kb']))
+
+    if args.json:
+        write_report(args.json, benchmarks)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,25 @@
+import pytest
+
+from chess_cli import board_class
+from pgn import san, parse_san
+
+CASTLING_FEN = 'r3k2r/pppppppp/8/8/8/8/PPPPPPPP/R3K2R w KQkq - 0 1'
+
+
+@pytest.mark.parametrize('backend', ['list', 'bitboard'])
+@pytest.mark.parametrize('fen', [CASTLING_FEN, CASTLING_FEN.replace(' w ', ' b ')])
+def test_castle_alias_round_trip(backend, fen):
+    cb = board_class(backend).from_fen(fen)
+    castles = [m for m in cb.get_valid_moves() if m.is_castle]
+    #one king-side and two queen-side aliases next to the two real castling moves.
+    assert len([m for m in castles if m.is_castle_alias]) == 3
+    for move in castles:
+        text = san(cb, move)
+        assert text == ('O-O' if move.endcol > move.startcol else 'O-O-O')
+        parsed = parse_san(cb, text)
+        cb.make_move(move)
+        key = cb.key
+        cb.undo_move()
+        cb.make_move(parsed)
+        assert cb.key == key
+        cb.undo_move()
@@ -0,0 +1,21 @@
+import pytest
+
+from chess_cli import board_class
+from search import Searcher, MATE
+
+
+@pytest.mark.parametrize('backend', ['list', 'bitboard'])
+def test_mate_beats_fifty_move_rule(backend):
+    #Ra8# is the hundredth ply without a capture or pawn move.
+    cb = board_class(backend).from_fen('7k/8/6K1/8/8/8/8/R7 w - - 99 80')
+    result = Searcher(hash_mb=1).search(cb, depth=3)
+    assert result.best_move.coordinate_notation() == 'a1a8'
+    assert result.score == MATE - 1
+
+
+@pytest.mark.parametrize('backend', ['list', 'bitboard'])
+def test_fifty_move_rule_draws(backend):
+    #without a mate on the hundredth ply the extra rook is worth nothing.
+    cb = board_class(backend).from_fen('8/8/4k3/8/8/2K5/8/R7 w - - 99 80')
+    result = Searcher(hash_mb=1).search(cb, depth=3)
+    assert result.score == 0
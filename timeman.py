@@ -0,0 +1,106 @@
+import time
+
+"""
+Time management for games on a clock. Each move gets two limits:
+    soft: iterative deepening doesn't start an iteration it can't expect to finish past this
+          point, and stretches it while the best move keeps changing between iterations
+    hard: the search is aborted mid-iteration and the last completed iteration is played
+The searcher checks the hard deadline every few hundred nodes and asks iteration_done after
+every completed depth.
+
+A pondering search starts without limits on the opponent's time. ponderhit() starts our clock;
+time spent pondering counts toward the soft target, since the tree built meanwhile is kept, while
+the hard limit only runs from ponderhit.
+"""
+
+#share of the remaining clock one move may use when the GUI doesn't say how many moves are left.
+DEFAULT_MOVES_TO_GO = 30
+#kept back from every clock so GUI and pipe latency never flag us.
+MOVE_OVERHEAD = 0.05
+#never think less than this, seconds.
+MIN_TIME = 0.01
+#the most one move may take of the remaining clock, and of its soft target.
+MAX_CLOCK_SHARE = 0.5
+MAX_STRETCH = 4.0
+#how much of the increment the soft target spends.
+INCREMENT_SHARE = 0.75
+#the next iteration usually takes longer than all previous ones together, so none is started
+#after this share of the soft target.
+NEXT_ITERATION_SHARE = 0.5
+#best move changes are halved every iteration, so only recent instability stretches the target.
+INSTABILITY_DECAY = 0.5
+
+
+class TimeManager(object):
+    def __init__(self, soft, hard, ponder=False):
+        """ Time budget of one move, in seconds; see the module docstring.
+            - soft, hard: the soft target and the hard limit
+            - ponder: the search starts on the opponent's time, no limit applies until ponderhit()
+            - hard_deadline: perf_counter() time the search must stop at, None while pondering
+            - instability: recent best move changes, decayed every iteration
+        """
+        self.soft = soft
+        self.hard = hard
+        self.pondering = ponder
+        self.start_time = None
+        self.hard_deadline = None
+        self.instability = 0.0
+        self.best_move = None
+
+    """
+    Budget from the remaining clock and increment of the side to move, in seconds.
+    """
+    @classmethod
+    def from_clock(cls, remaining, increment=0.0, moves_to_go=None, overhead=MOVE_OVERHEAD, ponder=False):
+        moves_to_go = moves_to_go or DEFAULT_MOVES_TO_GO
+        usable = max(remaining - overhead, MIN_TIME)
+        #with the last move before the time control we may use most of what is left.
+        limit = usable * (1.0 if moves_to_go == 1 else MAX_CLOCK_SHARE)
+        soft = max(min(usable / moves_to_go + increment * INCREMENT_SHARE, limit), MIN_TIME)
+        hard = max(min(soft * MAX_STRETCH, limit), soft)
+        return cls(soft, hard, ponder)
+
+    """
+    A fixed time per move, all of which is used.
+    """
+    @classmethod
+    def fixed(cls, seconds, ponder=False):
+        return cls(seconds, seconds, ponder)
+
+    """
+    Called by the searcher when the search starts, with its perf_counter() start time.
+    """
+    def start(self, now=None):
+        self.start_time = time.perf_counter() if now is None else now
+        self.instability = 0.0
+        self.best_move = None
+        if not self.pondering:
+            self.hard_deadline = self.start_time + self.hard
+
+    """
+    The opponent played the pondered move, from now on our clock runs. Called from another
+    thread than the search; the search reads hard_deadline on its next check.
+    """
+    def ponderhit(self):
+        now = time.perf_counter()
+        self.pondering = False
+        if self.start_time is not None and now - self.start_time >= self.soft:
+            #pondering already went deeper than this move's budget buys.
+            self.hard_deadline = now
+        else:
+            self.hard_deadline = now + self.hard
+
+    """
+    Called after every completed iteration with its best move; True when no further iteration
+    should start.
+    """
+    def iteration_done(self, best_move):
+        self.instability *= INSTABILITY_DECAY
+        if self.best_move is not None and best_move != self.best_move:
+            self.instability += 1.0
+        self.best_move = best_move
+        if self.pondering or self.soft >= self.hard:
+            #a fixed time per move is all spent, the hard deadline ends the search.
+            return False
+        target = min(self.soft * (1.0 + self.instability), self.hard)
+        return time.perf_counter() - self.start_time >= target * NEXT_ITERATION_SHARE
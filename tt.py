@@ -0,0 +1,206 @@
+from array import array
+from multiprocessing import shared_memory
+
+"""
+Fixed-size transposition table keyed by ChessBoard.key.
+
+Entries live in one preallocated flat array of 64-bit words, so memory use is set once by the
+size in MB and never grows. Each entry is two words, the Zobrist key XORed with the data word,
+and the packed data word itself:
+    bits 0-24   best move in the packed Move format (0 when there is none)
+    bits 25-26  bound type
+    bits 27-34  depth
+    bits 35-55  score + SCORE_OFFSET
+    bits 56-63  search generation
+Entries are grouped in buckets of two: the first slot keeps the deepest result (depth-preferred),
+the second takes whatever didn't fit in the first (always-replace).
+
+Storing key ^ data means an entry only matches when both words were written together, so
+processes sharing a SharedTranspositionTable need no locks: an entry torn by two concurrent
+writers fails the check and reads as a miss. A data word of 0 marks an empty slot.
+"""
+
+EXACT, LOWER, UPPER = 1, 2, 3
+
+ENTRY_WORDS = 2
+BUCKET_ENTRIES = 2
+BUCKET_BYTES = 8*ENTRY_WORDS*BUCKET_ENTRIES
+
+MOVE_MASK = (1 << 25) - 1
+BOUND_SHIFT = 25
+DEPTH_SHIFT = 27
+SCORE_SHIFT = 35
+SCORE_OFFSET = 1 << 20
+GENERATION_SHIFT = 56
+
+"""
+Largest power-of-two number of buckets that fits in `mb` megabytes, at least one.
+"""
+def bucket_count(mb):
+    buckets = 1
+    while buckets*2*BUCKET_BYTES <= mb*1024*1024:
+        buckets *= 2
+    return buckets
+
+
+class TranspositionTable(object):
+    def __init__(self, mb=16):
+        """ Transposition table using at most `mb` megabytes.
+            The number of buckets is the largest power of two that fits, so a key picks its
+            bucket with a mask.
+        """
+        self.resize(mb)
+
+    def resize(self, mb):
+        self.buckets = bucket_count(mb)
+        self.mask = self.buckets - 1
+        self.table = array('Q', bytes(self.buckets*BUCKET_BYTES))
+        self.generation = 0
+        self.reset_stats()
+
+    def clear(self):
+        self.table = array('Q', bytes(self.buckets*BUCKET_BYTES))
+        self.generation = 0
+
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+        self.collisions = 0
+        self.stores = 0
+        self.replacements = 0
+
+    """
+    Bytes allocated for entries.
+    """
+    @property
+    def size_bytes(self):
+        return self.table.itemsize*len(self.table)
+
+    """
+    Marks the start of a new search, so entries of earlier searches are replaced first.
+    """
+    def new_search(self):
+        self.generation = (self.generation + 1) & 0xFF
+
+    """
+    Returns (move, score, depth, bound) stored for key, or None. move is a packed move or 0.
+    """
+    def probe(self, key):
+        self.probes += 1
+        table = self.table
+        i = (key & self.mask)*BUCKET_ENTRIES*ENTRY_WORDS
+        for slot in (i, i + ENTRY_WORDS):
+            data = table[slot + 1]
+            if data and table[slot] ^ data == key:
+                self.hits += 1
+                return (data & MOVE_MASK, ((data >> SCORE_SHIFT) & 0x1FFFFF) - SCORE_OFFSET,
+                        (data >> DEPTH_SHIFT) & 0xFF, (data >> BOUND_SHIFT) & 3)
+        if table[i + 1] or table[i + ENTRY_WORDS + 1]:
+            self.collisions += 1
+        return None
+
+    """
+    Stores a search result. An empty move keeps the move already stored for the same key.
+    """
+    def store(self, key, move, score, depth, bound):
+        table = self.table
+        i = (key & self.mask)*BUCKET_ENTRIES*ENTRY_WORDS
+        generation = self.generation
+        old = table[i + 1]
+        if old and table[i] ^ old == key:
+            slot = i
+        elif table[i + ENTRY_WORDS + 1] and table[i + ENTRY_WORDS] ^ table[i + ENTRY_WORDS + 1] == key:
+            slot = i + ENTRY_WORDS
+        else:
+            #depth-preferred slot: take it when empty, from an older search or not deeper than us.
+            if (not old or (old >> GENERATION_SHIFT) != generation or
+                    ((old >> DEPTH_SHIFT) & 0xFF) <= depth):
+                slot = i
+                if old:
+                    #move the displaced entry into the always-replace slot.
+                    table[i + ENTRY_WORDS] = table[i]
+                    table[i + ENTRY_WORDS + 1] = old
+            else:
+                slot = i + ENTRY_WORDS
+            if table[slot + 1]:
+                self.replacements += 1
+        if not move and table[slot + 1] and table[slot] ^ table[slot + 1] == key:
+            move = table[slot + 1] & MOVE_MASK
+        self.stores += 1
+        data = (move | bound << BOUND_SHIFT | min(max(depth, 0), 0xFF) << DEPTH_SHIFT |
+                (score + SCORE_OFFSET) << SCORE_SHIFT | generation << GENERATION_SHIFT)
+        table[slot] = key ^ data
+        table[slot + 1] = data
+
+    """
+    Permille of the first 1000 entries used by the current search, as UCI reports it.
+    """
+    def hashfull(self):
+        table = self.table
+        used = 0
+        entries = min(1000, self.buckets*BUCKET_ENTRIES)
+        for e in range(entries):
+            slot = e*ENTRY_WORDS
+            if table[slot + 1] and table[slot + 1] >> GENERATION_SHIFT == self.generation:
+                used += 1
+        return used*1000 // entries
+
+    def stats(self):
+        return {
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.probes if self.probes else 0.0,
+            'collisions': self.collisions,
+            'stores': self.stores,
+            'replacements': self.replacements,
+            'hashfull': self.hashfull(),
+            'size_bytes': self.size_bytes,
+        }
+
+
+class SharedTranspositionTable(TranspositionTable):
+    def __init__(self, mb=16, name=None):
+        """ TranspositionTable whose entries live in multiprocessing.shared_memory, so processes
+            searching the same position share their results (lazy SMP, see parallel.py).
+            - name: attach to the table another process created with this name instead of
+              creating a new one; only the creator unlinks the memory
+        """
+        self.buckets = bucket_count(mb)
+        self.mask = self.buckets - 1
+        size = self.buckets*BUCKET_BYTES
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+            self.shm.buf[:size] = bytes(size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.table = self.shm.buf[:size].cast('Q')
+        self.generation = 0
+        self.reset_stats()
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    """
+    The memory is shared with other processes by name, so its size is fixed when it is created.
+    """
+    def resize(self, mb):
+        raise ValueError("a shared table has a fixed size, create a new one")
+
+    def clear(self):
+        size = self.buckets*BUCKET_BYTES
+        self.shm.buf[:size] = bytes(size)
+        self.generation = 0
+
+    """
+    Detaches from the memory, and frees it when this process created it.
+    """
+    def close(self):
+        if self.table is not None:
+            self.table.release()
+            self.table = None
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
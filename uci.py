@@ -0,0 +1,288 @@
+import sys
+import threading
+import time
+
+from chess_cli import board_class, parse_move
+from search import Searcher, MATE, MATE_BOUND, MAX_PLY
+from timeman import TimeManager, MOVE_OVERHEAD
+
+"""
+UCI (Universal Chess Interface) driver, so tournament managers and scripts can run the engine:
+
+    python uci.py
+
+reads commands from stdin and answers on stdout. Searches run on a background thread, the
+reading thread only parses commands, so `stop` and `isready` are answered right away.
+"""
+
+ENGINE_NAME = "chess"
+ENGINE_AUTHOR = "Parth722"
+#seconds a `go ponder` without a clock, movetime, depth or nodes thinks after ponderhit.
+PONDERHIT_MOVETIME = 1.0
+
+"""
+UCI score field: centipawns, or moves to mate (negative when getting mated).
+"""
+def format_score(score):
+    if score >= MATE_BOUND:
+        return "mate %d" % ((MATE - score + 1) // 2)
+    if score <= -MATE_BOUND:
+        return "mate -%d" % ((MATE + score) // 2)
+    return "cp %d" % score
+
+
+class UciEngine(object):
+    def __init__(self, output=None, backend='bitboard'):
+        """ UCI protocol state.
+            - output: called with every line to send, by default printed to stdout
+            - board: the position set by the last `position` command
+            - searcher: Searcher, or parallel.ParallelSearcher when Threads > 1
+        """
+        self.output = output or self.print_line
+        self.output_lock = threading.Lock()
+        self.backend = backend
+        self.board = board_class(backend)()
+        self.hash_mb = 16
+        self.threads = 1
+        self.searcher = Searcher(hash_mb=self.hash_mb)
+        self.search_thread = None
+        #set when a `go infinite` or `go ponder` search may report its best move.
+        self.release = threading.Event()
+        self.pondering = False
+        #TimeManager of the running search, None without a clock.
+        self.time_manager = None
+        self.move_overhead = MOVE_OVERHEAD
+        #polyglot.PolyglotBook played from before searching, None without one.
+        self.book = None
+
+    @staticmethod
+    def print_line(line):
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+    def send(self, line):
+        with self.output_lock:
+            self.output(line)
+
+    """
+    Handles one command line; returns False after `quit`.
+    """
+    def handle(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send("id name %s" % ENGINE_NAME)
+            self.send("id author %s" % ENGINE_AUTHOR)
+            self.send("option name Hash type spin default 16 min 1 max 4096")
+            self.send("option name Threads type spin default 1 min 1 max 256")
+            self.send("option name Ponder type check default false")
+            self.send("option name Move Overhead type spin default %d min 0 max 5000" % (MOVE_OVERHEAD*1000))
+            self.send("option name BookFile type string default <empty>")
+            self.send("uciok")
+        elif command == 'isready':
+            self.send("readyok")
+        elif command == 'ucinewgame':
+            self.stop_search()
+            self.searcher.tt.clear()
+            self.board = board_class(self.backend)()
+        elif command == 'setoption':
+            self.stop_search()
+            self.set_option(args)
+        elif command == 'position':
+            self.stop_search()
+            self.set_position(args)
+        elif command == 'go':
+            self.stop_search()
+            self.go(args)
+        elif command == 'stop':
+            self.stop_search()
+        elif command == 'ponderhit':
+            self.ponderhit()
+        elif command == 'quit':
+            self.close()
+            return False
+        else:
+            self.send("info string unknown command %s" % command)
+        return True
+
+    """
+    Stops the search and frees the helper processes, shared table and book; safe to call twice.
+    """
+    def close(self):
+        self.stop_search()
+        if not isinstance(self.searcher, Searcher):
+            self.searcher.close()
+        self.set_book(None)
+
+    def set_option(self, args):
+        if 'name' not in args or 'value' not in args:
+            return
+        name = " ".join(args[args.index('name') + 1:args.index('value')]).lower()
+        value = " ".join(args[args.index('value') + 1:])
+        if name == 'move overhead':
+            self.move_overhead = max(int(value), 0) / 1000.0
+            return
+        if name == 'bookfile':
+            self.set_book(value)
+            return
+        if name == 'hash':
+            self.hash_mb = max(int(value), 1)
+        elif name == 'threads':
+            self.threads = max(int(value), 1)
+        else:
+            return
+        if not isinstance(self.searcher, Searcher):
+            self.searcher.close()
+        if self.threads > 1:
+            from parallel import ParallelSearcher
+            self.searcher = ParallelSearcher(self.threads, self.hash_mb, self.backend)
+        else:
+            self.searcher = Searcher(hash_mb=self.hash_mb)
+
+    def set_book(self, path):
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+        if path and path != '<empty>':
+            from polyglot import PolyglotBook
+            try:
+                self.book = PolyglotBook(path)
+            except (OSError, ValueError) as e:
+                self.send("info string %s" % e)
+
+    """
+    position startpos [moves ...] | position fen <fen> [moves ...]
+    """
+    def set_position(self, args):
+        if 'moves' in args:
+            i = args.index('moves')
+            setup, moves = args[:i], args[i + 1:]
+        else:
+            setup, moves = args, []
+        try:
+            if setup and setup[0] == 'fen':
+                cb = board_class(self.backend).from_fen(" ".join(setup[1:]))
+            else:
+                cb = board_class(self.backend)()
+            for text in moves:
+                cb.make_move(parse_move(cb, text))
+        except ValueError as e:
+            self.send("info string %s" % e)
+            return
+        self.board = cb
+
+    def go(self, args):
+        params = {}
+        flags = set()
+        i = 0
+        while i < len(args):
+            if args[i] in ('infinite', 'ponder'):
+                flags.add(args[i])
+                i += 1
+            elif args[i] == 'searchmoves':
+                #not supported, the moves after it are skipped.
+                break
+            elif i + 1 < len(args):
+                try:
+                    params[args[i]] = int(args[i + 1])
+                except ValueError:
+                    pass
+                i += 2
+            else:
+                i += 1
+
+        if self.book is not None and not flags:
+            move = self.book.weighted_choice(self.board)
+            if move is not None:
+                self.send("info string book move")
+                self.send("bestmove %s" % move.coordinate_notation())
+                return
+
+        depth = params.get('depth')
+        nodes = params.get('nodes')
+        movetime = None
+        time_manager = None
+        self.pondering = 'ponder' in flags
+        clock = 'wtime' if self.board.turn else 'btime'
+        if 'infinite' in flags:
+            depth = depth or MAX_PLY
+        elif 'movetime' in params:
+            movetime = params['movetime'] / 1000.0
+            if self.pondering:
+                time_manager = TimeManager.fixed(movetime, ponder=True)
+                movetime = None
+        elif clock in params:
+            time_manager = TimeManager.from_clock(params[clock] / 1000.0,
+                                                  params.get('winc' if self.board.turn else 'binc', 0) / 1000.0,
+                                                  params.get('movestogo'), self.move_overhead, self.pondering)
+        if self.pondering and time_manager is None and depth is None and nodes is None:
+            #otherwise nothing but `stop` would end the search after ponderhit.
+            time_manager = TimeManager.fixed(PONDERHIT_MOVETIME, ponder=True)
+        self.time_manager = time_manager
+        wait = 'infinite' in flags or self.pondering
+        self.release.clear()
+        self.search_thread = threading.Thread(target=self.run_search,
+                                              args=(self.board, depth, movetime, nodes, time_manager, wait))
+        self.search_thread.daemon = True
+        self.search_thread.start()
+
+    def run_search(self, cb, depth, movetime, nodes, time_manager, wait):
+        start = time.perf_counter()
+
+        def info(result):
+            elapsed = max(time.perf_counter() - start, 1e-6)
+            self.send("info depth %d score %s nodes %d nps %d time %d hashfull %d pv %s" % (
+                result.depth, format_score(result.score), result.stats.nodes, result.stats.nodes / elapsed,
+                elapsed*1000, self.searcher.tt.hashfull(), " ".join(m.coordinate_notation() for m in result.pv)))
+        result = self.searcher.search(cb, depth=depth, movetime=movetime, nodes=nodes, info=info,
+                                      time_manager=time_manager)
+        if wait:
+            #UCI: after `go infinite` or `go ponder`, bestmove only follows stop or ponderhit.
+            self.release.wait()
+        if result is None or result.best_move is None:
+            self.send("bestmove 0000")
+        elif len(result.pv) > 1:
+            self.send("bestmove %s ponder %s" % (result.best_move.coordinate_notation(),
+                                                 result.pv[1].coordinate_notation()))
+        else:
+            self.send("bestmove %s" % result.best_move.coordinate_notation())
+
+    """
+    Stops a running search and waits for its bestmove to be sent.
+    """
+    def stop_search(self):
+        if self.search_thread is not None:
+            self.release.set()
+            #a search that hasn't started yet would clear a single stop request.
+            while self.search_thread.is_alive():
+                self.searcher.stop()
+                self.search_thread.join(0.01)
+            self.search_thread = None
+            self.pondering = False
+
+    """
+    The opponent played the pondered move: the same search goes on, now on our own clock.
+    """
+    def ponderhit(self):
+        if self.search_thread is None or not self.pondering:
+            return
+        self.pondering = False
+        if self.time_manager is not None:
+            self.time_manager.ponderhit()
+        self.release.set()
+
+def main():
+    engine = UciEngine()
+    #also on EOF or an exception, or the helpers and their shared memory would outlive us.
+    try:
+        for line in sys.stdin:
+            if not engine.handle(line):
+                break
+    finally:
+        engine.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import random
+
+"""
+Zobrist hashing keys: one random 64-bit number per piece and square, castling rights combination,
+en-passant file and side to move. A position's key is the XOR of the numbers of everything on it,
+so a move updates it by XOR-ing out what changed instead of rehashing the board.
+"""
+
+#fixed seed, so keys (and anything stored with them) are the same in every process.
+_random = random.Random(0x5EED)
+
+def _key():
+    return _random.getrandbits(64)
+
+PIECES = ['wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK']
+
+#PIECE_KEYS[piece][row*8 + col]
+PIECE_KEYS = dict((piece, [_key() for _ in range(64)]) for piece in PIECES)
+#black to move.
+SIDE_KEY = _key()
+#EN_PASSANT_KEYS[col] of the en-passant square.
+EN_PASSANT_KEYS = [_key() for _ in range(8)]
+_CASTLING_BITS = [_key() for _ in range(4)]
+#CASTLING_KEYS[castling_index(rights)], the XOR of the keys of every right held.
+CASTLING_KEYS = [0]*16
+for index in range(16):
+    for bit in range(4):
+        if index & (1 << bit):
+            CASTLING_KEYS[index] ^= _CASTLING_BITS[bit]
+
+"""
+Packs CastlingRights into a 4-bit index: wks, wqs, bks, bqs from the lowest bit up.
+"""
+def castling_index(rights):
+    return rights.wks | rights.wqs << 1 | rights.bks << 2 | rights.bqs << 3